@@ -1,4 +1,5 @@
 import os
+import threading
 from datetime import timedelta
 from flask import Flask, g
 from flask_wtf.csrf import CSRFProtect
@@ -55,6 +56,7 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # Performance: Simple in-memory cache for sidebar classes (5-minute TTL)
 sidebar_cache = TTLCache(maxsize=1000, ttl=300)
+sidebar_cache_lock = threading.Lock()  # Workers run threaded (see Procfile)
 
 # Initialize database
 init_db()
@@ -77,6 +79,7 @@ from app.blueprints.notifications import notifications
 from app.blueprints.billing import billing
 from app.blueprints.referrals import referrals
 from app.blueprints.institutional import institutional
+from app.services.ai_service import warm_token_encoding
 
 app.register_blueprint(auth, url_prefix='/auth')
 app.register_blueprint(admin)
@@ -103,6 +106,9 @@ csrf.exempt(notes.name + '.beacon_save_note')
 # Exempt Stripe webhook from CSRF (validated via Stripe signature)
 csrf.exempt(billing.name + '.webhook')
 
+# Load the tokenizer used to budget AI prompts before the first request needs it
+warm_token_encoding()
+
 from . import routes
 
 # Setup database connection teardown
@@ -160,8 +166,10 @@ def inject_sidebar_classes():
         cache_key = f"sidebar_{user_id}"
 
         # Check cache first
-        if cache_key in sidebar_cache:
-            return {'sidebar_classes': sidebar_cache[cache_key]}
+        with sidebar_cache_lock:
+            cached = sidebar_cache.get(cache_key)
+        if cached is not None:
+            return {'sidebar_classes': cached}
 
         db = get_db()
         cursor = db.execute(
@@ -171,7 +179,8 @@ def inject_sidebar_classes():
         sidebar_classes = cursor.fetchall()
 
         # Cache the result
-        sidebar_cache[cache_key] = sidebar_classes
+        with sidebar_cache_lock:
+            sidebar_cache[cache_key] = sidebar_classes
         return {'sidebar_classes': sidebar_classes}
     except Exception:
         return {'sidebar_classes': []}
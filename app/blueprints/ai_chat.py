@@ -1,15 +1,23 @@
 """AI Chat Blueprint - AI Tutor Chat Widget API."""
 
 import re
+import threading
 from flask import Blueprint, request, jsonify, session
+from cachetools import TTLCache
 from app.db_connect import get_db
-from app.services.ai_service import chat_with_tutor
+from app.services.ai_service import chat_with_tutor, prepare_context_note, CONTEXT_NOTE_LIMIT
 from app.services.ai_usage import ai_rate_limit, log_ai_usage
+from app.services.ai_pipeline import get_cached_summaries
 from app.blueprints.auth import login_required
 from app import limiter
 
 ai_chat = Blueprint('ai_chat', __name__)
 
+# Prepared note context per (chat session, class), reused across turns while
+# the class's notes are unchanged (1-hour TTL)
+tutor_context_cache = TTLCache(maxsize=1000, ttl=3600)
+tutor_context_cache_lock = threading.Lock()
+
 
 def get_or_create_session(user_id):
     """Get the user's single chat session, creating one if it doesn't exist."""
@@ -34,6 +42,65 @@ def get_or_create_session(user_id):
     return cursor.lastrowid
 
 
+def get_tutor_context(session_id, class_id):
+    """
+    Get truncated, fingerprinted notes for tutor context, preparing them once.
+
+    The most recently updated note is kept in full (up to the context limit);
+    older notes are replaced by their cached summaries to keep the prompt small.
+    A chat turn never summarizes: notes without a cached summary (filled by the
+    metered summarize, study guide and flashcard routes) go in as truncated
+    raw text. Only note ids and timestamps are read on each turn; note content
+    is re-fetched and re-prepared when the class's recent notes change.
+    """
+    db = get_db()
+
+    cursor = db.execute('''
+        SELECT id, updated_at FROM notes
+        WHERE class_id = %s
+        ORDER BY updated_at DESC
+        LIMIT %s
+    ''', (class_id, CONTEXT_NOTE_LIMIT))
+    fingerprint = tuple((row['id'], row['updated_at']) for row in cursor.fetchall())
+
+    if not fingerprint:
+        return None
+
+    cache_key = (session_id, class_id)
+    with tutor_context_cache_lock:
+        cached = tutor_context_cache.get(cache_key)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+
+    note_ids = [note_id for note_id, _ in fingerprint]
+    placeholders = ','.join(['%s' for _ in note_ids])
+    cursor = db.execute(f'''
+        SELECT id, title, content FROM notes WHERE id IN ({placeholders})
+    ''', note_ids)
+    notes_by_id = {row['id']: row for row in cursor.fetchall()}
+
+    notes = []
+    for note_id in note_ids:
+        note = notes_by_id.get(note_id)
+        if note:
+            # Strip HTML from content
+            notes.append((note_id, note['title'], re.sub(r'<[^>]+>', '', note['content'] or '').strip()))
+
+    # Most recent note at full length; older notes as cached summaries,
+    # falling back to truncated raw text on a cache miss
+    context_notes = [prepare_context_note(title, content) for _, title, content in notes[:1]]
+    older = [(note_id, title, content) for note_id, title, content in notes[1:] if content]
+    summaries = get_cached_summaries([(note_id, content) for note_id, _, content in older])
+    context_notes.extend(
+        prepare_context_note(title, summary or content)
+        for (_, title, content), summary in zip(older, summaries)
+    )
+
+    with tutor_context_cache_lock:
+        tutor_context_cache[cache_key] = (fingerprint, context_notes)
+    return context_notes
+
+
 @ai_chat.route('/classes')
 @login_required
 def get_classes():
@@ -121,22 +188,7 @@ def send_message():
             class_name = class_data['name']
 
             # Get notes from this class for context
-            cursor = db.execute('''
-                SELECT title, content FROM notes
-                WHERE class_id = %s
-                ORDER BY updated_at DESC
-                LIMIT 5
-            ''', (class_id,))
-            notes = cursor.fetchall()
-
-            if notes:
-                context_notes = []
-                for note in notes:
-                    note_dict = dict(note)
-                    # Strip HTML from content
-                    if note_dict.get('content'):
-                        note_dict['content'] = re.sub(r'<[^>]+>', '', note_dict['content'])[:2000]
-                    context_notes.append(note_dict)
+            context_notes = get_tutor_context(session_id, class_data['id'])
 
     try:
         # Get AI response
@@ -3,6 +3,7 @@
 from flask import Blueprint, render_template, jsonify, session, request
 from app.db_connect import get_db
 from app.blueprints.auth import login_required
+from app.services.streak_service import invalidate_user_streak
 from datetime import datetime, timedelta
 
 analytics = Blueprint('analytics', __name__)
@@ -368,18 +369,17 @@ def get_user_streak(db, user_id):
 
 def update_user_streak(db, user_id):
     """Update user's streak based on activity."""
-    today = datetime.now().date().isoformat()
-    yesterday = (datetime.now().date() - timedelta(days=1)).isoformat()
+    today = datetime.now().date()
 
     # Check if there was activity today
     cursor = db.execute('''
         SELECT COUNT(*) as count FROM (
-            SELECT created_at FROM study_sessions WHERE user_id = %s AND DATE(created_at) = CURDATE()
+            SELECT created_at FROM study_sessions WHERE user_id = %s AND created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY
             UNION ALL
-            SELECT completed_at FROM quiz_attempts WHERE user_id = %s AND DATE(completed_at) = CURDATE()
+            SELECT completed_at FROM quiz_attempts WHERE user_id = %s AND completed_at >= CURDATE() AND completed_at < CURDATE() + INTERVAL 1 DAY
             UNION ALL
-            SELECT completed_at FROM pomodoro_sessions WHERE user_id = %s AND completed = 1 AND DATE(completed_at) = CURDATE()
-        )
+            SELECT completed_at FROM pomodoro_sessions WHERE user_id = %s AND completed = 1 AND completed_at >= CURDATE() AND completed_at < CURDATE() + INTERVAL 1 DAY
+        ) activity
     ''', (user_id, user_id, user_id))
     has_activity_today = cursor.fetchone()['count'] > 0
 
@@ -398,9 +398,12 @@ def update_user_streak(db, user_id):
         current = streak['current_streak']
         longest = streak['longest_streak']
 
-        if last_date == today:
+        # Whole days since the last study day (None if never studied)
+        days_since = (today - last_date).days if last_date else None
+
+        if days_since == 0:
             return  # Already updated today
-        elif last_date == yesterday:
+        elif days_since == 1:
             current += 1
         else:
             current = 1  # Streak broken, start new
@@ -419,6 +422,7 @@ def update_user_streak(db, user_id):
         ''', (user_id, today))
 
     db.commit()
+    invalidate_user_streak(user_id)
 
 
 def get_user_goals(db, user_id):
@@ -438,26 +442,26 @@ def get_user_goals(db, user_id):
         if goal_type == 'daily_minutes':
             cursor2 = db.execute('''
                 SELECT COALESCE(SUM(duration), 0) as total FROM study_sessions
-                WHERE user_id = %s AND DATE(created_at) = CURDATE()
+                WHERE user_id = %s AND created_at >= CURDATE() AND created_at < CURDATE() + INTERVAL 1 DAY
             ''', (user_id,))
             current = cursor2.fetchone()['total']
         elif goal_type == 'weekly_quizzes':
             cursor2 = db.execute('''
                 SELECT COUNT(*) as count FROM quiz_attempts
-                WHERE user_id = %s AND DATE(completed_at) >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
+                WHERE user_id = %s AND completed_at >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
             ''', (user_id,))
             current = cursor2.fetchone()['count']
         elif goal_type == 'cards_reviewed':
             cursor2 = db.execute('''
                 SELECT COUNT(*) as count FROM flashcards f
                 JOIN flashcard_decks d ON f.deck_id = d.id
-                WHERE d.user_id = %s AND DATE(f.last_reviewed) = DATE('now')
+                WHERE d.user_id = %s AND f.last_reviewed >= CURDATE() AND f.last_reviewed < CURDATE() + INTERVAL 1 DAY
             ''', (user_id,))
             current = cursor2.fetchone()['count']
         elif goal_type == 'pomodoro_sessions':
             cursor2 = db.execute('''
                 SELECT COUNT(*) as count FROM pomodoro_sessions
-                WHERE user_id = %s AND completed = 1 AND DATE(completed_at) = CURDATE()
+                WHERE user_id = %s AND completed = 1 AND completed_at >= CURDATE() AND completed_at < CURDATE() + INTERVAL 1 DAY
                 AND session_type = 'work'
             ''', (user_id,))
             current = cursor2.fetchone()['count']
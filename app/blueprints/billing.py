@@ -4,6 +4,7 @@ import os
 import stripe
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, current_app
 from app.db_connect import get_db
+from app.services.ai_usage import invalidate_user_tier
 from app.blueprints.auth import login_required
 
 billing = Blueprint('billing', __name__)
@@ -194,6 +195,7 @@ def success():
                     WHERE user_id = %s
                 ''', (plan, checkout_session.subscription, user_id))
                 db.commit()
+                invalidate_user_tier(user_id)
 
                 flash('Welcome to Klass Pro! Your subscription is now active.', 'success')
         except stripe.error.StripeError:
@@ -306,6 +308,7 @@ def handle_checkout_completed(session_data):
         WHERE user_id = %s
     ''', (plan, session_data.get('subscription'), user_id))
     db.commit()
+    invalidate_user_tier(user_id)
 
 
 def handle_subscription_updated(subscription):
@@ -340,12 +343,22 @@ def handle_subscription_updated(subscription):
         subscription['id']
     ))
     db.commit()
+    invalidate_user_tier(row['user_id'])
 
 
 def handle_subscription_deleted(subscription):
     """Handle subscription cancellation."""
     db = get_db()
 
+    # Find the user before the UPDATE clears the Stripe subscription ID
+    cursor = db.execute('''
+        SELECT user_id FROM subscriptions WHERE stripe_subscription_id = %s
+    ''', (subscription['id'],))
+    row = cursor.fetchone()
+
+    if not row:
+        return
+
     db.execute('''
         UPDATE subscriptions
         SET plan = 'free',
@@ -355,6 +368,7 @@ def handle_subscription_deleted(subscription):
         WHERE stripe_subscription_id = %s
     ''', (subscription['id'],))
     db.commit()
+    invalidate_user_tier(row['user_id'])
 
 
 def handle_invoice_paid(invoice):
@@ -417,3 +431,4 @@ def handle_payment_failed(invoice):
         WHERE user_id = %s
     ''', (row['user_id'],))
     db.commit()
+    invalidate_user_tier(row['user_id'])
@@ -6,7 +6,8 @@ from datetime import datetime, timedelta
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from app.db_connect import get_db
 from app.services.ai_service import generate_flashcards as ai_generate_flashcards
-from app.services.streak_service import update_streak
+from app.services.ai_pipeline import build_summarized_content
+from app.services.streak_service import record_study_session, update_streak
 from app.blueprints.auth import login_required
 
 flashcards = Blueprint('flashcards', __name__)
@@ -354,10 +355,7 @@ def review_card(card_id):
     ''', (card['deck_id'],))
     deck = cursor.fetchone()
     if deck:
-        db.execute('''
-            INSERT INTO study_sessions (user_id, class_id, activity_type, duration)
-            VALUES (%s, %s, 'flashcards', 1)
-        ''', (session['user_id'], deck['class_id']))
+        record_study_session(session['user_id'], deck['class_id'], 'flashcards', 1)
         db.commit()
 
     # Update user's study streak
@@ -497,6 +495,7 @@ def generate_from_all_notes(class_id):
     data = request.get_json()
     title = data.get('title', f"{class_data['name']} Flashcards")
     num_cards = data.get('num_cards', 15)
+    use_summaries = bool(data.get('use_summaries', False))
 
     # Get all notes for this class
     cursor = db.execute('''
@@ -528,7 +527,9 @@ def generate_from_all_notes(class_id):
         deck_id = cursor.lastrowid
 
         # Generate flashcards
-        cards = ai_generate_flashcards(combined_content, num_cards)
+        if use_summaries:
+            combined_content = build_summarized_content(notes)
+        cards = ai_generate_flashcards(combined_content, num_cards, from_summary=use_summaries)
 
         # Add cards to deck
         for card in cards:
@@ -1,9 +1,9 @@
 import re
-import base64
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from app.db_connect import get_db
-from app.services.ai_service import summarize_text, expand_text, cleanup_text, transform_text, generate_flashcards, chat_with_tutor, extract_image_info, sanitize_html
+from app.services.ai_service import expand_text, cleanup_text, transform_text, generate_flashcards, chat_with_tutor, prepare_context_note, extract_image_info, sanitize_html
 from app.services.ai_usage import ai_rate_limit, log_ai_usage
+from app.services.ai_pipeline import get_or_compute_summary
 from app.blueprints.auth import login_required
 
 notes = Blueprint('notes', __name__)
@@ -354,7 +354,7 @@ def summarize_note(note_id):
         return jsonify({'success': False, 'error': 'Note is empty. Add some content first.'}), 400
 
     try:
-        summary = summarize_text(clean_content)
+        summary = get_or_compute_summary(note_id, clean_content)
         return jsonify({'success': True, 'summary': summary})
     except ValueError as e:
         return jsonify({'success': False, 'error': str(e)}), 400
@@ -625,10 +625,9 @@ def ask_ai_about_note(note_id):
         clean_content = ''
 
     # Prepare note context
-    context_notes = [{
-        'title': note['title'] or 'Untitled Note',
-        'content': clean_content[:3000]
-    }] if clean_content else None
+    context_notes = [
+        prepare_context_note(note['title'] or 'Untitled Note', clean_content)
+    ] if clean_content else None
 
     try:
         response = chat_with_tutor(
@@ -672,6 +671,9 @@ def extract_from_image(note_id):
 
         if not image_data:
             return jsonify({'success': False, 'error': 'No image provided'}), 400
+
+        # Base64 is ~37% larger than the original image
+        max_size = 10 * 1024 * 1024 * 1.37
     elif 'image' in request.files:
         # Get from file upload
         file = request.files.get('image')
@@ -682,9 +684,9 @@ def extract_from_image(note_id):
             if ext not in allowed_extensions:
                 return jsonify({'success': False, 'error': 'Invalid image type. Allowed: PNG, JPG, GIF, WebP'}), 400
 
-            # Read and encode image
-            image_bytes = file.read()
-            image_data = base64.b64encode(image_bytes).decode('utf-8')
+            # Raw bytes; extract_image_info base64-encodes them once
+            image_data = file.read()
+            max_size = 10 * 1024 * 1024
             image_type = file.content_type or f'image/{ext}'
             extraction_type = request.form.get('extraction_type', 'text')
         else:
@@ -692,8 +694,8 @@ def extract_from_image(note_id):
     else:
         return jsonify({'success': False, 'error': 'No image provided'}), 400
 
-    # Validate image size (max 10MB - base64 is ~37% larger than original)
-    if len(image_data) > 10 * 1024 * 1024 * 1.37:
+    # Validate image size (max 10MB)
+    if len(image_data) > max_size:
         return jsonify({'success': False, 'error': 'Image too large. Maximum size is 10MB.'}), 400
 
     try:
@@ -763,11 +765,8 @@ def transcribe_audio_to_note(note_id):
         # Get optional language parameter
         language = request.form.get('language', None)
 
-        # Read file content
-        audio_bytes = file.read()
-
-        # Transcribe
-        result = transcribe_audio(audio_bytes, file.filename, language)
+        # Transcribe straight from the upload stream (verbose for the duration shown in the editor)
+        result = transcribe_audio(file.stream, file.filename, language, need_segments=True)
 
         return jsonify({
             'success': True,
@@ -1,5 +1,6 @@
 """Notifications Blueprint - In-app notification system."""
 
+from datetime import datetime
 from flask import Blueprint, render_template, request, jsonify, session
 from app.blueprints.auth import login_required
 from app.services.notification_service import (
@@ -38,9 +39,19 @@ def api_unread_count():
 @notifications.route('/recent')
 @login_required
 def api_recent():
-    """Get recent notifications for dropdown."""
+    """Get recent notifications for dropdown (older pages via before_created_at/before_id)."""
     user_id = session['user_id']
-    recent = get_notifications(user_id, limit=10)
+
+    before = None
+    before_created_at = request.args.get('before_created_at')
+    before_id = request.args.get('before_id', type=int)
+    if before_created_at and before_id:
+        try:
+            before = (datetime.fromisoformat(before_created_at), before_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid before_created_at'}), 400
+
+    recent = get_notifications(user_id, limit=10, before=before)
     unread_count = get_unread_count(user_id)
 
     # Convert to JSON-serializable format
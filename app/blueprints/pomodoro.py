@@ -3,7 +3,7 @@
 from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from app.db_connect import get_db
-from app.services.streak_service import update_streak
+from app.services.streak_service import record_study_session, update_streak
 from app.blueprints.auth import login_required
 
 pomodoro = Blueprint('pomodoro', __name__)
@@ -50,7 +50,7 @@ def timer():
                SUM(duration) as minutes_today
         FROM pomodoro_sessions
         WHERE user_id = %s AND completed = 1
-        AND DATE(completed_at) = CURDATE()
+        AND completed_at >= CURDATE() AND completed_at < CURDATE() + INTERVAL 1 DAY
         AND session_type = 'work'
     ''', (user_id,))
     today_stats = cursor.fetchone()
@@ -111,10 +111,7 @@ def complete_session(session_id):
     # If it was a work session, also log to study_sessions for analytics
     streak_info = None
     if pomo_session['session_type'] == 'work':
-        db.execute('''
-            INSERT INTO study_sessions (user_id, class_id, activity_type, duration)
-            VALUES (%s, %s, 'pomodoro', %s)
-        ''', (user_id, pomo_session['class_id'], pomo_session['duration']))
+        record_study_session(user_id, pomo_session['class_id'], 'pomodoro', pomo_session['duration'])
         # Update study streak for work sessions
         streak_info = update_streak(user_id)
 
@@ -181,7 +178,7 @@ def get_active():
     cursor = db.execute('''
         SELECT COUNT(*) as count FROM pomodoro_sessions
         WHERE user_id = %s AND completed = 1
-        AND DATE(completed_at) = CURDATE()
+        AND completed_at >= CURDATE() AND completed_at < CURDATE() + INTERVAL 1 DAY
         AND session_type = 'work'
     ''', (user_id,))
     today_sessions = cursor.fetchone()['count']
@@ -207,7 +204,7 @@ def get_stats():
                COALESCE(SUM(duration), 0) as minutes
         FROM pomodoro_sessions
         WHERE user_id = %s AND completed = 1
-        AND DATE(completed_at) = CURDATE()
+        AND completed_at >= CURDATE() AND completed_at < CURDATE() + INTERVAL 1 DAY
         AND session_type = 'work'
     ''', (user_id,))
     today = cursor.fetchone()
@@ -218,7 +215,7 @@ def get_stats():
                COALESCE(SUM(duration), 0) as minutes
         FROM pomodoro_sessions
         WHERE user_id = %s AND completed = 1
-        AND DATE(completed_at) >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
+        AND completed_at >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
         AND session_type = 'work'
     ''', (user_id,))
     week = cursor.fetchone()
@@ -240,7 +237,7 @@ def get_stats():
         FROM pomodoro_sessions p
         JOIN classes c ON p.class_id = c.id
         WHERE p.user_id = %s AND p.completed = 1
-        AND DATE(p.completed_at) >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
+        AND p.completed_at >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
         AND p.session_type = 'work'
         GROUP BY c.id
         ORDER BY minutes DESC
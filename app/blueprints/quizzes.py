@@ -1,11 +1,12 @@
 """Quizzes Blueprint - AI-generated quizzes from notes."""
 
 import re
-import json
+import orjson
+import asyncio
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from app.db_connect import get_db
-from app.services.ai_service import generate_quiz, grade_short_answer
-from app.services.streak_service import update_streak
+from app.services.ai_service import generate_quiz, grade_quiz
+from app.services.streak_service import record_study_session, update_streak
 from app.blueprints.auth import login_required
 
 quizzes = Blueprint('quizzes', __name__)
@@ -67,8 +68,8 @@ def view_quiz(quiz_id):
     questions = []
     if quiz.get('questions'):
         try:
-            questions = json.loads(quiz['questions'])
-        except json.JSONDecodeError:
+            questions = orjson.loads(quiz['questions'])
+        except orjson.JSONDecodeError:
             pass
 
     return render_template('quizzes/view.html', quiz=quiz, attempts=attempts, question_count=len(questions))
@@ -95,8 +96,8 @@ def take_quiz(quiz_id):
     questions = []
     if quiz.get('questions'):
         try:
-            questions = json.loads(quiz['questions'])
-        except json.JSONDecodeError:
+            questions = orjson.loads(quiz['questions'])
+        except orjson.JSONDecodeError:
             flash('Error loading quiz questions.', 'error')
             return redirect(url_for('quizzes.view_quiz', quiz_id=quiz_id))
 
@@ -127,8 +128,8 @@ def submit_quiz(quiz_id):
     questions = []
     if quiz.get('questions'):
         try:
-            questions = json.loads(quiz['questions'])
-        except json.JSONDecodeError:
+            questions = orjson.loads(quiz['questions'])
+        except orjson.JSONDecodeError:
             return jsonify({'success': False, 'error': 'Invalid quiz data'}), 400
 
     data = request.get_json()
@@ -144,6 +145,22 @@ def submit_quiz(quiz_id):
             # Still accept the submission but note it was over time
             time_taken = time_limit * 60  # Cap at the limit
 
+    # Grade all short answer questions concurrently up front
+    short_answer_ids = [
+        str(i) for i, question in enumerate(questions)
+        if question['type'] == 'short_answer'
+    ]
+    short_answer_grades = {}
+    if short_answer_ids:
+        try:
+            graded = asyncio.run(grade_quiz([
+                (questions[int(q_id)]['question'], questions[int(q_id)].get('correct_answer'), answers.get(q_id))
+                for q_id in short_answer_ids
+            ]))
+            short_answer_grades = dict(zip(short_answer_ids, graded))
+        except Exception:
+            pass  # Falls back to basic matching below
+
     # Grade the quiz
     score = 0
     results = []
@@ -161,20 +178,15 @@ def submit_quiz(quiz_id):
         elif question['type'] == 'true_false':
             is_correct = user_answer == correct_answer
         elif question['type'] == 'short_answer':
-            # Use AI grading for short answer questions
-            try:
-                grading_result = grade_short_answer(
-                    question['question'],
-                    correct_answer,
-                    user_answer
-                )
+            # None when the AI call failed for this answer
+            grading_result = short_answer_grades.get(q_id)
+            if grading_result is not None:
                 ai_score = grading_result.get('score', 0)
                 ai_feedback = grading_result.get('feedback', '')
                 is_correct = grading_result.get('is_correct', False)
-            except Exception:
+            elif user_answer and correct_answer:
                 # Fallback to basic matching if AI fails
-                if user_answer and correct_answer:
-                    is_correct = user_answer.lower().strip() in correct_answer.lower()
+                is_correct = user_answer.lower().strip() in correct_answer.lower()
 
         if is_correct:
             score += 1
@@ -201,14 +213,11 @@ def submit_quiz(quiz_id):
     cursor = db.execute('''
         INSERT INTO quiz_attempts (user_id, quiz_id, score, total, answers, time_taken)
         VALUES (%s, %s, %s, %s, %s, %s)
-    ''', (session['user_id'], quiz_id, score, len(questions), json.dumps(answers), time_taken))
+    ''', (session['user_id'], quiz_id, score, len(questions), orjson.dumps(answers).decode(), time_taken))
     db.commit()
 
     # Record study session for analytics and update streak
-    db.execute('''
-        INSERT INTO study_sessions (user_id, class_id, activity_type, duration)
-        VALUES (%s, %s, 'quiz', %s)
-    ''', (session['user_id'], quiz['class_id'], time_taken or 5))
+    record_study_session(session['user_id'], quiz['class_id'], 'quiz', time_taken or 5)
     db.commit()
 
     # Update user's study streak
@@ -285,7 +294,7 @@ def generate_quiz_page(class_id):
             cursor = db.execute('''
                 INSERT INTO quizzes (user_id, class_id, title, questions, time_limit)
                 VALUES (%s, %s, %s, %s, %s)
-            ''', (session['user_id'], class_id, title, json.dumps(questions), time_limit if time_limit > 0 else None))
+            ''', (session['user_id'], class_id, title, orjson.dumps(questions).decode(), time_limit if time_limit > 0 else None))
             db.commit()
 
             quiz_id = cursor.lastrowid
@@ -342,8 +351,8 @@ def review_attempt(attempt_id):
         flash('Attempt not found.', 'error')
         return redirect(url_for('quizzes.list_quizzes'))
 
-    questions = json.loads(attempt['questions']) if attempt.get('questions') else []
-    answers = json.loads(attempt['answers']) if attempt.get('answers') else {}
+    questions = orjson.loads(attempt['questions']) if attempt.get('questions') else []
+    answers = orjson.loads(attempt['answers']) if attempt.get('answers') else {}
 
     # Build results
     results = []
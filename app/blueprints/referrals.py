@@ -5,6 +5,7 @@ import string
 from datetime import datetime, timedelta
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from app.db_connect import get_db
+from app.services.ai_usage import invalidate_user_tier
 from app.blueprints.auth import login_required
 
 referrals = Blueprint('referrals', __name__)
@@ -92,6 +93,7 @@ def apply_referral_reward(user_id, days):
         ''', (new_end, user_id))
 
     db.commit()
+    invalidate_user_tier(user_id)
 
 
 def process_referral(referral_code, new_user_id):
@@ -2,7 +2,7 @@
 
 import os
 import secrets
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, Response, current_app, send_from_directory
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context, current_app, send_from_directory
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from app.db_connect import get_db
@@ -372,8 +372,9 @@ def export_flashcards():
 
     content, filename = export_flashcards_csv(db, user_id)
 
+    # Streamed as it is read; stream_with_context keeps the DB connection open
     return Response(
-        content,
+        stream_with_context(content),
         mimetype='text/csv',
         headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
@@ -388,8 +389,9 @@ def export_backup():
 
     content, filename = export_full_backup(db, user_id)
 
+    # Streamed as it is read; stream_with_context keeps the DB connection open
     return Response(
-        content,
+        stream_with_context(content),
         mimetype='application/json',
         headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
@@ -2,9 +2,12 @@
 
 import re
 import json
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
+import orjson
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context
 from app.db_connect import get_db
-from app.services.ai_service import generate_study_guide
+from app.services.ai_service import generate_study_guide, stream_study_guide, sanitize_html
+from app.services.ai_pipeline import build_summarized_content
+from app.services.ai_usage import ai_rate_limit
 from app.blueprints.auth import login_required
 
 study_guides = Blueprint('study_guides', __name__)
@@ -100,6 +103,7 @@ def generate_guide(class_id):
         title = request.form.get('title', f"Study Guide - {class_data['name']}")
         selected_notes = request.form.getlist('notes')
         focus_areas = request.form.get('focus_areas', '').strip()
+        use_summaries = request.form.get('use_summaries') == 'on'
 
         if not selected_notes:
             flash('Please select at least one note.', 'error')
@@ -126,7 +130,9 @@ def generate_guide(class_id):
         try:
             # Generate study guide
             focus_list = [f.strip() for f in focus_areas.split(',') if f.strip()] if focus_areas else None
-            content = generate_study_guide(combined_content, class_data['name'], focus_list)
+            if use_summaries:
+                combined_content = build_summarized_content(selected_notes_data)
+            content = generate_study_guide(combined_content, class_data['name'], focus_list, summarized=use_summaries)
 
             # Save to database
             cursor = db.execute('''
@@ -169,23 +175,21 @@ def delete_guide(guide_id):
     return redirect(url_for('study_guides.list_guides'))
 
 
-@study_guides.route('/api/generate', methods=['POST'])
-@login_required
-def api_generate_guide():
-    """API endpoint to generate study guide (AJAX)."""
-    db = get_db()
+def _load_api_guide_request(db, data):
+    """
+    Validate an API generate request and load the notes it references.
 
-    data = request.get_json()
+    Returns:
+        tuple: (error_response, request_dict); exactly one of them is None
+    """
     class_id = data.get('class_id')
     note_ids = data.get('note_ids', [])
-    title = data.get('title', 'Study Guide')
-    focus_areas = data.get('focus_areas', [])
 
     if not class_id:
-        return jsonify({'success': False, 'error': 'Class ID required'}), 400
+        return (jsonify({'success': False, 'error': 'Class ID required'}), 400), None
 
     if not note_ids:
-        return jsonify({'success': False, 'error': 'At least one note required'}), 400
+        return (jsonify({'success': False, 'error': 'At least one note required'}), 400), None
 
     # Get class info (verify belongs to user)
     cursor = db.execute(
@@ -194,7 +198,7 @@ def api_generate_guide():
     )
     class_data = cursor.fetchone()
     if not class_data:
-        return jsonify({'success': False, 'error': 'Class not found'}), 404
+        return (jsonify({'success': False, 'error': 'Class not found'}), 404), None
 
     # Get notes content
     placeholders = ','.join(['%s' for _ in note_ids])
@@ -211,15 +215,42 @@ def api_generate_guide():
             combined_content += f"\n\n## {note['title']}\n{clean_content}"
 
     if not combined_content.strip():
-        return jsonify({'success': False, 'error': 'Selected notes are empty'}), 400
+        return (jsonify({'success': False, 'error': 'Selected notes are empty'}), 400), None
+
+    return None, {
+        'class_id': class_id,
+        'class_name': class_data['name'],
+        'note_ids': note_ids,
+        'notes': notes,
+        'combined_content': combined_content,
+        'title': data.get('title', 'Study Guide'),
+        'focus_areas': data.get('focus_areas', []) or None,
+        'use_summaries': bool(data.get('use_summaries', False)),
+    }
+
+
+@study_guides.route('/api/generate', methods=['POST'])
+@login_required
+def api_generate_guide():
+    """API endpoint to generate study guide (AJAX)."""
+    db = get_db()
+
+    error, guide = _load_api_guide_request(db, request.get_json() or {})
+    if error:
+        return error
 
     try:
-        content = generate_study_guide(combined_content, class_data['name'], focus_areas if focus_areas else None)
+        combined_content = guide['combined_content']
+        if guide['use_summaries']:
+            combined_content = build_summarized_content(guide['notes'])
+        content = generate_study_guide(
+            combined_content, guide['class_name'], guide['focus_areas'], summarized=guide['use_summaries']
+        )
 
         cursor = db.execute('''
             INSERT INTO study_guides (user_id, class_id, title, content, source_notes)
             VALUES (%s, %s, %s, %s, %s)
-        ''', (session['user_id'], class_id, title, content, json.dumps(note_ids)))
+        ''', (session['user_id'], guide['class_id'], guide['title'], content, json.dumps(guide['note_ids'])))
         db.commit()
 
         return jsonify({
@@ -230,3 +261,55 @@ def api_generate_guide():
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@study_guides.route('/api/generate/stream', methods=['POST'])
+@login_required
+@ai_rate_limit('study_guide_stream', tokens_estimate=4000)
+def api_generate_guide_stream():
+    """
+    API endpoint to generate a study guide as Server-Sent Events.
+
+    Emits 'chunk' events with raw text as it is generated (render as text,
+    not HTML), then a final 'done' event with the saved guide's id, or an
+    'error' event.
+    """
+    db = get_db()
+
+    error, guide = _load_api_guide_request(db, request.get_json() or {})
+    if error:
+        return error
+
+    user_id = session['user_id']
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {orjson.dumps(payload).decode()}\n\n"
+
+    def events():
+        try:
+            combined_content = guide['combined_content']
+            if guide['use_summaries']:
+                combined_content = build_summarized_content(guide['notes'])
+
+            parts = []
+            for chunk in stream_study_guide(
+                combined_content, guide['class_name'], guide['focus_areas'], summarized=guide['use_summaries']
+            ):
+                if chunk:
+                    parts.append(chunk)
+                    yield sse('chunk', {'text': chunk})
+
+            content = sanitize_html("".join(parts))
+            cursor = db.execute('''
+                INSERT INTO study_guides (user_id, class_id, title, content, source_notes)
+                VALUES (%s, %s, %s, %s, %s)
+            ''', (user_id, guide['class_id'], guide['title'], content, orjson.dumps(guide['note_ids']).decode()))
+            db.commit()
+
+            yield sse('done', {'success': True, 'guide_id': cursor.lastrowid})
+
+        except Exception as e:
+            yield sse('error', {'success': False, 'error': str(e)})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
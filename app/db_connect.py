@@ -3,6 +3,11 @@ from pymysql.cursors import DictCursor
 from contextlib import contextmanager
 from flask import g
 import os
+import queue
+import time
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def get_db_config():
@@ -38,6 +43,12 @@ class MySQLConnectionWrapper:
         cursor.lastrowid = cursor.lastrowid
         return cursor
 
+    def executemany(self, query, seq_of_params):
+        """Execute a query once per parameter tuple (multi-row INSERTs are batched)."""
+        cursor = self._conn.cursor()
+        cursor.executemany(query, seq_of_params)
+        return cursor
+
     def commit(self):
         return self._conn.commit()
 
@@ -47,8 +58,9 @@ class MySQLConnectionWrapper:
     def close(self):
         return self._conn.close()
 
-    def cursor(self):
-        return self._conn.cursor()
+    def cursor(self, cursor_class=None):
+        """Open a raw cursor, optionally of another class (e.g. SSDictCursor for streaming)."""
+        return self._conn.cursor(cursor_class)
 
 
 @contextmanager
@@ -70,20 +82,88 @@ def transaction(db):
         raise e
 
 
+# Idle connections kept between requests so each request (and each
+# ai_rate_limit check) skips the TCP + auth handshake of a fresh connect.
+# Size the pool at least to gunicorn's threads per worker.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 20))
+DB_POOL_MAX_IDLE = int(os.environ.get('DB_POOL_MAX_IDLE', 300))
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+
+def _acquire_connection():
+    """
+    Take an idle pooled connection, or open a new one.
+
+    Connections idle longer than DB_POOL_MAX_IDLE seconds are closed rather
+    than reused; others are pinged (reconnecting if the server dropped them).
+
+    Returns:
+        pymysql.Connection: An open connection with no pending transaction
+    """
+    while True:
+        try:
+            conn, released_at = _db_pool.get_nowait()
+        except queue.Empty:
+            return pymysql.connect(**get_db_config())
+
+        if time.monotonic() - released_at > DB_POOL_MAX_IDLE:
+            _close_quietly(conn)
+            continue
+        try:
+            conn.ping(reconnect=True)
+            return conn
+        except pymysql.Error:
+            _close_quietly(conn)
+
+
+def _release_connection(conn):
+    """Roll back any open transaction and return the connection to the pool."""
+    try:
+        conn.rollback()
+        _db_pool.put_nowait((conn, time.monotonic()))
+    except (pymysql.Error, queue.Full):
+        _close_quietly(conn)
+
+
+def _close_quietly(conn):
+    """Close a connection, ignoring errors from an already-dead socket."""
+    try:
+        conn.close()
+    except pymysql.Error:
+        pass
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a pooled connection outside the request's own g.db.
+
+    For work that runs off the request thread (e.g. concurrent queries);
+    the connection is returned to the pool on exit.
+
+    Usage:
+        with pooled_connection() as db:
+            db.execute('SELECT ...')
+    """
+    conn = _acquire_connection()
+    try:
+        yield MySQLConnectionWrapper(conn)
+    finally:
+        _release_connection(conn)
+
+
 def get_db():
-    """Get database connection, creating one if needed."""
+    """Get database connection, taking one from the pool if needed."""
     if 'db' not in g:
-        config = get_db_config()
-        conn = pymysql.connect(**config)
-        g.db = MySQLConnectionWrapper(conn)
+        g.db = MySQLConnectionWrapper(_acquire_connection())
     return g.db
 
 
 def close_db(exception=None):
-    """Close database connection."""
+    """Return the request's database connection to the pool."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        _release_connection(db._conn)
 
 
 def init_db():
@@ -209,6 +289,69 @@ def init_db():
         )
     ''')
 
+    # Add mastered_count column (denormalized count of mastered cards per deck)
+    backfill_mastered = False
+    try:
+        cursor.execute('ALTER TABLE flashcard_decks ADD COLUMN mastered_count INT NOT NULL DEFAULT 0')
+        backfill_mastered = True
+    except pymysql.err.OperationalError:
+        pass  # Column already exists
+
+    # Keep mastered_count current on every card write (updated_at is left
+    # untouched so reviews don't reorder decks)
+    mastery_triggers = {
+        'trg_flashcards_mastery_insert': '''
+            AFTER INSERT ON flashcards FOR EACH ROW
+            UPDATE flashcard_decks SET mastered_count = mastered_count + 1, updated_at = updated_at
+            WHERE id = NEW.deck_id AND NEW.repetitions >= 3 AND NEW.ease_factor >= 2.5
+        ''',
+        'trg_flashcards_mastery_update': '''
+            AFTER UPDATE ON flashcards FOR EACH ROW
+            UPDATE flashcard_decks
+            SET mastered_count = mastered_count
+                + (NEW.repetitions >= 3 AND NEW.ease_factor >= 2.5)
+                - (OLD.repetitions >= 3 AND OLD.ease_factor >= 2.5),
+                updated_at = updated_at
+            WHERE id = NEW.deck_id
+            AND (NEW.repetitions >= 3 AND NEW.ease_factor >= 2.5) <> (OLD.repetitions >= 3 AND OLD.ease_factor >= 2.5)
+        ''',
+        'trg_flashcards_mastery_delete': '''
+            AFTER DELETE ON flashcards FOR EACH ROW
+            UPDATE flashcard_decks SET mastered_count = mastered_count - 1, updated_at = updated_at
+            WHERE id = OLD.deck_id AND OLD.repetitions >= 3 AND OLD.ease_factor >= 2.5
+        ''',
+    }
+    # Only missing triggers are created, so concurrent boots don't race on
+    # DROP/CREATE and existing triggers never leave a window of uncounted writes
+    placeholders = ','.join(['%s'] * len(mastery_triggers))
+    cursor.execute(f'''
+        SELECT TRIGGER_NAME FROM information_schema.TRIGGERS
+        WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME IN ({placeholders})
+    ''', list(mastery_triggers))
+    existing_triggers = {row['TRIGGER_NAME'] for row in cursor.fetchall()}
+    for name, body in mastery_triggers.items():
+        if name in existing_triggers:
+            continue
+        try:
+            cursor.execute(f'CREATE TRIGGER {name} {body}')
+            backfill_mastered = True
+        except pymysql.err.MySQLError as e:
+            # e.g. another worker created it first, or binlogging without
+            # SUPER (ERROR 1419); mastered_count then drifts until it succeeds
+            logger.warning("Could not create trigger %s: %s", name, e)
+
+    # Recount after the column or a trigger is added: writes made before the
+    # trigger existed were not counted
+    if backfill_mastered:
+        cursor.execute('''
+            UPDATE flashcard_decks d
+            SET d.mastered_count = (
+                SELECT COUNT(*) FROM flashcards f
+                WHERE f.deck_id = d.id AND f.repetitions >= 3 AND f.ease_factor >= 2.5
+            ), d.updated_at = d.updated_at
+        ''')
+    db.commit()
+
     # Create study guides table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS study_guides (
@@ -329,6 +472,13 @@ def init_db():
     except pymysql.err.OperationalError:
         pass  # Column already exists
 
+    # Add onboarding_flags column (bitmask of onboarding steps already reached)
+    try:
+        cursor.execute('ALTER TABLE user_settings ADD COLUMN onboarding_flags SMALLINT NOT NULL DEFAULT 0')
+        db.commit()
+    except pymysql.err.OperationalError:
+        pass  # Column already exists
+
     # Create pomodoro sessions table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS pomodoro_sessions (
@@ -396,6 +546,87 @@ def init_db():
         )
     ''')
 
+    # Create daily AI usage rollup (kept current by the usage log writer;
+    # admin analytics read this instead of scanning ai_usage_logs)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_usage_daily (
+            day DATE NOT NULL,
+            user_id INT NOT NULL,
+            endpoint VARCHAR(100) NOT NULL,
+            requests INT NOT NULL DEFAULT 0,
+            tokens BIGINT NOT NULL DEFAULT 0,
+            successes INT NOT NULL DEFAULT 0,
+            failures INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id, endpoint),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Backfill the rollup from existing logs the first time it is created
+    cursor.execute('SELECT 1 FROM ai_usage_daily LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute('''
+            INSERT INTO ai_usage_daily (day, user_id, endpoint, requests, tokens, successes, failures)
+            SELECT DATE(created_at), user_id, endpoint, COUNT(*), COALESCE(SUM(tokens_used), 0),
+                   SUM(success = 1), SUM(success = 0)
+            FROM ai_usage_logs
+            GROUP BY DATE(created_at), user_id, endpoint
+        ''')
+
+    # Create syllabus analysis cache (parsed Groq output keyed by a hash of the
+    # extracted syllabus text, so re-analyzing an unchanged file skips the model)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS syllabus_analysis_cache (
+            content_hash CHAR(32) PRIMARY KEY,
+            analysis_json MEDIUMTEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Create daily active users table (one row per user per study day,
+    # written by update_streak; DAU/WAU/MAU count this instead of study_sessions)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_active_users (
+            day DATE NOT NULL,
+            user_id INT NOT NULL,
+            PRIMARY KEY (day, user_id),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Backfill from existing study sessions the first time it is created
+    cursor.execute('SELECT 1 FROM daily_active_users LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute('''
+            INSERT IGNORE INTO daily_active_users (day, user_id)
+            SELECT DISTINCT DATE(created_at), user_id FROM study_sessions
+        ''')
+
+    # Create per-user daily study rollup (kept current by record_study_session;
+    # weekly summaries and insights sum at most 14 rows from here)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS study_daily_stats (
+            user_id INT NOT NULL,
+            day DATE NOT NULL,
+            minutes INT NOT NULL DEFAULT 0,
+            sessions INT NOT NULL DEFAULT 0,
+            flashcard_sessions INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Backfill the rollup from existing study sessions the first time it is created
+    cursor.execute('SELECT 1 FROM study_daily_stats LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute('''
+            INSERT INTO study_daily_stats (user_id, day, minutes, sessions, flashcard_sessions)
+            SELECT user_id, DATE(created_at), COALESCE(SUM(duration), 0), COUNT(*),
+                   SUM(activity_type = 'flashcards')
+            FROM study_sessions
+            GROUP BY user_id, DATE(created_at)
+        ''')
+
     # Create subscriptions table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS subscriptions (
@@ -564,6 +795,7 @@ def init_db():
         'CREATE INDEX idx_assignments_class_id ON assignments(class_id)',
         'CREATE INDEX idx_study_sessions_user_id ON study_sessions(user_id)',
         'CREATE INDEX idx_study_sessions_created_at ON study_sessions(created_at)',
+        'CREATE INDEX idx_study_sessions_user_created ON study_sessions(user_id, created_at)',
         'CREATE INDEX idx_chat_sessions_user_id ON chat_sessions(user_id)',
         'CREATE INDEX idx_chat_messages_session_id ON chat_messages(session_id)',
         'CREATE INDEX idx_friendships_user_id ON friendships(user_id)',
@@ -572,6 +804,17 @@ def init_db():
         'CREATE INDEX idx_notifications_is_read ON notifications(is_read)',
         'CREATE INDEX idx_resource_collaborators_collaborator ON resource_collaborators(collaborator_id)',
         'CREATE INDEX idx_ai_usage_user_date ON ai_usage_logs(user_id, created_at)',
+        'CREATE INDEX idx_ai_usage_created_at ON ai_usage_logs(created_at)',
+        'CREATE INDEX idx_users_created_at ON users(created_at)',
+        'CREATE INDEX idx_user_streaks_current ON user_streaks(current_streak)',
+        # Covering indexes for the dashboard insights/summary and unread badge
+        'CREATE INDEX idx_quiz_attempts_user_completed ON quiz_attempts(user_id, completed_at, score, total)',
+        'CREATE INDEX idx_flashcards_deck_mastery ON flashcards(deck_id, repetitions, ease_factor)',
+        'CREATE INDEX idx_notifications_user_unread ON notifications(user_id, is_read, created_at)',
+        'CREATE INDEX idx_notifications_user_created ON notifications(user_id, created_at)',
+        # Streak/today-stats range scans; MySQL has no partial indexes, so the
+        # completed flag leads the range column instead
+        'CREATE INDEX idx_pomodoro_sessions_user_completed ON pomodoro_sessions(user_id, completed, completed_at)',
     ]
 
     for index_sql in indexes:
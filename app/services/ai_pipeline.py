@@ -0,0 +1,110 @@
+"""AI Pipeline - Reuse intermediate AI outputs across multi-step workflows."""
+
+import re
+import asyncio
+import threading
+from cachetools import TTLCache
+from app.services.ai_service import summarize_text, batch_summarize
+from app.services.llm_cache import cache_key
+
+
+# Note summaries keyed by (note_id, BLAKE2b of content); 7-day TTL.
+# A changed note hashes differently, so stale summaries are never served.
+summary_cache = TTLCache(maxsize=2000, ttl=7 * 24 * 3600)
+summary_cache_lock = threading.Lock()
+
+
+def _summary_cache_key(note_id, text):
+    """Cache key for a note summary: (note_id, BLAKE2b of content)."""
+    return (note_id, cache_key(text))
+
+
+def get_or_compute_summary(note_id, text):
+    """
+    Get a note's bullet-point summary, summarizing it only on a cache miss.
+
+    Args:
+        note_id: ID of the note the text belongs to
+        text: Plain-text note content
+
+    Returns:
+        str: Bullet-point summary of the note
+    """
+    cache_key = _summary_cache_key(note_id, text)
+
+    with summary_cache_lock:
+        cached = summary_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    summary = summarize_text(text)
+    with summary_cache_lock:
+        summary_cache[cache_key] = summary
+    return summary
+
+
+def get_cached_summaries(items):
+    """
+    Look up cached note summaries without calling the AI service.
+
+    Args:
+        items: (note_id, text) pairs with plain-text content
+
+    Returns:
+        list: Cached summary or None for each item, in order
+    """
+    keys = [_summary_cache_key(note_id, text) for note_id, text in items]
+    with summary_cache_lock:
+        return [summary_cache.get(key) for key in keys]
+
+
+def get_or_compute_summaries(items):
+    """
+    Get bullet-point summaries for several notes, batching the cache misses.
+
+    Args:
+        items: (note_id, text) pairs with plain-text, non-empty content
+
+    Returns:
+        list: Summaries in the same order as items. A note whose summary call
+            failed gets its raw text instead (not cached, so it is retried later)
+    """
+    keys = [_summary_cache_key(note_id, text) for note_id, text in items]
+
+    with summary_cache_lock:
+        summaries = {key: summary_cache.get(key) for key in keys}
+
+    missing = [(key, text) for key, (_, text) in zip(keys, items) if summaries[key] is None]
+    if missing:
+        computed = asyncio.run(batch_summarize([text for _, text in missing]))
+        with summary_cache_lock:
+            for (key, text), summary in zip(missing, computed):
+                if summary is None:
+                    summaries[key] = text
+                    continue
+                summary_cache[key] = summary
+                summaries[key] = summary
+
+    return [summaries[key] for key in keys]
+
+
+def build_summarized_content(notes):
+    """
+    Combine note summaries into one input for study guide/flashcard generation.
+
+    Notes without a cached summary are summarized concurrently in one batch.
+
+    Args:
+        notes: Rows with 'id', 'title' and 'content' (HTML) keys
+
+    Returns:
+        str: Summaries joined under '## title' headers (empty notes skipped)
+    """
+    entries = []
+    for note in notes:
+        clean_content = re.sub(r'<[^>]+>', '', note['content'] or '').strip()
+        if clean_content:
+            entries.append((note['title'], note['id'], clean_content))
+
+    summaries = get_or_compute_summaries([(note_id, text) for _, note_id, text in entries])
+    return "\n\n".join(f"## {title}\n{summary}" for (title, _, _), summary in zip(entries, summaries))
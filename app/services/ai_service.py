@@ -1,12 +1,25 @@
 """AI Service - Groq API integration for note enhancement."""
 
+import io
 import os
 import re
 import time
-import base64
-from functools import wraps
-from groq import Groq
+import random
+import binascii
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import wraps, lru_cache
+from groq import Groq, AsyncGroq, RateLimitError, APIConnectionError, InternalServerError
 import bleach
+import orjson
+import tiktoken
+from cachetools import LRUCache
+from app.services.llm_cache import cached_llm, cache_key
+
+logger = logging.getLogger(__name__)
 
 
 # HTML Sanitization Configuration
@@ -96,13 +109,37 @@ class AIServiceError(Exception):
     pass
 
 
+# Longest Retry-After honored while blocking a request thread. Daily token
+# limits can ask for minutes; past this the call fails instead of sleeping.
+RETRY_AFTER_CAP = 8.0
+
+
+def _backoff_delay(error, base_delay, attempt):
+    """
+    Seconds to wait before retrying a failed AI call.
+
+    Honors Retry-After on rate limit errors (up to RETRY_AFTER_CAP); otherwise
+    a jittered exponential delay so concurrent callers don't all retry at the
+    same moment.
+
+    Args:
+        error: Exception raised by the failed attempt
+        base_delay: Base delay in seconds
+        attempt: Zero-based index of the failed attempt
+    """
+    jittered = random.uniform(base_delay, base_delay * (2 ** (attempt + 1)))
+    if isinstance(error, RateLimitError):
+        return min(_retry_after_seconds(error, jittered), RETRY_AFTER_CAP)
+    return jittered
+
+
 def with_retry(max_retries=3, base_delay=1):
     """
     Decorator for retry logic with exponential backoff on AI calls.
 
     Args:
         max_retries: Maximum number of retry attempts
-        base_delay: Base delay in seconds (doubles each retry)
+        base_delay: Base delay in seconds (jittered, doubles each retry)
     """
     def decorator(func):
         @wraps(func)
@@ -113,67 +150,412 @@ def with_retry(max_retries=3, base_delay=1):
                     return func(*args, **kwargs)
                 except AIServiceError:
                     raise  # Don't retry our own errors (like missing API key)
+                except (RateLimitError, APIConnectionError, InternalServerError) as e:
+                    # The key pool already retried transport errors and failed
+                    # over on 429s; retrying here would multiply the attempts
+                    raise AIServiceError(f"AI service unavailable: {e}") from e
+                except Exception as e:
+                    last_error = e
+                    if attempt < max_retries - 1:
+                        time.sleep(_backoff_delay(e, base_delay, attempt))
+            raise AIServiceError(f"AI service unavailable after {max_retries} attempts: {last_error}")
+        return wrapper
+    return decorator
+
+
+def with_retry_async(max_retries=3, base_delay=1):
+    """
+    Async variant of with_retry; backs off with asyncio.sleep instead of time.sleep.
+
+    Args:
+        max_retries: Maximum number of retry attempts
+        base_delay: Base delay in seconds (jittered, doubles each retry)
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            last_error = None
+            for attempt in range(max_retries):
+                try:
+                    return await func(*args, **kwargs)
+                except AIServiceError:
+                    raise  # Don't retry our own errors (like missing API key)
+                except RateLimitError as e:
+                    # The key pool already failed over across every key
+                    raise AIServiceError(f"AI service unavailable: {e}") from e
                 except Exception as e:
                     last_error = e
                     if attempt < max_retries - 1:
-                        delay = base_delay * (2 ** attempt)
-                        time.sleep(delay)
+                        await asyncio.sleep(_backoff_delay(e, base_delay, attempt))
             raise AIServiceError(f"AI service unavailable after {max_retries} attempts: {last_error}")
         return wrapper
     return decorator
 
 
+# Matches a reply wrapped in a ```/```json markdown fence, capturing the body
+_FENCE_RE = re.compile(r'\A\s*```(?:json)?\s*(.*?)\s*```\s*\Z', re.DOTALL | re.IGNORECASE)
+
+
+def _strip_fences(text):
+    """Remove a surrounding markdown code fence from an AI reply."""
+    if '```' not in text:
+        return text.strip()
+    match = _FENCE_RE.match(text)
+    return match.group(1) if match else text.strip()
+
+
+def _json_tool(name, description, parameters):
+    """Build an OpenAI-style function tool whose arguments follow a JSON schema."""
+    return {
+        "type": "function",
+        "function": {"name": name, "description": description, "parameters": parameters},
+    }
+
+
+def _forced_tool_choice(tool):
+    """Force the model to answer by calling the given tool."""
+    return {"type": "function", "function": {"name": tool["function"]["name"]}}
+
+
+def _tool_arguments(message):
+    """
+    Parse the structured output of a tool-call response.
+
+    Args:
+        message: The response message (choices[0].message)
+
+    Returns:
+        The decoded tool arguments. Falls back to parsing fenced JSON from
+        the message content if the model answered without a tool call.
+
+    Raises:
+        ValueError: If neither form contains valid JSON
+    """
+    if message.tool_calls:
+        return orjson.loads(message.tool_calls[0].function.arguments)
+    return orjson.loads(_strip_fences(message.content or ''))
+
+
+def _budget(input_text, floor, ceiling, ratio):
+    """
+    Scale a max_tokens budget to the input size (~4 chars per token).
+
+    Args:
+        input_text: The text being sent to the model
+        floor: Minimum budget for very short inputs
+        ceiling: Maximum budget for long inputs
+        ratio: Expected output tokens per input token
+
+    Returns:
+        int: max_tokens value between floor and ceiling
+    """
+    return max(floor, min(ceiling, int(len(input_text) / 4 * ratio)))
+
+
+# Emoji codepoint ranges (inclusive), sorted by start
+_EMOJI_RANGES = sorted([
+    (0x1F600, 0x1F64F),  # emoticons
+    (0x1F300, 0x1F5FF),  # symbols & pictographs
+    (0x1F680, 0x1F6FF),  # transport & map symbols
+    (0x1F700, 0x1F77F),  # alchemical symbols
+    (0x1F780, 0x1F7FF),  # geometric shapes
+    (0x1F800, 0x1F8FF),  # supplemental arrows
+    (0x1F900, 0x1F9FF),  # supplemental symbols
+    (0x1FA00, 0x1FA6F),  # chess symbols
+    (0x1FA70, 0x1FAFF),  # symbols extended
+    (0x2702, 0x27B0),  # dingbats
+    (0x24C2, 0x1F251),
+])
+
+
+def _merge_ranges(ranges):
+    """Merge sorted, overlapping or adjacent (lo, hi) ranges."""
+    merged = []
+    for lo, hi in ranges:
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+# The ranges above overlap and collapse to 3 disjoint intervals; a smaller
+# character class means fewer comparisons per character in the regex engine.
+# Compiled once at import; strip_emojis runs on every tutor reply.
+_EMOJI_RE = re.compile(
+    "[" + "".join(f"{chr(lo)}-{chr(hi)}" for lo, hi in _merge_ranges(_EMOJI_RANGES)) + "]+",
+    flags=re.UNICODE
+)
+
+
 def strip_emojis(text):
     """Remove emojis from text."""
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F600-\U0001F64F"  # emoticons
-        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-        "\U0001F680-\U0001F6FF"  # transport & map symbols
-        "\U0001F700-\U0001F77F"  # alchemical symbols
-        "\U0001F780-\U0001F7FF"  # geometric shapes
-        "\U0001F800-\U0001F8FF"  # supplemental arrows
-        "\U0001F900-\U0001F9FF"  # supplemental symbols
-        "\U0001FA00-\U0001FA6F"  # chess symbols
-        "\U0001FA70-\U0001FAFF"  # symbols extended
-        "\U00002702-\U000027B0"  # dingbats
-        "\U000024C2-\U0001F251"
-        "]+",
-        flags=re.UNICODE
-    )
-    return emoji_pattern.sub('', text).strip()
+    # Every emoji range is above U+007F, so pure-ASCII text cannot match
+    if text.isascii():
+        return text.strip()
+    return _EMOJI_RE.sub('', text).strip()
+
+
+# Groq key pool: requests are spread across every key in GROQ_API_KEYS
+# (comma-separated, falls back to GROQ_API_KEY) to multiply the per-key rate limit.
+# Per-key state: cached client, in_flight, last_used_ns, next_retry_after_ns
+_key_states = {}
+_key_pool_lock = threading.Lock()
+
+RATE_LIMIT_MAX_ATTEMPTS = 4
+RATE_LIMIT_BASE_DELAY = 0.5  # seconds, doubles per attempt
+
+
+@lru_cache(maxsize=1)
+def _parse_api_keys(raw_keys):
+    """Split a comma-separated key list (cached until the env value changes)."""
+    return tuple(key.strip() for key in raw_keys.split(',') if key.strip())
+
 
+def get_api_keys():
+    """Get the configured Groq API keys from environment."""
+    return _parse_api_keys(os.environ.get('GROQ_API_KEYS') or os.environ.get('GROQ_API_KEY') or '')
 
-def get_groq_client():
-    """Get Groq client with API key from environment."""
-    api_key = os.environ.get('GROQ_API_KEY')
-    if not api_key:
+
+def _pick_key_state():
+    """
+    Pick the least-busy key that is not cooling down after a 429.
+
+    Must be called with _key_pool_lock held. If every key is cooling down,
+    the one that becomes available soonest is returned.
+    """
+    keys = get_api_keys()
+    if not keys:
         raise AIServiceError("GROQ_API_KEY not set. AI features are disabled.")
-    return Groq(api_key=api_key)
 
+    states = []
+    for key in keys:
+        if key not in _key_states:
+            _key_states[key] = {
+                'api_key': key,
+                'client': None,
+                'in_flight': 0,
+                'last_used_ns': 0,
+                'next_retry_after_ns': 0,
+            }
+        states.append(_key_states[key])
 
-@with_retry(max_retries=3, base_delay=1)
-def summarize_text(text):
+    now = time.monotonic_ns()
+    ready = [state for state in states if state['next_retry_after_ns'] <= now]
+    if not ready:
+        return min(states, key=lambda state: state['next_retry_after_ns'])
+    return min(ready, key=lambda state: (state['in_flight'], state['last_used_ns']))
+
+
+def _key_client(state):
     """
-    Summarize text into bullet points using Groq AI.
+    Get (creating once) the cached Groq client for a key. Lock must be held.
+
+    SDK retries are off: _with_key_pool is the only retry layer.
+    """
+    if state['client'] is None:
+        state['client'] = Groq(api_key=state['api_key'], max_retries=0)
+    return state['client']
+
+
+def clear_groq_key_pool():
+    """Drop cached clients and key state (e.g. after rotating keys, or in tests)."""
+    with _key_pool_lock:
+        _key_states.clear()
+    _parse_api_keys.cache_clear()
+
+
+def _retry_after_seconds(error, default):
+    """Read the retry-after header from a 429 response, if present."""
+    try:
+        return float(error.response.headers.get('retry-after', default))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+def _retry(max_attempts=4, base=0.4, cap=8.0, retry_on=(APIConnectionError, InternalServerError)):
+    """
+    Decorator for retrying transient Groq transport errors with full-jitter backoff.
 
     Args:
-        text: The text content to summarize
+        max_attempts: Maximum number of attempts
+        base: Base delay in seconds (doubles each attempt)
+        cap: Maximum delay in seconds
+        retry_on: Exception types that trigger a retry
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_attempts):
+                try:
+                    return func(*args, **kwargs)
+                except retry_on:
+                    if attempt == max_attempts - 1:
+                        raise
+                    time.sleep(random.uniform(0, min(cap, base * (2 ** attempt))))
+        return wrapper
+    return decorator
+
+
+def _checkout_key_state():
+    """Pick a key for one request and count it as in flight."""
+    with _key_pool_lock:
+        state = _pick_key_state()
+        state['in_flight'] += 1
+        state['last_used_ns'] = time.monotonic_ns()
+        return state
+
+
+def _checkin_key_state(state, rate_limit_error=None, cooldown=0):
+    """
+    Finish a request on a key, cooling the key down after a 429.
+
+    Args:
+        state: Key state returned by _checkout_key_state
+        rate_limit_error: The RateLimitError the request hit, if any
+        cooldown: Fallback cooldown in seconds when the 429 has no retry-after
+    """
+    with _key_pool_lock:
+        state['in_flight'] -= 1
+        if rate_limit_error is not None:
+            cooldown = _retry_after_seconds(rate_limit_error, cooldown)
+            state['next_retry_after_ns'] = time.monotonic_ns() + int(cooldown * 1e9)
+
+
+@_retry(max_attempts=4, base=0.4, cap=8.0)
+def _with_key_pool(call):
+    """
+    Run a Groq request on a pooled key, failing over to another key on 429.
+
+    Args:
+        call: Function taking a Groq client and performing the request
 
     Returns:
-        str: Bullet-point summary of the content
+        The result of call(client)
     """
-    if not text or not text.strip():
-        raise ValueError("No content to summarize")
+    delay = RATE_LIMIT_BASE_DELAY
+    for attempt in range(RATE_LIMIT_MAX_ATTEMPTS):
+        state = _checkout_key_state()
+        with _key_pool_lock:
+            client = _key_client(state)
+
+        try:
+            result = call(client)
+        except RateLimitError as e:
+            _checkin_key_state(state, e, delay)
+            if attempt == RATE_LIMIT_MAX_ATTEMPTS - 1:
+                raise
+        except BaseException:
+            _checkin_key_state(state)
+            raise
+        else:
+            _checkin_key_state(state)
+            return result
+
+        time.sleep(delay)
+        delay *= 2
+
+
+def _groq_call(**kwargs):
+    """Create a chat completion through the key pool."""
+    return _with_key_pool(lambda client: client.chat.completions.create(**kwargs))
+
+
+def _groq_stream(**kwargs):
+    """
+    Stream a chat completion through the key pool.
 
-    client = get_groq_client()
+    Returns:
+        generator: Text deltas of the completion as they arrive
+    """
+    stream = _with_key_pool(lambda client: client.chat.completions.create(stream=True, **kwargs))
 
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are a helpful study assistant. Summarize the following notes into clear, concise bullet points.
+    def chunks():
+        with stream:
+            for chunk in stream:
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content or ""
+
+    return chunks()
+
+
+# Max Groq requests in flight at once within an async batch (keeps under rate limits)
+ASYNC_CONCURRENCY = 16
+
+
+@asynccontextmanager
+async def async_groq_clients():
+    """
+    AsyncGroq clients for one batch, one per pooled key, closed on exit.
+
+    AsyncGroq connection pools are bound to the event loop that created them,
+    so clients live for one batch (one asyncio.run) rather than the process.
+
+    Yields:
+        dict: API key -> AsyncGroq client, filled lazily by _with_key_pool_async
+    """
+    clients = {}
+    try:
+        yield clients
+    finally:
+        for client in clients.values():
+            await client.close()
+
+
+async def _with_key_pool_async(clients, call):
+    """
+    Async _with_key_pool: run a request on a pooled key, failing over on 429.
+
+    Shares in-flight counts and 429 cooldowns with the sync pool. Transport
+    errors are left to with_retry_async.
+
+    Args:
+        clients: Client dict from async_groq_clients
+        call: Coroutine function taking an AsyncGroq client
+
+    Returns:
+        The result of await call(client)
+    """
+    delay = RATE_LIMIT_BASE_DELAY
+    for attempt in range(RATE_LIMIT_MAX_ATTEMPTS):
+        state = _checkout_key_state()
+        client = clients.get(state['api_key'])
+        if client is None:
+            client = clients[state['api_key']] = AsyncGroq(api_key=state['api_key'], max_retries=0)
+
+        try:
+            result = await call(client)
+        except RateLimitError as e:
+            _checkin_key_state(state, e, delay)
+            if attempt == RATE_LIMIT_MAX_ATTEMPTS - 1:
+                raise
+        except BaseException:
+            _checkin_key_state(state)
+            raise
+        else:
+            _checkin_key_state(state)
+            return result
+
+        await asyncio.sleep(delay)
+        delay *= 2
+
+
+async def _async_groq_call(clients=None, **kwargs):
+    """
+    Create a chat completion through the key pool from async code.
+
+    Args:
+        clients: Batch clients from async_groq_clients; a single-use set
+            (closed afterwards) when None
+        **kwargs: chat.completions.create arguments
+    """
+    if clients is None:
+        async with async_groq_clients() as own_clients:
+            return await _async_groq_call(own_clients, **kwargs)
+    return await _with_key_pool_async(clients, lambda client: client.chat.completions.create(**kwargs))
+
+
+SUMMARIZE_PROMPT = """You are a helpful study assistant. Summarize the following notes into clear, concise bullet points.
 
 Focus on:
 - Key concepts and definitions
@@ -184,6 +566,16 @@ Focus on:
 Format your response as bullet points using - for each point.
 Keep each bullet point concise but informative.
 Group related points together if applicable."""
+
+
+def _summarize_request(text):
+    """Chat completion arguments for summarize_text and summarize_text_async."""
+    return dict(
+        model="llama-3.3-70b-versatile",
+        messages=[
+            {
+                "role": "system",
+                "content": SUMMARIZE_PROMPT
             },
             {
                 "role": "user",
@@ -194,9 +586,38 @@ Group related points together if applicable."""
         max_tokens=1000
     )
 
+
+@cached_llm(ttl=3600)
+@with_retry(max_retries=3, base_delay=1)
+def summarize_text(text):
+    """
+    Summarize text into bullet points using Groq AI.
+
+    Args:
+        text: The text content to summarize
+
+    Returns:
+        str: Bullet-point summary of the content
+    """
+    text = (text or "").strip()
+    if not text:
+        raise ValueError("No content to summarize")
+
+    response = _groq_call(**_summarize_request(text))
+
     return response.choices[0].message.content
 
 
+EXPAND_PROMPT = """You are a helpful study assistant. Expand the given text with:
+- Detailed explanations
+- Examples and illustrations
+- Definitions of key terms
+- Connections to related concepts
+
+Write in a clear, educational style suitable for study notes."""
+
+
+@cached_llm(ttl=3600)
 @with_retry(max_retries=3, base_delay=1)
 def expand_text(text, context=""):
     """
@@ -209,27 +630,20 @@ def expand_text(text, context=""):
     Returns:
         str: Expanded, detailed explanation
     """
-    if not text or not text.strip():
+    text = (text or "").strip()
+    if not text:
         raise ValueError("No content to expand")
 
-    client = get_groq_client()
-
     prompt = f"Please expand on this text with more details, examples, and explanations:\n\n{text}"
     if context:
         prompt = f"Context from the notes:\n{context}\n\n{prompt}"
 
-    response = client.chat.completions.create(
+    response = _groq_call(
         model="llama-3.3-70b-versatile",
         messages=[
             {
                 "role": "system",
-                "content": """You are a helpful study assistant. Expand the given text with:
-- Detailed explanations
-- Examples and illustrations
-- Definitions of key terms
-- Connections to related concepts
-
-Write in a clear, educational style suitable for study notes."""
+                "content": EXPAND_PROMPT
             },
             {
                 "role": "user",
@@ -243,28 +657,7 @@ Write in a clear, educational style suitable for study notes."""
     return response.choices[0].message.content
 
 
-@with_retry(max_retries=3, base_delay=1)
-def cleanup_text(text):
-    """
-    Clean up text and apply smart formatting (headers, bullets, bold, colors).
-
-    Args:
-        text: The text to clean up and format
-
-    Returns:
-        str: HTML-formatted text with proper structure and color coding
-    """
-    if not text or not text.strip():
-        raise ValueError("No content to clean up")
-
-    client = get_groq_client()
-
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are a note formatting assistant. Your job is to clean up and format notes into well-structured, visually appealing HTML using Notion's color palette.
+CLEANUP_PROMPT = """You are a note formatting assistant. Your job is to clean up and format notes into well-structured, visually appealing HTML using Notion's color palette.
 
 Tasks:
 1. Fix spelling and grammar errors
@@ -308,6 +701,16 @@ Formatting rules:
 - Make the notes visually scannable and study-friendly
 
 Return ONLY the formatted HTML, no explanations or markdown."""
+
+
+def _cleanup_request(text):
+    """Chat completion arguments for cleanup_text."""
+    return dict(
+        model="llama-3.3-70b-versatile",
+        messages=[
+            {
+                "role": "system",
+                "content": CLEANUP_PROMPT
             },
             {
                 "role": "user",
@@ -315,155 +718,236 @@ Return ONLY the formatted HTML, no explanations or markdown."""
             }
         ],
         temperature=0.2,
+        # Flat budget: the HTML and inline color styles run several times
+        # longer than the input text
         max_tokens=3000
     )
 
-    # Sanitize HTML output to prevent XSS
-    return sanitize_html(response.choices[0].message.content)
-
 
+@cached_llm(ttl=3600)
 @with_retry(max_retries=3, base_delay=1)
-def generate_flashcards(text, num_cards=10):
+def cleanup_text(text):
     """
-    Generate flashcards from text content.
+    Clean up text and apply smart formatting (headers, bullets, bold, colors).
 
     Args:
-        text: The text content to generate flashcards from
-        num_cards: Target number of flashcards to generate
+        text: The text to clean up and format
 
     Returns:
-        list: List of dictionaries with 'front' and 'back' keys
+        str: HTML-formatted text with proper structure and color coding
     """
-    if not text or not text.strip():
-        raise ValueError("No content to generate flashcards from")
+    text = (text or "").strip()
+    if not text:
+        raise ValueError("No content to clean up")
 
-    client = get_groq_client()
+    response = _groq_call(**_cleanup_request(text))
+    choice = response.choices[0]
 
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {
-                "role": "system",
-                "content": f"""You are a study assistant that creates flashcards from notes. Generate {num_cards} flashcards from the provided content.
+    # A reply cut off at max_tokens ends mid-tag; never save partial HTML
+    if choice.finish_reason == "length":
+        raise AIServiceError("Note is too long to format in one pass.")
 
-Rules:
-1. Focus on key terms, definitions, concepts, and important facts
-2. Front should be a question or term
-3. Back should be a concise answer or definition
-4. Make cards that test understanding, not just memorization
-5. Cover the most important concepts from the content
+    # Sanitize HTML output to prevent XSS
+    return sanitize_html(choice.message.content)
 
-Return ONLY a JSON array of flashcards in this exact format:
-[
-  {{"front": "What is X?", "back": "X is..."}},
-  {{"front": "Define Y", "back": "Y is defined as..."}}
-]
 
-No explanations, no markdown, just the JSON array."""
-            },
-            {
-                "role": "user",
-                "content": f"Generate flashcards from these notes:\n\n{text}"
-            }
-        ],
-        temperature=0.3,
-        max_tokens=2000
-    )
+@with_retry_async(max_retries=3, base_delay=1)
+async def summarize_text_async(text, clients=None):
+    """
+    Async variant of summarize_text for summarizing many notes concurrently.
 
-    import json
-    result = response.choices[0].message.content.strip()
+    Args:
+        text: The text content to summarize
+        clients: Optional async_groq_clients dict to share across a batch
 
-    # Clean up response if needed
-    if result.startswith('```'):
-        result = result.split('```')[1]
-        if result.startswith('json'):
-            result = result[4:]
-        result = result.strip()
+    Returns:
+        str: Bullet-point summary of the content
+    """
+    text = (text or "").strip()
+    if not text:
+        raise ValueError("No content to summarize")
 
-    try:
-        cards = json.loads(result)
-        return cards
-    except json.JSONDecodeError:
-        raise ValueError("Failed to parse AI response as flashcards")
+    response = await _async_groq_call(clients, **_summarize_request(text))
+    return response.choices[0].message.content
 
 
-@with_retry(max_retries=3, base_delay=1)
-def transform_text(text, action):
+async def _run_batch(async_func, texts):
     """
-    Transform text based on the specified action.
-
-    Args:
-        text: The text to transform
-        action: One of 'improve', 'proofread', 'simplify', 'shorter', 'longer', 'formal', 'casual'
+    Run async_func over texts concurrently on one batch's pooled clients.
 
     Returns:
-        str: Transformed text
+        list: Results in the same order as texts; None where a call failed
     """
-    if not text or not text.strip():
-        raise ValueError("No text to transform")
+    if not texts:
+        return []
 
-    prompts = {
-        'improve': "Improve this writing. Make it clearer, more engaging, and better structured. Keep the same meaning and tone.",
-        'proofread': "Proofread this text. Fix any spelling, grammar, and punctuation errors. Keep the original meaning intact.",
-        'simplify': "Simplify this text. Use simpler words and shorter sentences. Make it easier to understand while keeping the meaning.",
-        'shorter': "Make this text shorter and more concise. Remove unnecessary words and keep only the essential information.",
-        'longer': "Expand this text with more details, examples, and explanations. Make it more comprehensive.",
-        'formal': "Rewrite this text in a more formal, professional tone. Use proper language and avoid casual expressions.",
-        'casual': "Rewrite this text in a more casual, conversational tone. Make it friendly and approachable."
-    }
+    semaphore = asyncio.Semaphore(ASYNC_CONCURRENCY)
 
-    if action not in prompts:
-        raise ValueError(f"Unknown action: {action}")
+    async with async_groq_clients() as clients:
+        async def run_one(text):
+            async with semaphore:
+                return await async_func(text, clients=clients)
 
-    client = get_groq_client()
+        results = await asyncio.gather(*(run_one(text) for text in texts), return_exceptions=True)
 
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {
+    return [None if isinstance(result, BaseException) else result for result in results]
+
+
+async def batch_summarize(texts):
+    """
+    Summarize several texts concurrently.
+
+    Args:
+        texts: List of text contents to summarize
+
+    Returns:
+        list: Summaries in the same order as texts; None for texts that failed
+    """
+    return await _run_batch(summarize_text_async, texts)
+
+
+FLASHCARDS_TOOL = _json_tool('emit_flashcards', 'Return the generated flashcards.', {
+    "type": "object",
+    "properties": {
+        "cards": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "front": {"type": "string", "description": "Question or term"},
+                    "back": {"type": "string", "description": "Concise answer or definition"},
+                },
+                "required": ["front", "back"],
+            },
+        },
+    },
+    "required": ["cards"],
+})
+
+
+FLASHCARDS_PROMPT = """You are a study assistant that creates flashcards from notes. Generate {num_cards} flashcards from the provided content.
+
+Rules:
+1. Focus on key terms, definitions, concepts, and important facts
+2. Front should be a question or term
+3. Back should be a concise answer or definition
+4. Make cards that test understanding, not just memorization
+5. Cover the most important concepts from the content"""
+
+
+@lru_cache(maxsize=32)
+def _flashcards_prompt(num_cards):
+    """Flashcard system prompt for a card count (built once per distinct count)."""
+    return FLASHCARDS_PROMPT.format(num_cards=num_cards)
+
+
+@with_retry(max_retries=3, base_delay=1)
+def generate_flashcards(text, num_cards=10, from_summary=False):
+    """
+    Generate flashcards from text content.
+
+    Args:
+        text: The text content to generate flashcards from
+        num_cards: Target number of flashcards to generate
+        from_summary: True if text is cached note summaries rather than raw notes
+
+    Returns:
+        list: List of dictionaries with 'front' and 'back' keys
+    """
+    text = (text or "").strip()
+    if not text:
+        raise ValueError("No content to generate flashcards from")
+
+    response = _groq_call(
+        model="llama-3.3-70b-versatile",
+        messages=[
+            {
                 "role": "system",
-                "content": f"{prompts[action]}\n\nReturn ONLY the transformed text, nothing else. No explanations, no quotes around it."
+                "content": _flashcards_prompt(num_cards)
             },
             {
                 "role": "user",
-                "content": text
+                "content": f"Generate flashcards from these {'note summaries' if from_summary else 'notes'}:\n\n{text}"
             }
         ],
+        tools=[FLASHCARDS_TOOL],
+        tool_choice=_forced_tool_choice(FLASHCARDS_TOOL),
         temperature=0.3,
         max_tokens=2000
     )
 
-    return response.choices[0].message.content
+    try:
+        return _tool_arguments(response.choices[0].message)['cards']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Failed to parse AI response as flashcards")
 
 
+# Instruction per transform_text action
+TRANSFORM_PROMPTS = {
+    'improve': "Improve this writing. Make it clearer, more engaging, and better structured. Keep the same meaning and tone.",
+    'proofread': "Proofread this text. Fix any spelling, grammar, and punctuation errors. Keep the original meaning intact.",
+    'simplify': "Simplify this text. Use simpler words and shorter sentences. Make it easier to understand while keeping the meaning.",
+    'shorter': "Make this text shorter and more concise. Remove unnecessary words and keep only the essential information.",
+    'longer': "Expand this text with more details, examples, and explanations. Make it more comprehensive.",
+    'formal': "Rewrite this text in a more formal, professional tone. Use proper language and avoid casual expressions.",
+    'casual': "Rewrite this text in a more casual, conversational tone. Make it friendly and approachable."
+}
+
+# Full system prompt per action, built once
+TRANSFORM_SYSTEM_PROMPTS = {
+    action: f"{prompt}\n\nReturn ONLY the transformed text, nothing else. No explanations, no quotes around it."
+    for action, prompt in TRANSFORM_PROMPTS.items()
+}
+
+# Actions that are a no-op on text shorter than MIN_CONDENSE_LENGTH
+NOOP_ON_SHORT_ACTIONS = ('shorter', 'simplify')
+MIN_CONDENSE_LENGTH = 20
+
+
+@cached_llm(ttl=3600)
 @with_retry(max_retries=3, base_delay=1)
-def generate_study_guide(notes_content, class_name="", focus_areas=None):
+def transform_text(text, action):
     """
-    Generate a comprehensive study guide from multiple notes.
+    Transform text based on the specified action.
 
     Args:
-        notes_content: Combined content from multiple notes
-        class_name: Name of the class for context
-        focus_areas: Optional list of areas to focus on
+        text: The text to transform
+        action: One of 'improve', 'proofread', 'simplify', 'shorter', 'longer', 'formal', 'casual'
 
     Returns:
-        str: HTML-formatted study guide
+        str: Transformed text
     """
-    if not notes_content or not notes_content.strip():
-        raise ValueError("No content to generate study guide from")
+    text = (text or "").strip()
+    if not text:
+        raise ValueError("No text to transform")
 
-    client = get_groq_client()
+    if action not in TRANSFORM_SYSTEM_PROMPTS:
+        raise ValueError(f"Unknown action: {action}")
 
-    focus_prompt = ""
-    if focus_areas:
-        focus_prompt = f"\n\nPay special attention to these topics: {', '.join(focus_areas)}"
+    # Too short to meaningfully condense - return as-is without an API call
+    if action in NOOP_ON_SHORT_ACTIONS and len(text) < MIN_CONDENSE_LENGTH:
+        return text
 
-    response = client.chat.completions.create(
+    response = _groq_call(
         model="llama-3.3-70b-versatile",
         messages=[
             {
                 "role": "system",
-                "content": f"""You are an expert study guide creator. Create a comprehensive, well-organized study guide from the provided notes for {class_name or 'this class'}.{focus_prompt}
+                "content": TRANSFORM_SYSTEM_PROMPTS[action]
+            },
+            {
+                "role": "user",
+                "content": text
+            }
+        ],
+        temperature=0.3,
+        max_tokens=2000
+    )
+
+    return response.choices[0].message.content
+
+
+STUDY_GUIDE_PROMPT = """You are an expert study guide creator. Create a comprehensive, well-organized study guide from the provided notes for {class_name}.{focus_prompt}
 
 Your study guide should include:
 
@@ -501,20 +985,130 @@ Format your response as clean HTML:
 - <blockquote style="border-left: 4px solid #6940a5; padding-left: 1rem; margin: 1rem 0; background: #f8f9fa;"> for important notes
 
 Make the study guide scannable, organized, and exam-ready."""
+
+
+@lru_cache(maxsize=32)
+def _study_guide_prompt(class_name, focus_prompt):
+    """Study guide system prompt for a class and focus (built once per combination)."""
+    return STUDY_GUIDE_PROMPT.format(class_name=class_name, focus_prompt=focus_prompt)
+
+
+def _study_guide_request(notes_content, class_name, focus_areas, summarized):
+    """Chat completion arguments for generate_study_guide and stream_study_guide."""
+    notes_content = (notes_content or "").strip()
+    if not notes_content:
+        raise ValueError("No content to generate study guide from")
+
+    focus_prompt = ""
+    if focus_areas:
+        focus_prompt = f"\n\nPay special attention to these topics: {', '.join(focus_areas)}"
+
+    return dict(
+        model="llama-3.3-70b-versatile",
+        messages=[
+            {
+                "role": "system",
+                "content": _study_guide_prompt(class_name or 'this class', focus_prompt)
             },
             {
                 "role": "user",
-                "content": f"Create a study guide from these notes:\n\n{notes_content}"
+                "content": f"Create a study guide from these {'note summaries' if summarized else 'notes'}:\n\n{notes_content}"
             }
         ],
         temperature=0.3,
-        max_tokens=4000
+        max_tokens=_budget(notes_content, 1500, 4000, 0.8)
     )
 
+
+@cached_llm(ttl=3600)
+@with_retry(max_retries=3, base_delay=1)
+def generate_study_guide(notes_content, class_name="", focus_areas=None, summarized=False):
+    """
+    Generate a comprehensive study guide from multiple notes.
+
+    Args:
+        notes_content: Combined content from multiple notes
+        class_name: Name of the class for context
+        focus_areas: Optional list of areas to focus on
+        summarized: True if notes_content is cached note summaries rather than raw notes
+
+    Returns:
+        str: HTML-formatted study guide
+    """
+    response = _groq_call(**_study_guide_request(notes_content, class_name, focus_areas, summarized))
+
     # Sanitize HTML output to prevent XSS
     return sanitize_html(response.choices[0].message.content)
 
 
+def stream_study_guide(notes_content, class_name="", focus_areas=None, summarized=False):
+    """
+    Stream a study guide as it is generated.
+
+    Chunks are raw model output; sanitize the joined result with
+    sanitize_html before storing or rendering it as HTML.
+
+    Args:
+        notes_content: Combined content from multiple notes
+        class_name: Name of the class for context
+        focus_areas: Optional list of areas to focus on
+        summarized: True if notes_content is cached note summaries rather than raw notes
+
+    Yields:
+        str: Text chunks of the study guide in order
+    """
+    return _groq_stream(**_study_guide_request(notes_content, class_name, focus_areas, summarized))
+
+
+QUIZ_TOOL = _json_tool('emit_quiz', 'Return the generated quiz questions.', {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string", "enum": ["multiple_choice", "true_false", "short_answer"]},
+                    "question": {"type": "string"},
+                    "options": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "4 options, multiple_choice only",
+                    },
+                    "correct_answer": {
+                        "type": ["integer", "boolean", "string"],
+                        "description": "Option index (0-3), true/false, or the expected answer",
+                    },
+                    "explanation": {"type": "string"},
+                },
+                "required": ["type", "question", "correct_answer", "explanation"],
+            },
+        },
+    },
+    "required": ["questions"],
+})
+
+
+QUIZ_PROMPT = """You are a quiz generator. Generate {num_questions} quiz questions from the provided content.
+
+Question types to include: {types_str}
+
+Rules:
+1. Questions should test understanding, not just memorization
+2. Multiple choice should have 4 options with only one correct answer
+3. Include a mix of difficulty levels
+4. Explanations should be educational
+5. correct_answer for multiple_choice is the index (0-3)
+6. correct_answer for true_false is true or false
+7. correct_answer for short_answer is the expected answer"""
+
+
+@lru_cache(maxsize=32)
+def _quiz_prompt(num_questions, types_str):
+    """Quiz system prompt for a question count and type mix (built once per combination)."""
+    return QUIZ_PROMPT.format(num_questions=num_questions, types_str=types_str)
+
+
 @with_retry(max_retries=3, base_delay=1)
 def generate_quiz(text, num_questions=10, question_types=None):
     """
@@ -528,7 +1122,8 @@ def generate_quiz(text, num_questions=10, question_types=None):
     Returns:
         list: List of question dictionaries
     """
-    if not text or not text.strip():
+    text = (text or "").strip()
+    if not text:
         raise ValueError("No content to generate quiz from")
 
     if question_types is None:
@@ -536,108 +1131,183 @@ def generate_quiz(text, num_questions=10, question_types=None):
 
     types_str = ', '.join(question_types)
 
-    client = get_groq_client()
-
-    response = client.chat.completions.create(
+    response = _groq_call(
         model="llama-3.3-70b-versatile",
         messages=[
             {
                 "role": "system",
-                "content": f"""You are a quiz generator. Generate {num_questions} quiz questions from the provided content.
-
-Question types to include: {types_str}
-
-Return a JSON array of questions with this format:
-[
-  {{
-    "type": "multiple_choice",
-    "question": "What is...?",
-    "options": ["Option A", "Option B", "Option C", "Option D"],
-    "correct_answer": 0,
-    "explanation": "Brief explanation of why this is correct"
-  }},
-  {{
-    "type": "true_false",
-    "question": "Statement to evaluate",
-    "correct_answer": true,
-    "explanation": "Brief explanation"
-  }},
-  {{
-    "type": "short_answer",
-    "question": "Question requiring written response",
-    "correct_answer": "Expected key points in answer",
-    "explanation": "What a good answer should include"
-  }}
-]
-
-Rules:
-1. Questions should test understanding, not just memorization
-2. Multiple choice should have 4 options with only one correct answer
-3. Include a mix of difficulty levels
-4. Explanations should be educational
-5. correct_answer for multiple_choice is the index (0-3)
-6. correct_answer for true_false is true or false
-7. correct_answer for short_answer is the expected answer
-
-Return ONLY the JSON array, no explanations."""
+                "content": _quiz_prompt(num_questions, types_str)
             },
             {
                 "role": "user",
                 "content": f"Generate quiz questions from this content:\n\n{text}"
             }
         ],
+        tools=[QUIZ_TOOL],
+        tool_choice=_forced_tool_choice(QUIZ_TOOL),
         temperature=0.4,
         max_tokens=3000
     )
 
-    import json
-    result = response.choices[0].message.content.strip()
+    try:
+        return _tool_arguments(response.choices[0].message)['questions']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Failed to parse AI response as quiz questions")
+
+
+# Tutor context limits: at most 5 notes, ~500 tokens (~2000 chars) each
+CONTEXT_NOTE_LIMIT = 5
+CONTEXT_NOTE_TOKENS = 500
+
+# Token budget for the whole tutor prompt (system prompt, history and message)
+TUTOR_PROMPT_TOKENS = 6000
+
+
+# tiktoken BPE encoding once loaded, and when a failed load may be retried.
+# The first load downloads the BPE file, so the app warms it in the background
+# at startup (see warm_token_encoding) and requests never wait on it.
+_token_encoding_state = {'encoding': None, 'retry_at': 0.0}
+_token_encoding_lock = threading.Lock()
+TOKEN_ENCODING_RETRY_SECONDS = 300
 
-    # Clean up response if needed
-    if result.startswith('```'):
-        result = result.split('```')[1]
-        if result.startswith('json'):
-            result = result[4:]
-        result = result.strip()
 
+def _token_encoding():
+    """BPE encoding used to measure prompts, or None while it is unavailable."""
+    encoding = _token_encoding_state['encoding']
+    if encoding is not None or time.monotonic() < _token_encoding_state['retry_at']:
+        return encoding
+
+    # Another thread is loading it: estimate this call instead of waiting
+    if not _token_encoding_lock.acquire(blocking=False):
+        return None
     try:
-        questions = json.loads(result)
-        return questions
-    except json.JSONDecodeError:
-        raise ValueError("Failed to parse AI response as quiz questions")
+        if _token_encoding_state['encoding'] is None:
+            try:
+                _token_encoding_state['encoding'] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                _token_encoding_state['retry_at'] = time.monotonic() + TOKEN_ENCODING_RETRY_SECONDS
+                logger.warning("tiktoken encoding unavailable, estimating tokens as chars/4: %s", e)
+        return _token_encoding_state['encoding']
+    finally:
+        _token_encoding_lock.release()
 
 
-@with_retry(max_retries=3, base_delay=1)
-def chat_with_tutor(message, context_notes=None, conversation_history=None, class_name=None):
+def warm_token_encoding():
+    """Start loading the tiktoken encoding in a background thread."""
+    threading.Thread(target=_token_encoding, name='tiktoken-warmup', daemon=True).start()
+
+
+def count_tokens(text):
     """
-    Chat with an AI tutor about study materials.
+    Count the tokens in text (approximated as 4 chars per token without tiktoken).
 
     Args:
-        message: The user's message/question
-        context_notes: Optional list of note contents to provide context
-        conversation_history: Optional list of previous messages [{'role': 'user'|'assistant', 'content': '...'}]
-        class_name: Optional class name for context
+        text: Text to measure
 
     Returns:
-        str: The AI tutor's response
+        int: Number of tokens
     """
-    if not message or not message.strip():
-        raise ValueError("No message provided")
+    encoding = _token_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
 
-    client = get_groq_client()
 
-    # Build context from notes
-    context_prompt = ""
-    if context_notes:
-        context_prompt = "\n\nRelevant study materials:\n"
-        for i, note in enumerate(context_notes[:5], 1):  # Limit to 5 notes
-            content = note.get('content', '')[:2000]  # Limit content length
-            title = note.get('title', f'Note {i}')
-            context_prompt += f"\n--- {title} ---\n{content}\n"
+def truncate_tokens(text, max_tokens):
+    """
+    Truncate text to at most max_tokens tokens.
 
-    class_context = f" for {class_name}" if class_name else ""
+    Args:
+        text: Text to truncate
+        max_tokens: Maximum number of tokens to keep
+
+    Returns:
+        str: text, or its leading max_tokens tokens
+    """
+    # A token is at least one character, so short text always fits
+    if len(text) <= max_tokens:
+        return text
+
+    encoding = _token_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+# Assembled context prompts keyed by the prepared notes' hashes, so every turn
+# of a conversation reuses byte-identical context (keeps Groq's prefix cache warm)
+context_prompt_cache = LRUCache(maxsize=256)
+context_prompt_cache_lock = threading.Lock()
 
-    system_prompt = f"""You are a knowledgeable study assistant{class_context}. Help students understand their study materials and answer questions clearly.
+
+def prepare_context_note(title, content, max_tokens=CONTEXT_NOTE_TOKENS):
+    """
+    Truncate a note once for tutor context and fingerprint the result.
+
+    Args:
+        title: Note title shown in the context header
+        content: Plain-text note content
+        max_tokens: Maximum tokens of content to keep
+
+    Returns:
+        dict: {'title', 'content', 'sha'} ready to pass to chat_with_tutor
+    """
+    content = truncate_tokens(content or '', max_tokens)
+    sha = cache_key(title, content)
+    return {'title': title, 'content': content, 'sha': sha}
+
+
+def build_context_prompt(context_notes):
+    """
+    Build the "Relevant study materials" section of the tutor system prompt.
+
+    Args:
+        context_notes: Raw notes ({'title', 'content'}) or prepared notes
+
+    Returns:
+        str: Context prompt, served from cache when the notes are unchanged
+    """
+    prepared = [
+        note if 'sha' in note else prepare_context_note(note.get('title', f'Note {i}'), note.get('content', ''))
+        for i, note in enumerate(context_notes[:CONTEXT_NOTE_LIMIT], 1)
+    ]
+
+    cache_key = tuple(note['sha'] for note in prepared)
+    with context_prompt_cache_lock:
+        cached = context_prompt_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    parts = ["\n\nRelevant study materials:\n"]
+    parts.extend(f"\n--- {note['title']} ---\n{note['content']}\n" for note in prepared)
+    context_prompt = "".join(parts)
+    with context_prompt_cache_lock:
+        context_prompt_cache[cache_key] = context_prompt
+    return context_prompt
+
+
+# Most recent conversation messages sent to the tutor
+TUTOR_HISTORY_LIMIT = 10
+
+
+def _bounded_history(history):
+    """
+    Trim conversation history to the last TUTOR_HISTORY_LIMIT messages.
+
+    Callers that keep a deque(maxlen=TUTOR_HISTORY_LIMIT) across turns are
+    used as-is, so no copy is made per call.
+    """
+    if isinstance(history, deque) and history.maxlen is not None and history.maxlen <= TUTOR_HISTORY_LIMIT:
+        return history
+    return deque(history, maxlen=TUTOR_HISTORY_LIMIT)
+
+
+# Tutor system prompt: PREFIX + class context + GUIDELINES + notes context
+TUTOR_PROMPT_PREFIX = "You are a knowledgeable study assistant"
+TUTOR_PROMPT_GUIDELINES = """. Help students understand their study materials and answer questions clearly.
 
 Guidelines:
 - Explain concepts clearly and directly
@@ -650,23 +1320,55 @@ Important formatting rules:
 - Do NOT use emojis
 - Keep responses professional and clean
 - Use plain text formatting (bullet points with - or *)
-- Avoid excessive enthusiasm or filler phrases{context_prompt}"""
+- Avoid excessive enthusiasm or filler phrases"""
+
+
+@with_retry(max_retries=3, base_delay=1)
+def chat_with_tutor(message, context_notes=None, conversation_history=None, class_name=None):
+    """
+    Chat with an AI tutor about study materials.
+
+    Args:
+        message: The user's message/question
+        context_notes: Optional list of notes ({'title', 'content'}) or
+            prepare_context_note() results to provide context
+        conversation_history: Optional list or deque of previous messages [{'role': 'user'|'assistant', 'content': '...'}]
+        class_name: Optional class name for context
+
+    Returns:
+        str: The AI tutor's response
+    """
+    message = (message or "").strip()
+    if not message:
+        raise ValueError("No message provided")
+
+    # Build context from notes
+    context_prompt = build_context_prompt(context_notes) if context_notes else ""
+
+    class_context = f" for {class_name}" if class_name else ""
+
+    system_prompt = "".join((TUTOR_PROMPT_PREFIX, class_context, TUTOR_PROMPT_GUIDELINES, context_prompt))
 
     # Build messages
     messages = [{"role": "system", "content": system_prompt}]
 
-    # Add conversation history (limit to last 10 messages)
+    # Add conversation history (last TUTOR_HISTORY_LIMIT messages, newest
+    # first until the prompt token budget is spent)
     if conversation_history:
-        for msg in conversation_history[-10:]:
-            messages.append({
-                "role": msg.get('role', 'user'),
-                "content": msg.get('content', '')
-            })
+        remaining = TUTOR_PROMPT_TOKENS - count_tokens(system_prompt) - count_tokens(message)
+        history = []
+        for msg in reversed(_bounded_history(conversation_history)):
+            content = msg.get('content', '')
+            remaining -= count_tokens(content)
+            if remaining < 0:
+                break
+            history.append({"role": msg.get('role', 'user'), "content": content})
+        messages.extend(reversed(history))
 
     # Add current message
     messages.append({"role": "user", "content": message})
 
-    response = client.chat.completions.create(
+    response = _groq_call(
         model="llama-3.3-70b-versatile",
         messages=messages,
         temperature=0.7,
@@ -677,34 +1379,7 @@ Important formatting rules:
     return strip_emojis(response.choices[0].message.content)
 
 
-@with_retry(max_retries=3, base_delay=1)
-def grade_short_answer(question, expected_answer, user_answer):
-    """
-    Grade a short answer question using AI.
-
-    Args:
-        question: The original question
-        expected_answer: The expected/correct answer
-        user_answer: The student's answer
-
-    Returns:
-        dict: {'score': 0-100, 'feedback': str, 'is_correct': bool}
-    """
-    if not user_answer or not user_answer.strip():
-        return {
-            'score': 0,
-            'feedback': 'No answer provided.',
-            'is_correct': False
-        }
-
-    client = get_groq_client()
-
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are an expert grader. Grade the student's answer to the question.
+GRADER_PROMPT = """You are an expert grader. Grade the student's answer to the question.
 
 Compare the student's answer to the expected answer and provide:
 1. A score from 0-100
@@ -712,77 +1387,147 @@ Compare the student's answer to the expected answer and provide:
 3. Whether the answer is essentially correct (true/false)
 
 Consider partial credit for partially correct answers.
-Be fair but not overly strict - focus on understanding of key concepts.
-
-Return ONLY a JSON object in this format:
-{"score": 85, "feedback": "Good explanation of the concept, but missed X detail.", "is_correct": true}
-
-No explanations outside the JSON."""
-            },
-            {
-                "role": "user",
-                "content": f"""Question: {question}
+Be fair but not overly strict - focus on understanding of key concepts."""
+
+GRADE_TOOL = _json_tool('emit_grade', 'Return the grade for the student answer.', {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 0, "maximum": 100},
+        "feedback": {"type": "string", "description": "Brief feedback explaining the score"},
+        "is_correct": {"type": "boolean", "description": "Whether the answer is essentially correct"},
+    },
+    "required": ["score", "feedback", "is_correct"],
+})
+
+NO_ANSWER_GRADE = {'score': 0, 'feedback': 'No answer provided.', 'is_correct': False}
+FAILED_GRADE = {'score': 0, 'feedback': 'Could not evaluate answer.', 'is_correct': False}
+
+
+def _grading_messages(question, expected_answer, user_answer):
+    """Build the chat messages for grading one short answer."""
+    return [
+        {"role": "system", "content": GRADER_PROMPT},
+        {
+            "role": "user",
+            "content": f"""Question: {question}
 
 Expected Answer: {expected_answer}
 
 Student's Answer: {user_answer}
 
 Grade this answer:"""
-            }
-        ],
-        temperature=0.2,
-        max_tokens=300
-    )
-
-    import json
-    result = response.choices[0].message.content.strip()
+        }
+    ]
 
-    # Clean up response if needed
-    if result.startswith('```'):
-        result = result.split('```')[1]
-        if result.startswith('json'):
-            result = result[4:]
-        result = result.strip()
 
+def _parse_grading(message, expected_answer, user_answer):
+    """Parse the grader's structured reply, falling back to simple matching."""
     try:
-        grading = json.loads(result)
+        grading = _tool_arguments(message)
         return {
             'score': grading.get('score', 0),
             'feedback': grading.get('feedback', ''),
             'is_correct': grading.get('is_correct', False)
         }
-    except json.JSONDecodeError:
+    except (ValueError, AttributeError):
         # Fallback to simple matching if AI fails
         if user_answer.lower().strip() in expected_answer.lower():
             return {'score': 80, 'feedback': 'Answer appears correct.', 'is_correct': True}
-        return {'score': 0, 'feedback': 'Could not evaluate answer.', 'is_correct': False}
+        return dict(FAILED_GRADE)
 
 
 @with_retry(max_retries=3, base_delay=1)
-def extract_image_info(image_data, image_type="image/png", extraction_type="text"):
+def grade_short_answer(question, expected_answer, user_answer):
     """
-    Extract information from an image using Groq's vision model.
+    Grade a short answer question using AI.
 
     Args:
-        image_data: Base64 encoded image data or raw bytes
-        image_type: MIME type of the image (e.g., 'image/png', 'image/jpeg')
-        extraction_type: Type of extraction - 'notes', 'text', 'summary', 'flashcards'
+        question: The original question
+        expected_answer: The expected/correct answer
+        user_answer: The student's answer
 
     Returns:
-        str: Extracted information formatted appropriately
+        dict: {'score': 0-100, 'feedback': str, 'is_correct': bool}
     """
-    if not image_data:
-        raise ValueError("No image data provided")
+    user_answer = (user_answer or "").strip()
+    if not user_answer:
+        return dict(NO_ANSWER_GRADE)
+
+    response = _groq_call(
+        model="llama-3.3-70b-versatile",
+        messages=_grading_messages(question, expected_answer, user_answer),
+        tools=[GRADE_TOOL],
+        tool_choice=_forced_tool_choice(GRADE_TOOL),
+        temperature=0.2,
+        max_tokens=300
+    )
+
+    return _parse_grading(response.choices[0].message, expected_answer, user_answer)
 
-    client = get_groq_client()
 
-    # Ensure image_data is base64 encoded string
-    if isinstance(image_data, bytes):
-        image_data = base64.b64encode(image_data).decode('utf-8')
+@with_retry_async(max_retries=3, base_delay=1)
+async def agrade_short_answer(question, expected_answer, user_answer, clients=None):
+    """
+    Async variant of grade_short_answer for grading many answers concurrently.
+
+    Args:
+        question: The original question
+        expected_answer: The expected/correct answer
+        user_answer: The student's answer
+        clients: Optional async_groq_clients dict to share across a batch
 
-    # Define extraction prompts based on type
-    prompts = {
-        'text': """Extract all text from this image exactly as it appears.
+    Returns:
+        dict: {'score': 0-100, 'feedback': str, 'is_correct': bool}
+    """
+    user_answer = (user_answer or "").strip()
+    if not user_answer:
+        return dict(NO_ANSWER_GRADE)
+
+    response = await _async_groq_call(
+        clients,
+        model="llama-3.3-70b-versatile",
+        messages=_grading_messages(question, expected_answer, user_answer),
+        tools=[GRADE_TOOL],
+        tool_choice=_forced_tool_choice(GRADE_TOOL),
+        temperature=0.2,
+        max_tokens=300
+    )
+
+    return _parse_grading(response.choices[0].message, expected_answer, user_answer)
+
+
+async def grade_quiz(graded_items):
+    """
+    Grade several short answers concurrently instead of one round trip at a time.
+
+    Args:
+        graded_items: List of (question, expected_answer, user_answer) tuples
+
+    Returns:
+        list: Grading dicts in the same order as graded_items; None for items
+            whose grading call failed, so the caller can fall back per item
+    """
+    if not graded_items:
+        return []
+
+    semaphore = asyncio.Semaphore(ASYNC_CONCURRENCY)
+
+    async with async_groq_clients() as clients:
+        async def grade_one(item):
+            async with semaphore:
+                return await agrade_short_answer(*item, clients=clients)
+
+        results = await asyncio.gather(
+            *(grade_one(item) for item in graded_items),
+            return_exceptions=True
+        )
+
+    return [None if isinstance(r, BaseException) else r for r in results]
+
+
+# Vision prompts for extract_image_info, by extraction type
+IMAGE_EXTRACTION_PROMPTS = {
+    'text': """Extract all text from this image exactly as it appears.
 
 Include:
 - All visible text, including headers, body text, captions
@@ -791,7 +1536,7 @@ Include:
 
 Preserve the original formatting and structure as much as possible.""",
 
-        'summary': """Analyze this image and provide a concise summary of its content.
+    'summary': """Analyze this image and provide a concise summary of its content.
 
 Include:
 - Main topic or subject
@@ -800,11 +1545,33 @@ Include:
 - Brief description of any visual elements
 
 Keep the summary clear and scannable."""
-    }
+}
+
 
-    prompt = prompts.get(extraction_type, prompts['text'])
+@with_retry(max_retries=3, base_delay=1)
+def extract_image_info(image_data, image_type="image/png", extraction_type="text"):
+    """
+    Extract information from an image using Groq's vision model.
+
+    Args:
+        image_data: Base64 encoded image data or raw bytes
+        image_type: MIME type of the image (e.g., 'image/png', 'image/jpeg')
+        extraction_type: Type of extraction - 'notes', 'text', 'summary', 'flashcards'
+
+    Returns:
+        str: Extracted information formatted appropriately
+    """
+    if not image_data:
+        raise ValueError("No image data provided")
 
-    response = client.chat.completions.create(
+    # Raw bytes are encoded once, straight to an ASCII string
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        image_data = binascii.b2a_base64(image_data, newline=False).decode('ascii')
+    data_url = f"data:{image_type};base64,{image_data}"
+
+    prompt = IMAGE_EXTRACTION_PROMPTS.get(extraction_type, IMAGE_EXTRACTION_PROMPTS['text'])
+
+    response = _groq_call(
         model="meta-llama/llama-4-scout-17b-16e-instruct",
         messages=[
             {
@@ -817,7 +1584,7 @@ Keep the summary clear and scannable."""
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:{image_type};base64,{image_data}"
+                            "url": data_url
                         }
                     }
                 ]
@@ -831,26 +1598,38 @@ Keep the summary clear and scannable."""
 
 
 @with_retry(max_retries=3, base_delay=1)
-def transcribe_audio(audio_file, filename, language=None):
+def transcribe_audio(audio_file, filename, language=None, need_segments=False):
     """
     Transcribe audio using Groq Whisper API.
 
     Args:
-        audio_file: File-like object or bytes of the audio
+        audio_file: Seekable file-like object (preferred) or bytes of the audio
         filename: Original filename (used for format detection)
         language: Optional language code (e.g., 'en', 'es'). Auto-detects if None.
+        need_segments: Request verbose_json for 'segments' and 'duration';
+            otherwise the smaller plain json response (text only) is used
 
     Returns:
-        dict: Contains 'text' (transcription) and optionally 'segments' (timestamped chunks)
+        dict: Contains 'text' (transcription), plus 'segments' (timestamped
+            chunks) and 'duration' when need_segments is True
     """
-    client = get_groq_client()
+    # Upload from a file handle so the SDK streams it instead of holding a copy
+    if isinstance(audio_file, (bytes, bytearray)):
+        audio_file = io.BytesIO(audio_file)
+
+    def transcribe(client):
+        audio_file.seek(0)  # Rewind when a retry or key failover re-sends the file
+        return client.audio.transcriptions.create(
+            file=(filename, audio_file),
+            model="whisper-large-v3-turbo",
+            response_format="verbose_json" if need_segments else "json",
+            language=language
+        )
 
-    transcription = client.audio.transcriptions.create(
-        file=(filename, audio_file),
-        model="whisper-large-v3-turbo",
-        response_format="verbose_json",
-        language=language
-    )
+    transcription = _with_key_pool(transcribe)
+
+    if not need_segments:
+        return {'text': transcription.text}
 
     return {
         'text': transcription.text,
@@ -873,7 +1652,6 @@ def extract_text_from_document(file_bytes, is_pdf=True):
     """
     if is_pdf:
         # Extract text from PDF using PyPDF2
-        import io
         from PyPDF2 import PdfReader
 
         pdf_file = io.BytesIO(file_bytes)
@@ -892,8 +1670,7 @@ def extract_text_from_document(file_bytes, is_pdf=True):
         extracted_text = "\n\n".join(text_parts)
 
         # Use AI to clean up and structure the text
-        client = get_groq_client()
-        response = client.chat.completions.create(
+        response = _groq_call(
             model="llama-3.3-70b-versatile",
             messages=[{
                 "role": "user",
@@ -915,8 +1692,7 @@ Extracted text:
         }
     else:
         # Extract text from image using vision model
-        image_data = base64.b64encode(file_bytes).decode('utf-8')
-        extracted_text = extract_image_info(image_data, extraction_type='text')
+        extracted_text = extract_image_info(file_bytes, extraction_type='text')
 
         return {
             'text': extracted_text,
@@ -1,10 +1,21 @@
 """AI Usage Service - Track and limit AI API usage per user."""
 
+import queue
+import os
+import atexit
+import logging
+import threading
+import time
 from datetime import datetime, timedelta
 from functools import wraps
+import pymysql
+from cachetools import TTLCache
 from flask import session, jsonify
+from app.db_connect import get_db_config
 
 
+logger = logging.getLogger(__name__)
+
 # Default limits (can be overridden by tier)
 DEFAULT_LIMITS = {
     'hourly': 50,       # Max AI calls per hour
@@ -12,6 +23,29 @@ DEFAULT_LIMITS = {
     'tokens_daily': 100000,  # Max tokens per day
 }
 
+# Usage logs are queued per request and inserted in batches by one background thread
+USAGE_LOG_BATCH_SIZE = 500
+USAGE_LOG_FLUSH_INTERVAL = 0.2  # seconds
+
+# Optional retention for raw logs (history is also rolled up in
+# ai_usage_daily). When set to a positive number of days, the writer prunes
+# older rows once an hour; unset or 0 keeps every row.
+USAGE_LOG_RETENTION_DAYS = int(os.environ.get('USAGE_LOG_RETENTION_DAYS') or 0)
+USAGE_LOG_PRUNE_INTERVAL = 3600  # seconds
+USAGE_LOG_PRUNE_BATCH_SIZE = 5000
+_usage_log_queue = queue.Queue(maxsize=10000)
+_usage_log_thread = None
+_usage_log_thread_lock = threading.Lock()
+
+# Subscription tier per user_id (tiers change rarely; 5-minute TTL)
+tier_cache = TTLCache(maxsize=10000, ttl=300)
+tier_cache_lock = threading.Lock()
+
+# Hourly/daily usage per user_id, read from SQL at most every 30 seconds and
+# bumped in-process by each successful call logged in between
+usage_window_cache = TTLCache(maxsize=10000, ttl=30)
+usage_window_cache_lock = threading.Lock()
+
 # Tier-specific limits
 TIER_LIMITS = {
     'free': {
@@ -33,7 +67,12 @@ TIER_LIMITS = {
 
 
 def get_user_tier(user_id):
-    """Get the subscription tier for a user."""
+    """Get the subscription tier for a user (cached for 5 minutes)."""
+    with tier_cache_lock:
+        tier = tier_cache.get(int(user_id))
+    if tier is not None:
+        return tier
+
     from app.db_connect import get_db
     db = get_db()
 
@@ -43,17 +82,160 @@ def get_user_tier(user_id):
     sub = cursor.fetchone()
 
     if not sub or sub['status'] != 'active':
-        return 'free'
+        tier = 'free'
+    else:
+        tier = sub['plan'] if sub['plan'] in TIER_LIMITS else 'free'
+
+    with tier_cache_lock:
+        tier_cache[int(user_id)] = tier
+    return tier
+
+
+def invalidate_user_tier(user_id=None):
+    """
+    Drop a cached subscription tier after the subscription changes.
+
+    Args:
+        user_id: User whose tier changed, or None to clear every cached tier
+    """
+    with tier_cache_lock:
+        if user_id is None:
+            tier_cache.clear()
+        else:
+            tier_cache.pop(int(user_id), None)
 
-    return sub['plan'] if sub['plan'] in TIER_LIMITS else 'free'
+
+def _drain_usage_logs(max_rows, timeout):
+    """Take up to max_rows queued log rows, waiting up to timeout for the first."""
+    try:
+        rows = [_usage_log_queue.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while len(rows) < max_rows:
+        try:
+            rows.append(_usage_log_queue.get_nowait())
+        except queue.Empty:
+            break
+    return rows
+
+
+def _daily_rollup(rows):
+    """Aggregate log rows into ai_usage_daily deltas keyed by (day, user_id, endpoint)."""
+    totals = {}
+    for user_id, endpoint, tokens_used, _, success, _, created_at in rows:
+        key = (created_at.date(), user_id, endpoint)
+        requests, tokens, successes, failures = totals.get(key, (0, 0, 0, 0))
+        totals[key] = (requests + 1, tokens + (tokens_used or 0), successes + success, failures + (1 - success))
+    return [key + values for key, values in totals.items()]
+
+
+def _write_usage_logs(conn, rows):
+    """Insert queued log rows and their daily rollup in one transaction."""
+    with conn.cursor() as cursor:
+        cursor.executemany('''
+            INSERT INTO ai_usage_logs (user_id, endpoint, tokens_used, model, success, error_message, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ''', rows)
+        cursor.executemany('''
+            INSERT INTO ai_usage_daily (day, user_id, endpoint, requests, tokens, successes, failures)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                requests = requests + VALUES(requests),
+                tokens = tokens + VALUES(tokens),
+                successes = successes + VALUES(successes),
+                failures = failures + VALUES(failures)
+        ''', _daily_rollup(rows))
+    conn.commit()
+
+
+def _prune_usage_logs(conn):
+    """
+    Delete raw usage logs older than USAGE_LOG_RETENTION_DAYS.
+
+    Rows are removed in small batches (walking idx_ai_usage_created_at) so
+    each DELETE holds its locks only briefly.
+
+    Returns:
+        int: Number of rows deleted
+    """
+    cutoff = datetime.utcnow() - timedelta(days=USAGE_LOG_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        with conn.cursor() as cursor:
+            count = cursor.execute(
+                'DELETE FROM ai_usage_logs WHERE created_at < %s LIMIT %s',
+                (cutoff, USAGE_LOG_PRUNE_BATCH_SIZE)
+            )
+        conn.commit()
+        deleted += count
+        if count < USAGE_LOG_PRUNE_BATCH_SIZE:
+            return deleted
+
+
+def _usage_log_worker():
+    """Background loop writing queued usage logs in batches on its own connection."""
+    conn = None
+    next_prune = time.monotonic()
+    while True:
+        rows = _drain_usage_logs(USAGE_LOG_BATCH_SIZE, USAGE_LOG_FLUSH_INTERVAL)
+        prune_due = USAGE_LOG_RETENTION_DAYS > 0 and time.monotonic() >= next_prune
+        if not rows and not prune_due:
+            continue
+        try:
+            if conn is None:
+                conn = pymysql.connect(**get_db_config())
+            if rows:
+                _write_usage_logs(conn, rows)
+            if prune_due:
+                next_prune = time.monotonic() + USAGE_LOG_PRUNE_INTERVAL
+                _prune_usage_logs(conn)
+        except Exception:
+            # Log failure shouldn't break the main flow; reconnect next batch
+            logger.exception("Failed to log AI usage (%d rows)", len(rows))
+            try:
+                conn.close()
+            except Exception:
+                pass
+            conn = None
+
+
+def _ensure_usage_log_worker():
+    """Start the usage log writer thread on first use (once per process)."""
+    global _usage_log_thread
+    if _usage_log_thread is not None:
+        return
+    with _usage_log_thread_lock:
+        if _usage_log_thread is None:
+            _usage_log_thread = threading.Thread(target=_usage_log_worker, name='ai-usage-log', daemon=True)
+            _usage_log_thread.start()
+
+
+@atexit.register
+def flush_usage_logs():
+    """Write any queued usage logs synchronously (runs at interpreter exit)."""
+    rows = _drain_usage_logs(_usage_log_queue.maxsize, 0)
+    if not rows:
+        return
+    try:
+        conn = pymysql.connect(**get_db_config())
+        try:
+            _write_usage_logs(conn, rows)
+        finally:
+            conn.close()
+    except Exception:
+        logger.exception("Failed to flush AI usage logs (%d rows)", len(rows))
 
 
 def log_ai_usage(db, user_id, endpoint, tokens_used=0, model=None, success=True, error_message=None):
     """
-    Log an AI API call to the database.
+    Queue an AI API call for logging to the database.
+
+    Rows are written in batches by a background thread (every
+    USAGE_LOG_FLUSH_INTERVAL seconds or USAGE_LOG_BATCH_SIZE rows), so the
+    request never waits on the INSERT.
 
     Args:
-        db: Database connection
+        db: Database connection (unused; kept for existing callers)
         user_id: The user making the request
         endpoint: Name of the AI endpoint (e.g., 'summarize', 'chat', 'flashcards')
         tokens_used: Number of tokens consumed (if available)
@@ -61,15 +243,16 @@ def log_ai_usage(db, user_id, endpoint, tokens_used=0, model=None, success=True,
         success: Whether the call was successful
         error_message: Error message if failed
     """
+    _ensure_usage_log_worker()
+    if success:
+        _record_usage(user_id, tokens_used)
     try:
-        db.execute('''
-            INSERT INTO ai_usage_logs (user_id, endpoint, tokens_used, model, success, error_message)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (user_id, endpoint, tokens_used, model, 1 if success else 0, error_message))
-        db.commit()
-    except Exception as e:
+        _usage_log_queue.put_nowait(
+            (user_id, endpoint, tokens_used, model, 1 if success else 0, error_message, datetime.utcnow())
+        )
+    except queue.Full:
         # Log failure shouldn't break the main flow
-        print(f"Failed to log AI usage: {e}")
+        logger.warning("Failed to log AI usage: log queue is full")
 
 
 def get_usage_stats(db, user_id, period='day'):
@@ -102,6 +285,59 @@ def get_usage_stats(db, user_id, period='day'):
     }
 
 
+def get_usage_window(db, user_id):
+    """
+    Get hourly and daily AI usage for a user in a single query.
+
+    Both windows are aggregated in one pass over the user's last day of
+    successful calls (served by idx_ai_usage_user_date). The result is cached
+    for 30 seconds and kept current by _record_usage, so back-to-back AI calls
+    skip the query; calls made through other workers within that window are
+    picked up on the next refresh.
+
+    Args:
+        db: Database connection
+        user_id: The user to check
+
+    Returns:
+        dict with hourly_calls, daily_calls and daily_tokens
+    """
+    with usage_window_cache_lock:
+        cached = usage_window_cache.get(int(user_id))
+        if cached is not None:
+            return dict(cached)
+
+    now = datetime.utcnow()
+
+    cursor = db.execute('''
+        SELECT COALESCE(SUM(created_at >= %s), 0) as hourly_calls,
+               COUNT(*) as daily_calls,
+               COALESCE(SUM(tokens_used), 0) as daily_tokens
+        FROM ai_usage_logs
+        WHERE user_id = %s AND created_at >= %s AND success = 1
+    ''', (now - timedelta(hours=1), user_id, now - timedelta(days=1)))
+    result = cursor.fetchone()
+
+    usage = {
+        'hourly_calls': int(result['hourly_calls']) if result else 0,
+        'daily_calls': int(result['daily_calls']) if result else 0,
+        'daily_tokens': int(result['daily_tokens']) if result else 0,
+    }
+    with usage_window_cache_lock:
+        usage_window_cache[int(user_id)] = usage
+    return dict(usage)
+
+
+def _record_usage(user_id, tokens_used):
+    """Count a successful call against the user's cached usage window, if any."""
+    with usage_window_cache_lock:
+        usage = usage_window_cache.get(int(user_id))
+        if usage is not None:
+            usage['hourly_calls'] += 1
+            usage['daily_calls'] += 1
+            usage['daily_tokens'] += tokens_used or 0
+
+
 def check_usage_limit(db, user_id, tier='free'):
     """
     Check if user is within their usage limits.
@@ -115,19 +351,18 @@ def check_usage_limit(db, user_id, tier='free'):
         tuple: (is_allowed, message)
     """
     limits = TIER_LIMITS.get(tier, DEFAULT_LIMITS)
+    usage = get_usage_window(db, user_id)
 
     # Check hourly limit
-    hourly_stats = get_usage_stats(db, user_id, 'hour')
-    if hourly_stats['call_count'] >= limits['hourly']:
+    if usage['hourly_calls'] >= limits['hourly']:
         return False, f"Hourly AI limit reached ({limits['hourly']} calls/hour). Please try again later."
 
     # Check daily limit
-    daily_stats = get_usage_stats(db, user_id, 'day')
-    if daily_stats['call_count'] >= limits['daily']:
+    if usage['daily_calls'] >= limits['daily']:
         return False, f"Daily AI limit reached ({limits['daily']} calls/day). Limits reset at midnight UTC."
 
     # Check token limit
-    if daily_stats['tokens_used'] >= limits['tokens_daily']:
+    if usage['daily_tokens'] >= limits['tokens_daily']:
         return False, f"Daily token limit reached. Please try again tomorrow."
 
     return True, None
@@ -141,14 +376,12 @@ def get_remaining_usage(db, user_id, tier='free'):
         dict with remaining calls and tokens
     """
     limits = TIER_LIMITS.get(tier, DEFAULT_LIMITS)
-
-    hourly_stats = get_usage_stats(db, user_id, 'hour')
-    daily_stats = get_usage_stats(db, user_id, 'day')
+    usage = get_usage_window(db, user_id)
 
     return {
-        'hourly_remaining': max(0, limits['hourly'] - hourly_stats['call_count']),
-        'daily_remaining': max(0, limits['daily'] - daily_stats['call_count']),
-        'tokens_remaining': max(0, limits['tokens_daily'] - daily_stats['tokens_used']),
+        'hourly_remaining': max(0, limits['hourly'] - usage['hourly_calls']),
+        'daily_remaining': max(0, limits['daily'] - usage['daily_calls']),
+        'tokens_remaining': max(0, limits['tokens_daily'] - usage['daily_tokens']),
         'hourly_limit': limits['hourly'],
         'daily_limit': limits['daily'],
         'token_limit': limits['tokens_daily'],
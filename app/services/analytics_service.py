@@ -1,7 +1,12 @@
 """Analytics Service - AI cost monitoring and retention analytics."""
 
+import threading
+from bisect import bisect_left
 from datetime import date, datetime, timedelta
-from app.db_connect import get_db
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from app.db_connect import get_db, pooled_connection
 
 # Estimated token costs (per 1M tokens, in USD)
 AI_COST_RATES = {
@@ -20,64 +25,171 @@ AI_COST_RATES = {
 }
 
 
+# Dashboard aggregates are recomputed at most every 10 minutes
+ANALYTICS_CACHE_TTL = 600
+
+
+# Upper bound (inclusive) of each streak range; longer streaks fall in the last
+STREAK_BUCKETS = (
+    (0, '0 days'),
+    (3, '1-3 days'),
+    (7, '4-7 days'),
+    (14, '8-14 days'),
+    (30, '15-30 days'),
+)
+STREAK_BUCKET_BOUNDS = [bound for bound, _ in STREAK_BUCKETS]
+STREAK_BUCKET_LABELS = [label for _, label in STREAK_BUCKETS] + ['30+ days']
+
+
+def _bucket_streaks(rows):
+    """
+    Fold per-streak-length counts into the dashboard's streak ranges.
+
+    Args:
+        rows: Rows with 'current_streak' and 'users' keys
+
+    Returns:
+        list: {'streak_range', 'users'} dicts for non-empty ranges, shortest first
+    """
+    counts = [0] * len(STREAK_BUCKET_LABELS)
+    for row in rows:
+        streak = row['current_streak']
+        index = len(STREAK_BUCKET_BOUNDS) if streak is None else bisect_left(STREAK_BUCKET_BOUNDS, streak)
+        counts[index] += row['users']
+    return [
+        {'streak_range': label, 'users': users}
+        for label, users in zip(STREAK_BUCKET_LABELS, counts) if users
+    ]
+
+
+def cached_metrics(ttl=ANALYTICS_CACHE_TTL):
+    """
+    Decorator caching an analytics function's result per argument set.
+
+    Admin pages read these aggregates on every load; they are shared across
+    requests until the TTL expires. Exposes wrapper.cache_clear().
+
+    Args:
+        ttl: Seconds a computed result stays valid
+    """
+    def decorator(func):
+        cache = TTLCache(maxsize=32, ttl=ttl)
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            with lock:
+                cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+            result = func(*args, **kwargs)
+            with lock:
+                cache[key] = result
+            return result
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+
+# Independent dashboard queries run side by side, each on its own pooled connection
+analytics_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='analytics')
+
+
+def _fetch_all(query, params):
+    """Run one read-only query on a pooled connection and return all rows."""
+    with pooled_connection() as db:
+        return db.execute(query, params).fetchall()
+
+
+def _fetch_concurrently(*queries):
+    """
+    Run independent read-only queries concurrently.
+
+    Wall-clock time is that of the slowest query rather than the sum of all.
+    Only use for queries that share no transaction state.
+
+    Args:
+        *queries: (query, params) pairs
+
+    Returns:
+        list: Each query's fetchall() rows, in argument order
+    """
+    futures = [analytics_executor.submit(_fetch_all, query, params) for query, params in queries]
+    return [future.result() for future in futures]
+
+
+def _day_start(day):
+    """Midnight at the start of a date, for index-friendly created_at range filters."""
+    return datetime.combine(day, datetime.min.time())
+
+
+@cached_metrics()
 def get_ai_usage_stats(days=30):
     """Get AI usage statistics for the past N days."""
-    db = get_db()
     start_date = date.today() - timedelta(days=days)
 
-    # Total requests and tokens
-    cursor = db.execute('''
-        SELECT
-            COUNT(*) as total_requests,
-            COALESCE(SUM(tokens_used), 0) as total_tokens,
-            SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_requests,
-            SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) as failed_requests
-        FROM ai_usage_logs
-        WHERE DATE(created_at) >= %s
-    ''', (start_date,))
-    totals = cursor.fetchone()
-
-    # Daily usage breakdown
-    cursor = db.execute('''
-        SELECT
-            DATE(created_at) as date,
-            COUNT(*) as requests,
-            COALESCE(SUM(tokens_used), 0) as tokens
-        FROM ai_usage_logs
-        WHERE DATE(created_at) >= %s
-        GROUP BY DATE(created_at)
-        ORDER BY date
-    ''', (start_date,))
-    daily_usage = cursor.fetchall()
-
-    # Usage by endpoint
-    cursor = db.execute('''
-        SELECT
-            endpoint,
-            COUNT(*) as requests,
-            COALESCE(SUM(tokens_used), 0) as tokens
-        FROM ai_usage_logs
-        WHERE DATE(created_at) >= %s
-        GROUP BY endpoint
-        ORDER BY requests DESC
-    ''', (start_date,))
-    by_endpoint = cursor.fetchall()
-
-    # Top users by usage
-    cursor = db.execute('''
-        SELECT
-            u.username,
-            u.email,
-            COUNT(a.id) as requests,
-            COALESCE(SUM(a.tokens_used), 0) as tokens
-        FROM ai_usage_logs a
-        JOIN users u ON a.user_id = u.id
-        WHERE DATE(a.created_at) >= %s
-        GROUP BY a.user_id
-        ORDER BY tokens DESC
-        LIMIT 20
-    ''', (start_date,))
-    top_users = cursor.fetchall()
+    # All figures come from the ai_usage_daily rollup (one row per day,
+    # user and endpoint) rather than raw ai_usage_logs
+
+    totals, daily_usage, by_endpoint, top_users = _fetch_concurrently(
+        # Total requests and tokens
+        ('''
+            SELECT
+                CAST(COALESCE(SUM(requests), 0) AS SIGNED) as total_requests,
+                CAST(COALESCE(SUM(tokens), 0) AS SIGNED) as total_tokens,
+                CAST(COALESCE(SUM(successes), 0) AS SIGNED) as successful_requests,
+                CAST(COALESCE(SUM(failures), 0) AS SIGNED) as failed_requests
+            FROM ai_usage_daily
+            WHERE day >= %s
+        ''', (start_date,)),
+
+        # Daily usage breakdown
+        ('''
+            SELECT
+                day as date,
+                CAST(SUM(requests) AS SIGNED) as requests,
+                CAST(SUM(tokens) AS SIGNED) as tokens
+            FROM ai_usage_daily
+            WHERE day >= %s
+            GROUP BY day
+            ORDER BY day
+        ''', (start_date,)),
+
+        # Usage by endpoint
+        ('''
+            SELECT
+                endpoint,
+                CAST(SUM(requests) AS SIGNED) as requests,
+                CAST(SUM(tokens) AS SIGNED) as tokens
+            FROM ai_usage_daily
+            WHERE day >= %s
+            GROUP BY endpoint
+            ORDER BY requests DESC
+        ''', (start_date,)),
+
+        # Top users by usage
+        ('''
+            SELECT
+                u.username,
+                u.email,
+                CAST(SUM(d.requests) AS SIGNED) as requests,
+                CAST(SUM(d.tokens) AS SIGNED) as tokens
+            FROM ai_usage_daily d
+            JOIN users u ON d.user_id = u.id
+            WHERE d.day >= %s
+            GROUP BY d.user_id
+            ORDER BY tokens DESC
+            LIMIT 20
+        ''', (start_date,))
+    )
+    totals = totals[0]
 
     # Calculate estimated cost
     total_tokens = totals['total_tokens'] or 0
@@ -101,45 +213,39 @@ def get_ai_usage_stats(days=30):
     }
 
 
+@cached_metrics()
 def get_ai_cost_per_user():
     """Calculate AI cost per active user and per Pro user."""
     db = get_db()
     thirty_days_ago = date.today() - timedelta(days=30)
 
-    # Get total tokens used
-    cursor = db.execute('''
-        SELECT COALESCE(SUM(tokens_used), 0) as total_tokens
-        FROM ai_usage_logs
-        WHERE DATE(created_at) >= %s
-    ''', (thirty_days_ago,))
-    total_tokens = cursor.fetchone()['total_tokens'] or 0
-
-    # Get active users count (users who have used AI features)
-    cursor = db.execute('''
-        SELECT COUNT(DISTINCT user_id) as active_users
-        FROM ai_usage_logs
-        WHERE DATE(created_at) >= %s
-    ''', (thirty_days_ago,))
-    active_users = cursor.fetchone()['active_users'] or 0
-
-    # Get Pro users count
-    cursor = db.execute('''
-        SELECT COUNT(DISTINCT user_id) as pro_users
-        FROM subscriptions
-        WHERE status = 'active' AND plan IN ('pro_monthly', 'pro_yearly', 'pro_referral')
-    ''')
-    pro_users = cursor.fetchone()['pro_users'] or 0
-
-    # Get Pro user tokens
+    # Total tokens and AI-active users in one scan of the daily rollup,
+    # Pro figures as subqueries
     cursor = db.execute('''
-        SELECT COALESCE(SUM(a.tokens_used), 0) as tokens
-        FROM ai_usage_logs a
-        JOIN subscriptions s ON a.user_id = s.user_id
-        WHERE DATE(a.created_at) >= %s
-        AND s.status = 'active'
-        AND s.plan IN ('pro_monthly', 'pro_yearly', 'pro_referral')
-    ''', (thirty_days_ago,))
-    pro_tokens = cursor.fetchone()['tokens'] or 0
+        SELECT
+            COALESCE(SUM(tokens), 0) as total_tokens,
+            COUNT(DISTINCT user_id) as active_users,
+            (
+                SELECT COUNT(DISTINCT user_id)
+                FROM subscriptions
+                WHERE status = 'active' AND plan IN ('pro_monthly', 'pro_yearly', 'pro_referral')
+            ) as pro_users,
+            (
+                SELECT COALESCE(SUM(d.tokens), 0)
+                FROM ai_usage_daily d
+                JOIN subscriptions s ON d.user_id = s.user_id
+                WHERE d.day >= %s
+                AND s.status = 'active'
+                AND s.plan IN ('pro_monthly', 'pro_yearly', 'pro_referral')
+            ) as pro_tokens
+        FROM ai_usage_daily
+        WHERE day >= %s
+    ''', (thirty_days_ago, thirty_days_ago))
+    row = cursor.fetchone()
+    total_tokens = int(row['total_tokens'] or 0)
+    active_users = row['active_users'] or 0
+    pro_users = row['pro_users'] or 0
+    pro_tokens = int(row['pro_tokens'] or 0)
 
     # Calculate costs
     rate = AI_COST_RATES['default']
@@ -158,6 +264,7 @@ def get_ai_cost_per_user():
     }
 
 
+@cached_metrics()
 def get_retention_metrics():
     """Calculate user retention metrics."""
     db = get_db()
@@ -167,71 +274,55 @@ def get_retention_metrics():
     cohort_7_start = today - timedelta(days=14)
     cohort_7_end = today - timedelta(days=7)
 
-    cursor = db.execute('''
-        SELECT COUNT(*) as cohort_size
-        FROM users
-        WHERE DATE(created_at) >= %s AND DATE(created_at) < %s
-    ''', (cohort_7_start, cohort_7_end))
-    cohort_7_size = cursor.fetchone()['cohort_size'] or 0
-
-    cursor = db.execute('''
-        SELECT COUNT(DISTINCT u.id) as retained
-        FROM users u
-        WHERE DATE(u.created_at) >= %s AND DATE(u.created_at) < %s
-        AND EXISTS (
-            SELECT 1 FROM study_sessions s
-            WHERE s.user_id = u.id AND DATE(s.created_at) >= %s
-        )
-    ''', (cohort_7_start, cohort_7_end, cohort_7_end))
-    retained_7 = cursor.fetchone()['retained'] or 0
-
     # 30-day retention: users who signed up 30-60 days ago and were active in last 30 days
     cohort_30_start = today - timedelta(days=60)
     cohort_30_end = today - timedelta(days=30)
 
-    cursor = db.execute('''
-        SELECT COUNT(*) as cohort_size
-        FROM users
-        WHERE DATE(created_at) >= %s AND DATE(created_at) < %s
-    ''', (cohort_30_start, cohort_30_end))
-    cohort_30_size = cursor.fetchone()['cohort_size'] or 0
-
-    cursor = db.execute('''
-        SELECT COUNT(DISTINCT u.id) as retained
-        FROM users u
-        WHERE DATE(u.created_at) >= %s AND DATE(u.created_at) < %s
-        AND EXISTS (
-            SELECT 1 FROM study_sessions s
-            WHERE s.user_id = u.id AND DATE(s.created_at) >= %s
-        )
-    ''', (cohort_30_start, cohort_30_end, cohort_30_end))
-    retained_30 = cursor.fetchone()['retained'] or 0
-
-    # Daily active users (DAU)
-    cursor = db.execute('''
-        SELECT COUNT(DISTINCT user_id) as dau
-        FROM study_sessions
-        WHERE DATE(created_at) = %s
-    ''', (today,))
-    dau = cursor.fetchone()['dau'] or 0
-
-    # Weekly active users (WAU)
     week_ago = today - timedelta(days=7)
-    cursor = db.execute('''
-        SELECT COUNT(DISTINCT user_id) as wau
-        FROM study_sessions
-        WHERE DATE(created_at) >= %s
-    ''', (week_ago,))
-    wau = cursor.fetchone()['wau'] or 0
-
-    # Monthly active users (MAU)
     month_ago = today - timedelta(days=30)
+
+    # Both cohorts from one pass over recent signups, DAU/WAU/MAU from one
+    # pass over the last month of the daily_active_users rollup
     cursor = db.execute('''
-        SELECT COUNT(DISTINCT user_id) as mau
-        FROM study_sessions
-        WHERE DATE(created_at) >= %s
-    ''', (month_ago,))
-    mau = cursor.fetchone()['mau'] or 0
+        SELECT * FROM (
+            SELECT
+                SUM(u.created_at >= %s AND u.created_at < %s) as cohort_7_size,
+                SUM(u.created_at >= %s AND u.created_at < %s AND EXISTS (
+                    SELECT 1 FROM study_sessions s
+                    WHERE s.user_id = u.id AND s.created_at >= %s
+                )) as retained_7,
+                SUM(u.created_at < %s) as cohort_30_size,
+                SUM(u.created_at < %s AND EXISTS (
+                    SELECT 1 FROM study_sessions s
+                    WHERE s.user_id = u.id AND s.created_at >= %s
+                )) as retained_30
+            FROM users u
+            WHERE u.created_at >= %s
+        ) cohorts
+        CROSS JOIN (
+            SELECT
+                SUM(day = %s) as dau,
+                COUNT(DISTINCT CASE WHEN day >= %s THEN user_id END) as wau,
+                COUNT(DISTINCT user_id) as mau
+            FROM daily_active_users
+            WHERE day >= %s
+        ) active
+    ''', (
+        _day_start(cohort_7_start), _day_start(cohort_7_end),
+        _day_start(cohort_7_start), _day_start(cohort_7_end), _day_start(cohort_7_end),
+        _day_start(cohort_30_end),
+        _day_start(cohort_30_end), _day_start(cohort_30_end),
+        _day_start(cohort_30_start),
+        today, week_ago, month_ago
+    ))
+    row = cursor.fetchone()
+    cohort_7_size = int(row['cohort_7_size'] or 0)
+    retained_7 = int(row['retained_7'] or 0)
+    cohort_30_size = int(row['cohort_30_size'] or 0)
+    retained_30 = int(row['retained_30'] or 0)
+    dau = int(row['dau'] or 0)
+    wau = row['wau'] or 0
+    mau = row['mau'] or 0
 
     return {
         'retention_7_day': round((retained_7 / cohort_7_size * 100), 1) if cohort_7_size > 0 else 0,
@@ -248,6 +339,7 @@ def get_retention_metrics():
     }
 
 
+@cached_metrics()
 def get_engagement_metrics():
     """Get top engagement behaviors."""
     db = get_db()
@@ -260,10 +352,10 @@ def get_engagement_metrics():
             COUNT(*) as count,
             COUNT(DISTINCT user_id) as unique_users
         FROM study_sessions
-        WHERE DATE(created_at) >= %s
+        WHERE created_at >= %s
         GROUP BY activity_type
         ORDER BY count DESC
-    ''', (thirty_days_ago,))
+    ''', (_day_start(thirty_days_ago),))
     activity_breakdown = cursor.fetchall()
 
     # Most engaged users
@@ -275,38 +367,21 @@ def get_engagement_metrics():
             COALESCE(SUM(s.duration), 0) as total_minutes
         FROM users u
         JOIN study_sessions s ON s.user_id = u.id
-        WHERE DATE(s.created_at) >= %s
+        WHERE s.created_at >= %s
         GROUP BY u.id
         ORDER BY sessions DESC
         LIMIT 10
-    ''', (thirty_days_ago,))
+    ''', (_day_start(thirty_days_ago),))
     top_engaged_users = cursor.fetchall()
 
-    # Streak distribution
+    # Streak distribution: count per distinct streak length (an index-only
+    # scan of idx_user_streaks_current), bucketed in Python
     cursor = db.execute('''
-        SELECT
-            CASE
-                WHEN current_streak = 0 THEN '0 days'
-                WHEN current_streak BETWEEN 1 AND 3 THEN '1-3 days'
-                WHEN current_streak BETWEEN 4 AND 7 THEN '4-7 days'
-                WHEN current_streak BETWEEN 8 AND 14 THEN '8-14 days'
-                WHEN current_streak BETWEEN 15 AND 30 THEN '15-30 days'
-                ELSE '30+ days'
-            END as streak_range,
-            COUNT(*) as users
+        SELECT current_streak, COUNT(*) as users
         FROM user_streaks
-        GROUP BY streak_range
-        ORDER BY
-            CASE streak_range
-                WHEN '0 days' THEN 1
-                WHEN '1-3 days' THEN 2
-                WHEN '4-7 days' THEN 3
-                WHEN '8-14 days' THEN 4
-                WHEN '15-30 days' THEN 5
-                ELSE 6
-            END
+        GROUP BY current_streak
     ''')
-    streak_distribution = cursor.fetchall()
+    streak_distribution = _bucket_streaks(cursor.fetchall())
 
     return {
         'activity_breakdown': activity_breakdown,
@@ -315,6 +390,7 @@ def get_engagement_metrics():
     }
 
 
+@cached_metrics()
 def get_subscription_metrics():
     """Get subscription and revenue metrics."""
     db = get_db()
@@ -331,39 +407,26 @@ def get_subscription_metrics():
     ''')
     subscription_breakdown = cursor.fetchall()
 
-    # Active Pro users
-    cursor = db.execute('''
-        SELECT COUNT(*) as count
-        FROM subscriptions
-        WHERE status = 'active' AND plan IN ('pro_monthly', 'pro_yearly')
-    ''')
-    active_pro = cursor.fetchone()['count'] or 0
-
-    # Referral Pro users
+    # Active Pro/referral counts and MRR in one scan, plus total users
     cursor = db.execute('''
-        SELECT COUNT(*) as count
+        SELECT
+            SUM(status = 'active' AND plan IN ('pro_monthly', 'pro_yearly')) as active_pro,
+            SUM(status = 'active' AND plan = 'pro_referral') as referral_pro,
+            SUM(CASE WHEN status = 'active' AND plan = 'pro_monthly' THEN 7.99 ELSE 0 END) as monthly_mrr,
+            SUM(CASE WHEN status = 'active' AND plan = 'pro_yearly' THEN 49.99/12 ELSE 0 END) as yearly_mrr,
+            (SELECT COUNT(*) FROM users) as total_users
         FROM subscriptions
-        WHERE status = 'active' AND plan = 'pro_referral'
     ''')
-    referral_pro = cursor.fetchone()['count'] or 0
-
-    # Total users
-    cursor = db.execute('SELECT COUNT(*) as count FROM users')
-    total_users = cursor.fetchone()['count'] or 0
+    row = cursor.fetchone()
+    active_pro = int(row['active_pro'] or 0)
+    referral_pro = int(row['referral_pro'] or 0)
+    total_users = row['total_users'] or 0
 
     # Conversion rate
     conversion_rate = round((active_pro / total_users * 100), 1) if total_users > 0 else 0
 
     # MRR calculation (simplified)
-    cursor = db.execute('''
-        SELECT
-            SUM(CASE WHEN plan = 'pro_monthly' THEN 7.99 ELSE 0 END) as monthly_mrr,
-            SUM(CASE WHEN plan = 'pro_yearly' THEN 49.99/12 ELSE 0 END) as yearly_mrr
-        FROM subscriptions
-        WHERE status = 'active'
-    ''')
-    mrr_data = cursor.fetchone()
-    mrr = round((mrr_data['monthly_mrr'] or 0) + (mrr_data['yearly_mrr'] or 0), 2)
+    mrr = round(float((row['monthly_mrr'] or 0) + (row['yearly_mrr'] or 0)), 2)
 
     return {
         'subscription_breakdown': subscription_breakdown,
@@ -376,17 +439,19 @@ def get_subscription_metrics():
     }
 
 
+@cached_metrics()
 def get_referral_metrics():
     """Get referral program metrics."""
     db = get_db()
 
-    # Total referrals
-    cursor = db.execute('SELECT COUNT(*) as count FROM referrals')
-    total_referrals = cursor.fetchone()['count'] or 0
-
-    # Completed referrals
-    cursor = db.execute("SELECT COUNT(*) as count FROM referrals WHERE status = 'completed'")
-    completed_referrals = cursor.fetchone()['count'] or 0
+    # Total and completed referrals
+    cursor = db.execute('''
+        SELECT COUNT(*) as total, SUM(status = 'completed') as completed
+        FROM referrals
+    ''')
+    row = cursor.fetchone()
+    total_referrals = row['total'] or 0
+    completed_referrals = int(row['completed'] or 0)
 
     # Top referrers
     cursor = db.execute('''
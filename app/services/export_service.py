@@ -1,10 +1,12 @@
 """Export Service - Data export functionality."""
 
-import json
 import csv
 import io
 import re
 from datetime import datetime
+import lxml.html
+import orjson
+from pymysql.cursors import SSDictCursor
 
 
 def export_notes_markdown(db, user_id, class_id=None):
@@ -37,205 +39,228 @@ def export_notes_markdown(db, user_id, class_id=None):
 
     notes = cursor.fetchall()
 
-    markdown = "# My Notes\n\n"
-    markdown += f"Exported on {datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n"
-    markdown += "---\n\n"
+    # Written to one buffer; repeated += would copy the whole export per note
+    output = io.StringIO()
+    output.write("# My Notes\n\n")
+    output.write(f"Exported on {datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n")
+    output.write("---\n\n")
 
     current_class = None
     for note in notes:
         if note['class_name'] != current_class:
             current_class = note['class_name']
-            markdown += f"## {note['class_code'] or note['class_name']}\n\n"
-
-        markdown += f"### {note['title'] or 'Untitled'}\n\n"
-
-        # Convert HTML to plain text (basic conversion)
-        content = note['content'] or ''
-        content = html_to_markdown(content)
-        markdown += content + "\n\n"
+            output.write(f"## {note['class_code'] or note['class_name']}\n\n")
 
-        markdown += f"*Last updated: {note['updated_at'][:16] if note['updated_at'] else 'Unknown'}*\n\n"
-        markdown += "---\n\n"
+        updated = str(note['updated_at'])[:16] if note['updated_at'] else 'Unknown'
+        output.writelines((
+            f"### {note['title'] or 'Untitled'}\n\n",
+            html_to_markdown(note['content'] or ''), "\n\n",
+            f"*Last updated: {updated}*\n\n",
+            "---\n\n",
+        ))
 
     filename = f"notes_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
-    return markdown, filename
+    return output.getvalue(), filename
 
 
 def export_flashcards_csv(db, user_id, deck_id=None):
     """Export flashcards as CSV (compatible with Anki).
 
+    Rows are read through an unbuffered server-side cursor and written one
+    line at a time, so memory stays flat regardless of deck size.
+
     Args:
         db: Database connection
         user_id: User ID
         deck_id: Optional deck ID to filter by
 
     Returns:
-        tuple: (csv_content, filename)
+        tuple: (csv_chunks, filename) - csv_chunks is a generator of str
     """
     if deck_id:
-        cursor = db.execute('''
-            SELECT f.*, d.title as deck_title, c.name as class_name
+        query = '''
+            SELECT f.front, f.back, d.title as deck_title, c.name as class_name
             FROM flashcards f
             JOIN flashcard_decks d ON f.deck_id = d.id
             JOIN classes c ON d.class_id = c.id
             WHERE d.user_id = %s AND d.id = %s
             ORDER BY d.title, f.id
-        ''', (user_id, deck_id))
+        '''
+        params = (user_id, deck_id)
     else:
-        cursor = db.execute('''
-            SELECT f.*, d.title as deck_title, c.name as class_name
+        query = '''
+            SELECT f.front, f.back, d.title as deck_title, c.name as class_name
             FROM flashcards f
             JOIN flashcard_decks d ON f.deck_id = d.id
             JOIN classes c ON d.class_id = c.id
             WHERE d.user_id = %s
             ORDER BY d.title, f.id
-        ''', (user_id,))
+        '''
+        params = (user_id,)
+
+    def csv_chunks():
+        output = io.StringIO()
+        writer = csv.writer(output)
+
+        def take():
+            chunk = output.getvalue()
+            output.seek(0)
+            output.truncate()
+            return chunk
+
+        # Header row
+        writer.writerow(['Front', 'Back', 'Deck', 'Class', 'Tags'])
+        yield take()
+
+        cursor = db.cursor(SSDictCursor)
+        try:
+            cursor.execute(query, params)
+            for card in cursor:
+                writer.writerow([
+                    html_to_text(card['front']),
+                    html_to_text(card['back']),
+                    card['deck_title'],
+                    card['class_name'],
+                    ''  # Tags placeholder
+                ])
+                yield take()
+        finally:
+            cursor.close()
 
-    cards = cursor.fetchall()
+    filename = f"flashcards_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return csv_chunks(), filename
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Header row
-    writer.writerow(['Front', 'Back', 'Deck', 'Class', 'Tags'])
-
-    for card in cards:
-        front = html_to_text(card['front'])
-        back = html_to_text(card['back'])
-        writer.writerow([
-            front,
-            back,
-            card['deck_title'],
-            card['class_name'],
-            ''  # Tags placeholder
-        ])
 
-    filename = f"flashcards_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    return output.getvalue(), filename
+# Backup sections in document order, each selected by user_id.
+# Each section is streamed from its own query rather than aggregated into one
+# JSON value server-side (JSON_ARRAYAGG): MySQL has no row_to_json, so that
+# would hard-code every column, and it would buffer the whole backup in a
+# single result value instead of streaming rows.
+BACKUP_QUERIES = (
+    ('classes', 'SELECT * FROM classes WHERE user_id = %s'),
+    ('notes', '''
+        SELECT n.* FROM notes n
+        JOIN classes c ON n.class_id = c.id
+        WHERE c.user_id = %s
+    '''),
+    ('flashcard_decks', 'SELECT * FROM flashcard_decks WHERE user_id = %s'),
+    ('flashcards', '''
+        SELECT f.* FROM flashcards f
+        JOIN flashcard_decks d ON f.deck_id = d.id
+        WHERE d.user_id = %s
+    '''),
+    ('study_guides', 'SELECT * FROM study_guides WHERE user_id = %s'),
+    ('quizzes', 'SELECT * FROM quizzes WHERE user_id = %s'),
+    ('quiz_attempts', 'SELECT * FROM quiz_attempts WHERE user_id = %s'),
+)
 
 
 def export_full_backup(db, user_id):
     """Export all user data as JSON backup.
 
+    The document is produced incrementally: rows are read through an
+    unbuffered server-side cursor and serialized one at a time, so memory
+    stays flat however large the account is.
+
     Args:
         db: Database connection
         user_id: User ID
 
     Returns:
-        tuple: (json_content, filename)
+        tuple: (json_chunks, filename) - json_chunks is a generator of str
     """
-    backup = {
-        'export_date': datetime.now().isoformat(),
-        'version': '1.0',
-        'classes': [],
-        'notes': [],
-        'flashcard_decks': [],
-        'flashcards': [],
-        'study_guides': [],
-        'quizzes': [],
-        'quiz_attempts': []
-    }
-
-    # Export classes
-    cursor = db.execute(
-        'SELECT * FROM classes WHERE user_id = %s',
-        (user_id,)
-    )
-    backup['classes'] = [dict(row) for row in cursor.fetchall()]
-
-    # Export notes
-    cursor = db.execute('''
-        SELECT n.* FROM notes n
-        JOIN classes c ON n.class_id = c.id
-        WHERE c.user_id = %s
-    ''', (user_id,))
-    backup['notes'] = [dict(row) for row in cursor.fetchall()]
-
-    # Export flashcard decks
-    cursor = db.execute(
-        'SELECT * FROM flashcard_decks WHERE user_id = %s',
-        (user_id,)
-    )
-    backup['flashcard_decks'] = [dict(row) for row in cursor.fetchall()]
-
-    # Export flashcards
-    cursor = db.execute('''
-        SELECT f.* FROM flashcards f
-        JOIN flashcard_decks d ON f.deck_id = d.id
-        WHERE d.user_id = %s
-    ''', (user_id,))
-    backup['flashcards'] = [dict(row) for row in cursor.fetchall()]
-
-    # Export study guides
-    cursor = db.execute(
-        'SELECT * FROM study_guides WHERE user_id = %s',
-        (user_id,)
-    )
-    backup['study_guides'] = [dict(row) for row in cursor.fetchall()]
-
-    # Export quizzes
-    cursor = db.execute(
-        'SELECT * FROM quizzes WHERE user_id = %s',
-        (user_id,)
-    )
-    backup['quizzes'] = [dict(row) for row in cursor.fetchall()]
-
-    # Export quiz attempts
-    cursor = db.execute(
-        'SELECT * FROM quiz_attempts WHERE user_id = %s',
-        (user_id,)
-    )
-    backup['quiz_attempts'] = [dict(row) for row in cursor.fetchall()]
-
-    json_content = json.dumps(backup, indent=2, default=str)
+    def json_chunks():
+        yield '{\n  "export_date": %s,\n  "version": "1.0"' % orjson.dumps(datetime.now().isoformat()).decode()
+
+        for section, query in BACKUP_QUERIES:
+            yield f',\n  "{section}": ['
+            cursor = db.cursor(SSDictCursor)
+            try:
+                cursor.execute(query, (user_id,))
+                separator = '\n    '
+                for row in cursor:
+                    # orjson serializes datetime/date natively; default=str covers Decimal
+                    yield separator + orjson.dumps(row, default=str).decode()
+                    separator = ',\n    '
+            finally:
+                cursor.close()
+            yield '\n  ]'
+
+        yield '\n}\n'
+
     filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    return json_content, filename
+    return json_chunks(), filename
 
 
-def html_to_markdown(html):
-    """Convert HTML to basic Markdown."""
-    if not html:
+# Markdown for inline formatting and heading tags
+_MARKDOWN_WRAP = {'strong': '**', 'b': '**', 'em': '*', 'i': '*', 'code': '`'}
+_MARKDOWN_HEADINGS = {'h1': '# ', 'h2': '## ', 'h3': '### '}
+_SKIPPED_TAGS = {'script', 'style'}
+
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+def _parse_fragment(html):
+    """Parse an HTML fragment into an lxml element wrapping its content."""
+    return lxml.html.fragment_fromstring(html, create_parent='div')
+
+
+def _children_markdown(element):
+    """Markdown for an element's text and children, without the element's own markup."""
+    parts = [element.text or '']
+    for child in element:
+        parts.append(_element_markdown(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+def _element_markdown(element):
+    """Markdown for one element (tag, content); unknown tags keep only their content."""
+    if not isinstance(element.tag, str):
+        return ''  # Comments and processing instructions
+
+    tag = element.tag.lower()
+    if tag == 'br':
+        return '\n'
+    if tag in _SKIPPED_TAGS:
         return ''
 
-    text = html
+    inner = _children_markdown(element)
+    if tag in _MARKDOWN_HEADINGS:
+        return f"{_MARKDOWN_HEADINGS[tag]}{inner}\n"
+    if tag in _MARKDOWN_WRAP:
+        marker = _MARKDOWN_WRAP[tag]
+        return f"{marker}{inner}{marker}"
+    if tag == 'li':
+        return f"- {inner}\n"
+    if tag == 'p':
+        return f"{inner}\n\n"
+    return inner
 
-    # Convert common HTML tags to Markdown
-    text = re.sub(r'<h1[^>]*>(.*?)</h1>', r'# \1\n', text, flags=re.DOTALL)
-    text = re.sub(r'<h2[^>]*>(.*?)</h2>', r'## \1\n', text, flags=re.DOTALL)
-    text = re.sub(r'<h3[^>]*>(.*?)</h3>', r'### \1\n', text, flags=re.DOTALL)
-    text = re.sub(r'<strong[^>]*>(.*?)</strong>', r'**\1**', text, flags=re.DOTALL)
-    text = re.sub(r'<b[^>]*>(.*?)</b>', r'**\1**', text, flags=re.DOTALL)
-    text = re.sub(r'<em[^>]*>(.*?)</em>', r'*\1*', text, flags=re.DOTALL)
-    text = re.sub(r'<i[^>]*>(.*?)</i>', r'*\1*', text, flags=re.DOTALL)
-    text = re.sub(r'<code[^>]*>(.*?)</code>', r'`\1`', text, flags=re.DOTALL)
-    text = re.sub(r'<li[^>]*>(.*?)</li>', r'- \1\n', text, flags=re.DOTALL)
-    text = re.sub(r'<br\s*/?>', '\n', text)
-    text = re.sub(r'<p[^>]*>(.*?)</p>', r'\1\n\n', text, flags=re.DOTALL)
 
-    # Remove remaining HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
+def html_to_markdown(html):
+    """Convert HTML to basic Markdown."""
+    if not html or not html.strip():
+        return ''
+
+    # One parse and one tree walk; entities are decoded by the parser
+    text = _children_markdown(_parse_fragment(html)).replace('\xa0', ' ')
 
     # Clean up whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = text.strip()
-
-    return text
+    text = _BLANK_LINES_RE.sub('\n\n', text)
+    return text.strip()
 
 
 def html_to_text(html):
     """Convert HTML to plain text."""
-    if not html:
+    if not html or not html.strip():
         return ''
 
-    # Remove all HTML tags
-    text = re.sub(r'<br\s*/?>', '\n', html)
-    text = re.sub(r'<[^>]+>', '', text)
+    fragment = _parse_fragment(html)
 
-    # Decode HTML entities
-    text = text.replace('&nbsp;', ' ')
-    text = text.replace('&amp;', '&')
-    text = text.replace('&lt;', '<')
-    text = text.replace('&gt;', '>')
-    text = text.replace('&quot;', '"')
+    # Line breaks become newlines; everything else is just its text
+    for br in fragment.iter('br'):
+        br.tail = '\n' + (br.tail or '')
 
-    return text.strip()
+    # Entities are decoded by the parser
+    return fragment.text_content().replace('\xa0', ' ').strip()
@@ -1,138 +1,227 @@
 """Insights Service - Generate performance insights for users."""
 
+import threading
 from datetime import date, timedelta
+from cachetools import TTLCache
 from app.db_connect import get_db
 
+# Top insights per (user_id, day). Keyed by date so entries roll over at
+# midnight; dropped early when the user records new study activity
+insights_cache = TTLCache(maxsize=5000, ttl=24 * 3600)
+insights_cache_lock = threading.Lock()
+
+# Queries are built once at import; PyMySQL sends them as plain text, so
+# reusing the same string is all the statement reuse the driver offers
+
+# Streak, two weeks of the daily study rollup, flashcard mastery and this
+# week's quizzes, as one row
+_USER_INSIGHTS_QUERY = '''
+    SELECT * FROM (
+        SELECT MAX(current_streak) as current_streak, MAX(longest_streak) as longest_streak
+        FROM user_streaks
+        WHERE user_id = %s
+    ) streak
+    CROSS JOIN (
+        SELECT
+            COALESCE(SUM(CASE WHEN day >= %s THEN minutes ELSE 0 END), 0) as this_week,
+            COALESCE(SUM(CASE WHEN day < %s THEN minutes ELSE 0 END), 0) as last_week,
+            COALESCE(SUM(day >= %s), 0) as active_days
+        FROM study_daily_stats
+        WHERE user_id = %s AND day >= %s
+    ) sessions
+    CROSS JOIN (
+        SELECT COALESCE(SUM(mastered_count), 0) as mastered
+        FROM flashcard_decks
+        WHERE user_id = %s
+    ) mastery
+    CROSS JOIN (
+        SELECT AVG(score * 100.0 / NULLIF(total, 0)) as avg_score, COUNT(*) as quiz_count
+        FROM quiz_attempts
+        WHERE user_id = %s AND completed_at >= %s
+    ) quizzes
+'''
+
+# This week's daily study rollup, quizzes, streak and mastery, as one row
+_STUDY_SUMMARY_QUERY = '''
+    SELECT * FROM (
+        SELECT
+            COALESCE(SUM(minutes), 0) as total_minutes,
+            COALESCE(SUM(flashcard_sessions), 0) as cards_reviewed,
+            COUNT(*) as days_studied
+        FROM study_daily_stats
+        WHERE user_id = %s AND day >= %s
+    ) sessions
+    CROSS JOIN (
+        SELECT COUNT(*) as quizzes_completed
+        FROM quiz_attempts
+        WHERE user_id = %s AND completed_at >= %s
+    ) quizzes
+    CROSS JOIN (
+        SELECT MAX(current_streak) as current_streak
+        FROM user_streaks
+        WHERE user_id = %s
+    ) streak
+    CROSS JOIN (
+        SELECT COALESCE(SUM(f.repetitions >= 3), 0) as mastered, COUNT(*) as total_cards
+        FROM flashcards f
+        JOIN flashcard_decks d ON f.deck_id = d.id
+        WHERE d.user_id = %s
+    ) mastery
+'''
+
+
+def invalidate_user_insights(user_id):
+    """Drop a user's cached insights after new study activity."""
+    with insights_cache_lock:
+        insights_cache.pop((int(user_id), date.today()), None)
+
 
 def get_user_insights(user_id):
-    """Get performance insights for a user."""
-    db = get_db()
+    """Get performance insights for a user (cached until their next study activity or midnight)."""
     today = date.today()
+    cache_key = (int(user_id), today)
+    with insights_cache_lock:
+        cached = insights_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
+
+    insights = _compute_user_insights(user_id, today)
+    with insights_cache_lock:
+        insights_cache[cache_key] = insights
+    return list(insights)
+
+
+def _compute_user_insights(user_id, today):
+    """Query and rank a user's performance insights as of today."""
+    db = get_db()
     week_ago = today - timedelta(days=7)
-    month_ago = today - timedelta(days=30)
+    two_weeks_ago = today - timedelta(days=14)
+
+    # Every figure below comes from this one round trip (a single statement,
+    # so there is nothing left to run concurrently)
+    cursor = db.execute(_USER_INSIGHTS_QUERY, (
+        user_id,
+        week_ago, week_ago, week_ago, user_id, two_weeks_ago,
+        user_id,
+        user_id, week_ago
+    ))
+    stats = cursor.fetchone()
 
     insights = []
+    for rule in INSIGHT_RULES:
+        insight = rule(stats)
+        if insight:
+            insights.append(insight)
+            if len(insights) == MAX_INSIGHTS:
+                break
+    return insights
+
+
+def _streak_insight(stats):
+    """Streak record (3+ days, matching the best ever) or 7+ day milestone."""
+    streak = stats['current_streak']
+    if not streak:
+        return None
+    if streak >= stats['longest_streak'] and streak >= 3:
+        return {
+            'type': 'streak_record',
+            'icon': '🔥',
+            'title': 'New Record!',
+            'message': f"You're on a {streak}-day streak - your best ever!",
+            'color': 'warning'
+        }
+    if streak >= 7:
+        return {
+            'type': 'streak_milestone',
+            'icon': '🎯',
+            'title': 'Week Warrior',
+            'message': f"You've studied for {streak} days straight!",
+            'color': 'success'
+        }
+    return None
+
+
+def _study_time_insight(stats):
+    """An hour or more of study this week."""
+    if stats['this_week'] < 60:
+        return None
+    return {
+        'type': 'study_time',
+        'icon': '📚',
+        'title': 'Study Champion',
+        'message': f"You've studied for {stats['this_week'] // 60}+ hours this week!",
+        'color': 'primary'
+    }
 
-    # 1. Streak insight
-    cursor = db.execute('''
-        SELECT current_streak, longest_streak FROM user_streaks WHERE user_id = %s
-    ''', (user_id,))
-    streak = cursor.fetchone()
-    if streak and streak['current_streak'] > 0:
-        if streak['current_streak'] >= streak['longest_streak'] and streak['current_streak'] >= 3:
-            insights.append({
-                'type': 'streak_record',
-                'icon': '🔥',
-                'title': 'New Record!',
-                'message': f"You're on a {streak['current_streak']}-day streak - your best ever!",
-                'color': 'warning'
-            })
-        elif streak['current_streak'] >= 7:
-            insights.append({
-                'type': 'streak_milestone',
-                'icon': '🎯',
-                'title': 'Week Warrior',
-                'message': f"You've studied for {streak['current_streak']} days straight!",
-                'color': 'success'
-            })
-
-    # 2. Study time insight
-    cursor = db.execute('''
-        SELECT COALESCE(SUM(duration), 0) as total_minutes
-        FROM study_sessions
-        WHERE user_id = %s AND created_at >= %s
-    ''', (user_id, week_ago))
-    study_time = cursor.fetchone()
-    if study_time and study_time['total_minutes'] >= 60:
-        hours = study_time['total_minutes'] // 60
-        insights.append({
-            'type': 'study_time',
-            'icon': '📚',
-            'title': 'Study Champion',
-            'message': f"You've studied for {hours}+ hours this week!",
-            'color': 'primary'
-        })
-
-    # 3. Flashcard mastery insight
-    cursor = db.execute('''
-        SELECT COUNT(*) as mastered
-        FROM flashcards f
-        JOIN flashcard_decks d ON f.deck_id = d.id
-        WHERE d.user_id = %s AND f.repetitions >= 3 AND f.ease_factor >= 2.5
-    ''', (user_id,))
-    mastered = cursor.fetchone()
-    if mastered and mastered['mastered'] >= 10:
-        insights.append({
-            'type': 'mastery',
-            'icon': '🧠',
-            'title': 'Memory Master',
-            'message': f"You've mastered {mastered['mastered']} flashcards!",
-            'color': 'info'
-        })
-
-    # 4. Quiz performance insight
-    cursor = db.execute('''
-        SELECT AVG(score * 100.0 / NULLIF(total, 0)) as avg_score, COUNT(*) as count
-        FROM quiz_attempts
-        WHERE user_id = %s AND completed_at >= %s
-    ''', (user_id, week_ago))
-    quiz_stats = cursor.fetchone()
-    if quiz_stats and quiz_stats['count'] >= 3 and quiz_stats['avg_score']:
-        avg = round(quiz_stats['avg_score'])
-        if avg >= 80:
-            insights.append({
-                'type': 'quiz_ace',
-                'icon': '⭐',
-                'title': 'Quiz Ace',
-                'message': f"You're averaging {avg}% on quizzes this week!",
-                'color': 'success'
-            })
-
-    # 5. Consistency insight
-    cursor = db.execute('''
-        SELECT COUNT(DISTINCT DATE(created_at)) as active_days
-        FROM study_sessions
-        WHERE user_id = %s AND created_at >= %s
-    ''', (user_id, week_ago))
-    consistency = cursor.fetchone()
-    if consistency and consistency['active_days'] >= 5:
-        insights.append({
-            'type': 'consistency',
-            'icon': '📈',
-            'title': 'Super Consistent',
-            'message': f"You studied {consistency['active_days']} out of 7 days!",
-            'color': 'primary'
-        })
-
-    # 6. Growth insight (compare this week to last week)
-    cursor = db.execute('''
-        SELECT COALESCE(SUM(duration), 0) as this_week
-        FROM study_sessions
-        WHERE user_id = %s AND DATE(created_at) >= %s
-    ''', (user_id, week_ago))
-    this_week = cursor.fetchone()
 
-    two_weeks_ago = today - timedelta(days=14)
-    cursor = db.execute('''
-        SELECT COALESCE(SUM(duration), 0) as last_week
-        FROM study_sessions
-        WHERE user_id = %s AND DATE(created_at) >= %s AND DATE(created_at) < %s
-    ''', (user_id, two_weeks_ago, week_ago))
-    last_week = cursor.fetchone()
-
-    if this_week and last_week and last_week['last_week'] > 0:
-        growth = ((this_week['this_week'] - last_week['last_week']) / last_week['last_week']) * 100
-        if growth >= 25:
-            insights.append({
-                'type': 'growth',
-                'icon': '🚀',
-                'title': 'On Fire!',
-                'message': f"You're studying {round(growth)}% more than last week!",
-                'color': 'success'
-            })
-
-    # Return top 3 insights
-    return insights[:3]
+def _mastery_insight(stats):
+    """Ten or more mastered flashcards."""
+    if stats['mastered'] < 10:
+        return None
+    return {
+        'type': 'mastery',
+        'icon': '🧠',
+        'title': 'Memory Master',
+        'message': f"You've mastered {stats['mastered']} flashcards!",
+        'color': 'info'
+    }
+
+
+def _quiz_insight(stats):
+    """An 80%+ quiz average over at least three quizzes this week."""
+    if stats['quiz_count'] < 3 or not stats['avg_score']:
+        return None
+    avg = round(stats['avg_score'])
+    if avg < 80:
+        return None
+    return {
+        'type': 'quiz_ace',
+        'icon': '⭐',
+        'title': 'Quiz Ace',
+        'message': f"You're averaging {avg}% on quizzes this week!",
+        'color': 'success'
+    }
+
+
+def _consistency_insight(stats):
+    """Studied on five or more of the last seven days."""
+    if stats['active_days'] < 5:
+        return None
+    return {
+        'type': 'consistency',
+        'icon': '📈',
+        'title': 'Super Consistent',
+        'message': f"You studied {stats['active_days']} out of 7 days!",
+        'color': 'primary'
+    }
+
+
+def _growth_insight(stats):
+    """At least 25% more study time than last week."""
+    if stats['last_week'] <= 0:
+        return None
+    growth = ((stats['this_week'] - stats['last_week']) / stats['last_week']) * 100
+    if growth < 25:
+        return None
+    return {
+        'type': 'growth',
+        'icon': '🚀',
+        'title': 'On Fire!',
+        'message': f"You're studying {round(growth)}% more than last week!",
+        'color': 'success'
+    }
+
+
+# Insight rules in display priority; each maps the stats row to an insight or None
+INSIGHT_RULES = (
+    _streak_insight,
+    _study_time_insight,
+    _mastery_insight,
+    _quiz_insight,
+    _consistency_insight,
+    _growth_insight,
+)
+MAX_INSIGHTS = 3
 
 
 def get_study_summary(user_id):
@@ -150,56 +239,16 @@ def get_study_summary(user_id):
         'mastery_level': 0
     }
 
-    # Study time
-    cursor = db.execute('''
-        SELECT COALESCE(SUM(duration), 0) as total
-        FROM study_sessions
-        WHERE user_id = %s AND DATE(created_at) >= %s
-    ''', (user_id, week_ago))
-    result = cursor.fetchone()
-    summary['total_study_minutes'] = result['total'] if result else 0
-
-    # Cards reviewed
-    cursor = db.execute('''
-        SELECT COUNT(*) as count
-        FROM study_sessions
-        WHERE user_id = %s AND activity_type = 'flashcards' AND DATE(created_at) >= %s
-    ''', (user_id, week_ago))
-    result = cursor.fetchone()
-    summary['cards_reviewed'] = result['count'] if result else 0
-
-    # Quizzes
-    cursor = db.execute('''
-        SELECT COUNT(*) as count FROM quiz_attempts
-        WHERE user_id = %s AND DATE(completed_at) >= %s
-    ''', (user_id, week_ago))
-    result = cursor.fetchone()
-    summary['quizzes_completed'] = result['count'] if result else 0
-
-    # Streak
-    cursor = db.execute('SELECT current_streak FROM user_streaks WHERE user_id = %s', (user_id,))
-    result = cursor.fetchone()
-    summary['current_streak'] = result['current_streak'] if result else 0
-
-    # Days studied
-    cursor = db.execute('''
-        SELECT COUNT(DISTINCT DATE(created_at)) as days
-        FROM study_sessions
-        WHERE user_id = %s AND DATE(created_at) >= %s
-    ''', (user_id, week_ago))
+    # Every figure comes from this one round trip
+    cursor = db.execute(_STUDY_SUMMARY_QUERY, (user_id, week_ago, user_id, week_ago, user_id, user_id))
     result = cursor.fetchone()
-    summary['days_studied'] = result['days'] if result else 0
 
-    # Overall mastery (cards with high ease factor)
-    cursor = db.execute('''
-        SELECT COUNT(*) as mastered,
-               (SELECT COUNT(*) FROM flashcards f2 JOIN flashcard_decks d2 ON f2.deck_id = d2.id WHERE d2.user_id = %s) as total
-        FROM flashcards f
-        JOIN flashcard_decks d ON f.deck_id = d.id
-        WHERE d.user_id = %s AND f.repetitions >= 3
-    ''', (user_id, user_id))
-    result = cursor.fetchone()
-    if result and result['total'] > 0:
-        summary['mastery_level'] = round((result['mastered'] / result['total']) * 100)
+    summary['total_study_minutes'] = result['total_minutes']
+    summary['cards_reviewed'] = int(result['cards_reviewed'])
+    summary['quizzes_completed'] = result['quizzes_completed']
+    summary['current_streak'] = result['current_streak'] or 0
+    summary['days_studied'] = result['days_studied']
+    if result['total_cards'] > 0:
+        summary['mastery_level'] = round((int(result['mastered']) / result['total_cards']) * 100)
 
     return summary
@@ -0,0 +1,81 @@
+"""LLM Cache - Exact-match response cache for AI service calls."""
+
+import hashlib
+import threading
+from functools import wraps
+from cachetools import TTLCache
+
+
+def cache_key(*parts):
+    """
+    Build a stable BLAKE2b cache key from strings/bytes without joining them.
+
+    Args:
+        *parts: Values to hash; non-str/bytes values are hashed by repr()
+
+    Returns:
+        str: 32-char hex digest, identical across processes
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        elif not isinstance(part, bytes):
+            part = repr(part).encode('utf-8')
+        digest.update(part)
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def llm_cache_key(func_name, args, kwargs):
+    """
+    Build a compact, stable cache key for an AI call.
+
+    Args:
+        func_name: Name of the cached function
+        args: Positional arguments of the call
+        kwargs: Keyword arguments of the call
+
+    Returns:
+        str: 32-char BLAKE2b hex digest of the function name and arguments
+    """
+    return cache_key(func_name, *args, *sorted(kwargs.items()))
+
+
+def cached_llm(func_name=None, ttl=3600, maxsize=512):
+    """
+    Decorator caching an AI function's result for identical inputs.
+
+    Place it above @with_retry so cache hits skip the retry wrapper too.
+    Exceptions are never cached.
+
+    Args:
+        func_name: Name used in the cache key (defaults to the function name)
+        ttl: Seconds a cached response stays valid
+        maxsize: Maximum number of cached responses for this function
+    """
+    def decorator(func):
+        name = func_name or func.__name__
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = llm_cache_key(name, args, kwargs)
+            with lock:
+                cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+            result = func(*args, **kwargs)
+            with lock:
+                cache[key] = result
+            return result
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
@@ -1,9 +1,33 @@
 """LMS Integration Service - Architecture for Canvas, Blackboard, and D2L integration."""
 
+import re
 from abc import ABC, abstractmethod
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, Dict, List, Any
 
+# Leading YYYY-MM-DD of an ISO 8601 timestamp such as Canvas's due_at
+_ISO_DATE_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+
+def _parse_due_date(value: Any) -> Optional[date]:
+    """
+    Get the calendar date of an LMS due timestamp.
+
+    The date is read straight from the leading YYYY-MM-DD (the date as
+    written, like datetime.fromisoformat(...).date()); other strings fall
+    back to fromisoformat, and unparseable values give None.
+    """
+    if not value or not isinstance(value, str):
+        return value or None
+
+    match = _ISO_DATE_RE.match(value)
+    try:
+        if match:
+            return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).date()
+    except ValueError:
+        return None
+
 
 class LMSProvider(ABC):
     """Abstract base class for LMS integrations."""
@@ -269,12 +293,7 @@ class LMSIntegrationManager:
 
         Returns dict ready for insertion into assignments table.
         """
-        due_date = lms_assignment.get('due_at')
-        if due_date and isinstance(due_date, str):
-            try:
-                due_date = datetime.fromisoformat(due_date.replace('Z', '+00:00')).date()
-            except ValueError:
-                due_date = None
+        due_date = _parse_due_date(lms_assignment.get('due_at'))
 
         return {
             'class_id': class_id,
@@ -1,8 +1,21 @@
 """
 Service for creating and managing user notifications.
 """
+import threading
+from cachetools import TTLCache
 from app.db_connect import get_db
 
+# Unread badge count per user_id (rendered on every page; 30-second TTL,
+# dropped whenever that user's notifications change)
+unread_count_cache = TTLCache(maxsize=10000, ttl=30)
+unread_count_cache_lock = threading.Lock()
+
+
+def _invalidate_unread_count(user_id):
+    """Drop a user's cached unread count after their notifications change."""
+    with unread_count_cache_lock:
+        unread_count_cache.pop(int(user_id), None)
+
 
 def create_notification(user_id, notification_type, title, message=None, link=None, from_user_id=None):
     """
@@ -22,10 +35,25 @@ def create_notification(user_id, notification_type, title, message=None, link=No
         VALUES (%s, %s, %s, %s, %s, %s)
     ''', (user_id, notification_type, title, message, link, from_user_id))
     db.commit()
+    _invalidate_unread_count(user_id)
+
+
+def get_notifications(user_id, limit=20, unread_only=False, before=None):
+    """
+    Get a page of notifications for a user, newest first.
 
+    Pages are keyset-paginated: pass the last row's (created_at, id) as
+    before to get the next page without an OFFSET scan.
 
-def get_notifications(user_id, limit=20, unread_only=False):
-    """Get notifications for a user."""
+    Args:
+        user_id: The user whose notifications to list
+        limit: Maximum number of notifications to return
+        unread_only: Only return unread notifications
+        before: Optional (created_at, id) of the last notification already shown
+
+    Returns:
+        list: Notification rows with from_username
+    """
     db = get_db()
     query = '''
         SELECT n.*, u.username as from_username
@@ -33,23 +61,37 @@ def get_notifications(user_id, limit=20, unread_only=False):
         LEFT JOIN users u ON n.from_user_id = u.id
         WHERE n.user_id = %s
     '''
+    params = [user_id]
     if unread_only:
         query += ' AND n.is_read = 0'
-    query += ' ORDER BY n.created_at DESC LIMIT %s'
+    if before:
+        query += ' AND (n.created_at < %s OR (n.created_at = %s AND n.id < %s))'
+        params.extend([before[0], before[0], before[1]])
+    query += ' ORDER BY n.created_at DESC, n.id DESC LIMIT %s'
+    params.append(limit)
 
-    cursor = db.execute(query, (user_id, limit))
+    cursor = db.execute(query, params)
     return cursor.fetchall()
 
 
 def get_unread_count(user_id):
-    """Get count of unread notifications."""
+    """Get count of unread notifications (cached for 30 seconds)."""
+    with unread_count_cache_lock:
+        count = unread_count_cache.get(int(user_id))
+    if count is not None:
+        return count
+
     db = get_db()
     cursor = db.execute(
         'SELECT COUNT(*) as count FROM notifications WHERE user_id = %s AND is_read = 0',
         (user_id,)
     )
     result = cursor.fetchone()
-    return result['count'] if result else 0
+    count = result['count'] if result else 0
+
+    with unread_count_cache_lock:
+        unread_count_cache[int(user_id)] = count
+    return count
 
 
 def mark_as_read(notification_id, user_id):
@@ -60,6 +102,7 @@ def mark_as_read(notification_id, user_id):
         (notification_id, user_id)
     )
     db.commit()
+    _invalidate_unread_count(user_id)
 
 
 def mark_all_as_read(user_id):
@@ -70,6 +113,7 @@ def mark_all_as_read(user_id):
         (user_id,)
     )
     db.commit()
+    _invalidate_unread_count(user_id)
 
 
 def delete_notification(notification_id, user_id):
@@ -80,6 +124,7 @@ def delete_notification(notification_id, user_id):
         (notification_id, user_id)
     )
     db.commit()
+    _invalidate_unread_count(user_id)
 
 
 # Notification type helpers
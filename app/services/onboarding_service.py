@@ -1,9 +1,18 @@
 """Onboarding Service - Handles new user onboarding flow."""
 
 from datetime import datetime
-from app.db_connect import get_db
+from app.db_connect import get_db, transaction
 
 
+# Bit per onboarding step in user_settings.onboarding_flags
+ONBOARDING_STEP_FLAGS = {
+    'has_class': 1,
+    'has_note': 2,
+    'has_flashcards': 4,
+    'has_studied': 8,
+}
+ONBOARDING_ALL_STEPS = sum(ONBOARDING_STEP_FLAGS.values())
+
 # Demo class content
 DEMO_CLASS = {
     'name': 'Getting Started with Klass',
@@ -70,46 +79,35 @@ def create_demo_content(user_id):
     """Create demo class, note, and flashcards for a new user."""
     db = get_db()
 
-    # Create demo class
-    db.execute('''
-        INSERT INTO classes (user_id, name, code, instructor, semester, color, description)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-    ''', (user_id, DEMO_CLASS['name'], DEMO_CLASS['code'], DEMO_CLASS['instructor'],
-          DEMO_CLASS['semester'], DEMO_CLASS['color'], DEMO_CLASS['description']))
-    db.commit()
-
-    # Get class ID
-    cursor = db.execute('SELECT id FROM classes WHERE user_id = %s ORDER BY id DESC LIMIT 1', (user_id,))
-    class_result = cursor.fetchone()
-    class_id = class_result['id']
-
-    # Create demo note
-    db.execute('''
-        INSERT INTO notes (class_id, title, content, is_pinned)
-        VALUES (%s, %s, %s, 1)
-    ''', (class_id, 'Welcome to Klass! Start Here', DEMO_NOTE_CONTENT))
-    db.commit()
-
-    # Create demo flashcard deck
-    db.execute('''
-        INSERT INTO flashcard_decks (user_id, class_id, title, description, card_count)
-        VALUES (%s, %s, %s, %s, %s)
-    ''', (user_id, class_id, 'Study Tips & Techniques',
-          'Learn the basics of effective studying with Klass', len(DEMO_FLASHCARDS)))
-    db.commit()
-
-    # Get deck ID
-    cursor = db.execute('SELECT id FROM flashcard_decks WHERE user_id = %s ORDER BY id DESC LIMIT 1', (user_id,))
-    deck_result = cursor.fetchone()
-    deck_id = deck_result['id']
-
-    # Create demo flashcards
-    for card in DEMO_FLASHCARDS:
+    # Everything is written in one transaction; ids come from lastrowid
+    with transaction(db):
+        # Create demo class
+        cursor = db.execute('''
+            INSERT INTO classes (user_id, name, code, instructor, semester, color, description)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ''', (user_id, DEMO_CLASS['name'], DEMO_CLASS['code'], DEMO_CLASS['instructor'],
+              DEMO_CLASS['semester'], DEMO_CLASS['color'], DEMO_CLASS['description']))
+        class_id = cursor.lastrowid
+
+        # Create demo note
         db.execute('''
+            INSERT INTO notes (class_id, title, content, is_pinned)
+            VALUES (%s, %s, %s, 1)
+        ''', (class_id, 'Welcome to Klass! Start Here', DEMO_NOTE_CONTENT))
+
+        # Create demo flashcard deck
+        cursor = db.execute('''
+            INSERT INTO flashcard_decks (user_id, class_id, title, description, card_count)
+            VALUES (%s, %s, %s, %s, %s)
+        ''', (user_id, class_id, 'Study Tips & Techniques',
+              'Learn the basics of effective studying with Klass', len(DEMO_FLASHCARDS)))
+        deck_id = cursor.lastrowid
+
+        # Create demo flashcards (sent as one multi-row INSERT)
+        db.executemany('''
             INSERT INTO flashcards (deck_id, front, back)
             VALUES (%s, %s, %s)
-        ''', (deck_id, card['front'], card['back']))
-    db.commit()
+        ''', [(deck_id, card['front'], card['back']) for card in DEMO_FLASHCARDS])
 
     return class_id
 
@@ -140,7 +138,13 @@ def complete_onboarding(user_id):
 
 
 def get_onboarding_progress(user_id):
-    """Get the current onboarding progress for a user."""
+    """
+    Get the current onboarding progress for a user.
+
+    Steps only ever move forward, so reached steps are latched into
+    user_settings.onboarding_flags; the EXISTS probes run only while some
+    step is still outstanding.
+    """
     db = get_db()
 
     progress = {
@@ -151,32 +155,44 @@ def get_onboarding_progress(user_id):
         'completed': False
     }
 
-    # Check for classes
-    cursor = db.execute('SELECT COUNT(*) as count FROM classes WHERE user_id = %s', (user_id,))
-    progress['has_class'] = cursor.fetchone()['count'] > 0
-
-    # Check for notes
-    cursor = db.execute('''
-        SELECT COUNT(*) as count FROM notes n
-        JOIN classes c ON n.class_id = c.id
-        WHERE c.user_id = %s
-    ''', (user_id,))
-    progress['has_note'] = cursor.fetchone()['count'] > 0
-
-    # Check for flashcard decks
-    cursor = db.execute('SELECT COUNT(*) as count FROM flashcard_decks WHERE user_id = %s', (user_id,))
-    progress['has_flashcards'] = cursor.fetchone()['count'] > 0
-
-    # Check for study activity
-    cursor = db.execute('''
-        SELECT COUNT(*) as count FROM flashcards f
-        JOIN flashcard_decks d ON f.deck_id = d.id
-        WHERE d.user_id = %s AND f.times_reviewed > 0
-    ''', (user_id,))
-    progress['has_studied'] = cursor.fetchone()['count'] > 0
-
-    # Check if onboarding is complete
-    progress['completed'] = check_onboarding_complete(user_id)
+    cursor = db.execute(
+        'SELECT onboarding_flags, onboarding_completed FROM user_settings WHERE user_id = %s',
+        (user_id,)
+    )
+    settings = cursor.fetchone()
+    flags = settings['onboarding_flags'] if settings else 0
+    progress['completed'] = bool(settings['onboarding_completed']) if settings else False
+
+    if flags != ONBOARDING_ALL_STEPS:
+        # Each step is an EXISTS probe; all four answered in one round trip
+        cursor = db.execute('''
+            SELECT
+                EXISTS (SELECT 1 FROM classes WHERE user_id = %s) as has_class,
+                EXISTS (
+                    SELECT 1 FROM notes n
+                    JOIN classes c ON n.class_id = c.id
+                    WHERE c.user_id = %s
+                ) as has_note,
+                EXISTS (SELECT 1 FROM flashcard_decks WHERE user_id = %s) as has_flashcards,
+                EXISTS (
+                    SELECT 1 FROM flashcards f
+                    JOIN flashcard_decks d ON f.deck_id = d.id
+                    WHERE d.user_id = %s AND f.times_reviewed > 0
+                ) as has_studied
+        ''', (user_id, user_id, user_id, user_id))
+        steps = cursor.fetchone()
+        reached = sum(bit for step, bit in ONBOARDING_STEP_FLAGS.items() if steps[step])
+
+        if settings and reached & ~flags:
+            db.execute(
+                'UPDATE user_settings SET onboarding_flags = onboarding_flags | %s WHERE user_id = %s',
+                (reached, user_id)
+            )
+            db.commit()
+        flags |= reached
+
+    for step, bit in ONBOARDING_STEP_FLAGS.items():
+        progress[step] = bool(flags & bit)
 
     # Calculate completion percentage
     steps_done = sum([
@@ -1,12 +1,50 @@
 """
 Service for tracking user study streaks and daily activity.
 """
-from datetime import date, timedelta
+import threading
+from datetime import date, datetime, timedelta
+from cachetools import TTLCache
 from app.db_connect import get_db
+from app.services.insights_service import invalidate_user_insights
+
+# Streak row per user (5-minute TTL), dropped whenever the streak is written
+streak_cache = TTLCache(maxsize=5000, ttl=300)
+streak_cache_lock = threading.Lock()
+
+# (user_id, day) pairs known to have study activity. Only positive answers are
+# cached: a day's activity is never undone, so they can't go stale
+studied_today_cache = TTLCache(maxsize=10000, ttl=24 * 3600)
+studied_today_cache_lock = threading.Lock()
+
+# date.weekday() -> abbreviated name for the weekly streak strip
+_DAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def _day_range(day):
+    """Start of a day and of the next, for index-friendly timestamp range filters."""
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def invalidate_user_streak(user_id):
+    """Drop a user's cached streak after it is written."""
+    with streak_cache_lock:
+        streak_cache.pop(int(user_id), None)
+
+
+def _mark_studied_today(user_id, today):
+    """Remember that the user has study activity on the given day."""
+    with studied_today_cache_lock:
+        studied_today_cache[(int(user_id), today)] = True
 
 
 def get_user_streak(user_id):
-    """Get the current streak info for a user."""
+    """Get the current streak info for a user (cached until the streak changes)."""
+    with streak_cache_lock:
+        cached = streak_cache.get(int(user_id))
+    if cached is not None:
+        return dict(cached)
+
     db = get_db()
     cursor = db.execute('''
         SELECT current_streak, longest_streak, last_study_date
@@ -21,11 +59,40 @@ def get_user_streak(user_id):
             VALUES (%s, 0, 0)
         ''', (user_id,))
         db.commit()
-        return {'current_streak': 0, 'longest_streak': 0, 'last_study_date': None}
+        streak = {'current_streak': 0, 'longest_streak': 0, 'last_study_date': None}
 
+    with streak_cache_lock:
+        streak_cache[int(user_id)] = dict(streak)
     return streak
 
 
+def record_study_session(user_id, class_id, activity_type, duration):
+    """
+    Log a study session and add it to the user's daily study rollup.
+
+    The caller commits (both writes land in the caller's transaction).
+
+    Args:
+        user_id: The user who studied
+        class_id: Class the session belongs to
+        activity_type: 'quiz', 'flashcards' or 'pomodoro'
+        duration: Session length in minutes
+    """
+    db = get_db()
+    db.execute('''
+        INSERT INTO study_sessions (user_id, class_id, activity_type, duration)
+        VALUES (%s, %s, %s, %s)
+    ''', (user_id, class_id, activity_type, duration))
+    db.execute('''
+        INSERT INTO study_daily_stats (user_id, day, minutes, sessions, flashcard_sessions)
+        VALUES (%s, CURRENT_DATE, %s, 1, %s)
+        ON DUPLICATE KEY UPDATE
+            minutes = minutes + VALUES(minutes),
+            sessions = sessions + 1,
+            flashcard_sessions = flashcard_sessions + VALUES(flashcard_sessions)
+    ''', (user_id, duration or 0, 1 if activity_type == 'flashcards' else 0))
+
+
 def update_streak(user_id):
     """
     Update the user's streak based on study activity.
@@ -35,60 +102,47 @@ def update_streak(user_id):
     db = get_db()
     today = date.today()
 
-    # Get current streak info
+    # Mark the user active today (committed with the streak update below)
+    db.execute('''
+        INSERT IGNORE INTO daily_active_users (day, user_id) VALUES (%s, %s)
+    ''', (today, user_id))
+
+    # Insert or advance the streak in one atomic statement. MySQL applies the
+    # assignments left to right, so longest_streak sees the new current_streak
+    # and last_study_date is overwritten last.
     cursor = db.execute('''
-        SELECT current_streak, longest_streak, last_study_date
-        FROM user_streaks WHERE user_id = %s
-    ''', (user_id,))
-    streak = cursor.fetchone()
+        INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_study_date)
+        VALUES (%s, 1, 1, %s)
+        ON DUPLICATE KEY UPDATE
+            current_streak = CASE
+                WHEN last_study_date = VALUES(last_study_date) THEN current_streak
+                WHEN last_study_date = VALUES(last_study_date) - INTERVAL 1 DAY THEN current_streak + 1
+                ELSE 1
+            END,
+            longest_streak = GREATEST(longest_streak, current_streak),
+            last_study_date = VALUES(last_study_date)
+    ''', (user_id, today))
+    # Affected rows: 1 = new row, 2 = streak changed, 0 = already studied today
+    affected = cursor.rowcount
 
-    if not streak:
-        # Create streak record with initial activity
-        db.execute('''
-            INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_study_date)
-            VALUES (%s, 1, 1, %s)
-        ''', (user_id, today))
-        db.commit()
-        return {'current_streak': 1, 'longest_streak': 1, 'last_study_date': today, 'streak_increased': True}
-
-    last_study = streak['last_study_date']
-    current = streak['current_streak']
-    longest = streak['longest_streak']
-    streak_increased = False
-
-    if last_study is None:
-        # First activity ever
-        current = 1
-        streak_increased = True
-    elif last_study == today:
-        # Already studied today, no change
-        pass
-    elif last_study == today - timedelta(days=1):
-        # Studied yesterday, increment streak
-        current += 1
-        streak_increased = True
+    if affected == 1:
+        streak = {'current_streak': 1, 'longest_streak': 1}
     else:
-        # Missed a day (or more), reset streak
-        current = 1
-        streak_increased = True
-
-    # Update longest streak if needed
-    if current > longest:
-        longest = current
-
-    # Save updated streak
-    db.execute('''
-        UPDATE user_streaks
-        SET current_streak = %s, longest_streak = %s, last_study_date = %s
-        WHERE user_id = %s
-    ''', (current, longest, today, user_id))
+        cursor = db.execute('''
+            SELECT current_streak, longest_streak
+            FROM user_streaks WHERE user_id = %s
+        ''', (user_id,))
+        streak = cursor.fetchone()
     db.commit()
+    invalidate_user_streak(user_id)
+    invalidate_user_insights(user_id)
+    _mark_studied_today(user_id, today)
 
     return {
-        'current_streak': current,
-        'longest_streak': longest,
+        'current_streak': streak['current_streak'],
+        'longest_streak': streak['longest_streak'],
         'last_study_date': today,
-        'streak_increased': streak_increased
+        'streak_increased': affected > 0
     }
 
 
@@ -97,41 +151,36 @@ def get_today_stats(user_id):
     db = get_db()
     today = date.today()
 
-    # Get total study time (from study_sessions)
-    cursor = db.execute('''
-        SELECT COALESCE(SUM(duration), 0) as total_minutes
-        FROM study_sessions
-        WHERE user_id = %s AND DATE(created_at) = %s
-    ''', (user_id, today))
-    study_time = cursor.fetchone()
+    day_start, day_end = _day_range(today)
 
-    # Get cards reviewed today
+    # Study time and cards reviewed from one pass over today's study sessions
     cursor = db.execute('''
-        SELECT COUNT(*) as count
+        SELECT COALESCE(SUM(duration), 0) as total_minutes,
+               COUNT(CASE WHEN activity_type = 'flashcards' THEN 1 END) as cards_reviewed
         FROM study_sessions
-        WHERE user_id = %s AND activity_type = 'flashcards' AND DATE(created_at) = %s
-    ''', (user_id, today))
-    cards_reviewed = cursor.fetchone()
+        WHERE user_id = %s AND created_at >= %s AND created_at < %s
+    ''', (user_id, day_start, day_end))
+    study_time = cursor.fetchone()
 
     # Get quizzes taken today
     cursor = db.execute('''
         SELECT COUNT(*) as count
         FROM quiz_attempts
-        WHERE user_id = %s AND DATE(completed_at) = %s
-    ''', (user_id, today))
+        WHERE user_id = %s AND completed_at >= %s AND completed_at < %s
+    ''', (user_id, day_start, day_end))
     quizzes_taken = cursor.fetchone()
 
     # Get pomodoro sessions today
     cursor = db.execute('''
         SELECT COUNT(*) as count, COALESCE(SUM(duration), 0) as total_minutes
         FROM pomodoro_sessions
-        WHERE user_id = %s AND completed = 1 AND session_type = 'work' AND DATE(completed_at) = %s
-    ''', (user_id, today))
+        WHERE user_id = %s AND completed = 1 AND session_type = 'work' AND completed_at >= %s AND completed_at < %s
+    ''', (user_id, day_start, day_end))
     pomodoros = cursor.fetchone()
 
     return {
         'total_minutes': study_time['total_minutes'] if study_time else 0,
-        'cards_reviewed': cards_reviewed['count'] if cards_reviewed else 0,
+        'cards_reviewed': study_time['cards_reviewed'] if study_time else 0,
         'quizzes_taken': quizzes_taken['count'] if quizzes_taken else 0,
         'pomodoro_sessions': pomodoros['count'] if pomodoros else 0,
         'pomodoro_minutes': pomodoros['total_minutes'] if pomodoros else 0
@@ -140,36 +189,29 @@ def get_today_stats(user_id):
 
 def has_studied_today(user_id):
     """Check if user has done any study activity today."""
-    db = get_db()
     today = date.today()
+    with studied_today_cache_lock:
+        if studied_today_cache.get((int(user_id), today)):
+            return True
 
-    # Check study_sessions
-    cursor = db.execute('''
-        SELECT 1 FROM study_sessions
-        WHERE user_id = %s AND DATE(created_at) = %s
-        LIMIT 1
-    ''', (user_id, today))
-    if cursor.fetchone():
-        return True
-
-    # Check quiz_attempts
-    cursor = db.execute('''
-        SELECT 1 FROM quiz_attempts
-        WHERE user_id = %s AND DATE(completed_at) = %s
-        LIMIT 1
-    ''', (user_id, today))
-    if cursor.fetchone():
-        return True
+    db = get_db()
+    day_start, day_end = _day_range(today)
 
-    # Check pomodoro sessions
+    # One round-trip; OR stops at the first source with activity today
     cursor = db.execute('''
-        SELECT 1 FROM pomodoro_sessions
-        WHERE user_id = %s AND completed = 1 AND DATE(completed_at) = %s
-        LIMIT 1
-    ''', (user_id, today))
-    if cursor.fetchone():
+        SELECT (
+            EXISTS(SELECT 1 FROM study_sessions
+                   WHERE user_id = %s AND created_at >= %s AND created_at < %s)
+            OR EXISTS(SELECT 1 FROM quiz_attempts
+                      WHERE user_id = %s AND completed_at >= %s AND completed_at < %s)
+            OR EXISTS(SELECT 1 FROM pomodoro_sessions
+                      WHERE user_id = %s AND completed = 1 AND completed_at >= %s AND completed_at < %s)
+        ) as studied
+    ''', (user_id, day_start, day_end) * 3)
+    row = cursor.fetchone()
+    if row and row['studied']:
+        _mark_studied_today(user_id, today)
         return True
-
     return False
 
 
@@ -178,28 +220,25 @@ def get_weekly_activity(user_id):
     db = get_db()
     today = date.today()
     week_ago = today - timedelta(days=6)
+    week_start = _day_range(week_ago)[0]
 
-    # Get days with activity
+    # Activity per day across study sessions and quiz attempts, in one query
     cursor = db.execute('''
-        SELECT DATE(created_at) as study_date, COUNT(*) as activities
-        FROM study_sessions
-        WHERE user_id = %s AND DATE(created_at) >= %s
-        GROUP BY DATE(created_at)
-    ''', (user_id, week_ago))
-    study_days = {row['study_date']: row['activities'] for row in cursor.fetchall()}
-
-    # Add quiz attempts
-    cursor = db.execute('''
-        SELECT DATE(completed_at) as study_date, COUNT(*) as activities
-        FROM quiz_attempts
-        WHERE user_id = %s AND DATE(completed_at) >= %s
-        GROUP BY DATE(completed_at)
-    ''', (user_id, week_ago))
-    for row in cursor.fetchall():
-        if row['study_date'] in study_days:
-            study_days[row['study_date']] += row['activities']
-        else:
-            study_days[row['study_date']] = row['activities']
+        SELECT study_date, SUM(activities) as activities
+        FROM (
+            SELECT DATE(created_at) as study_date, COUNT(*) as activities
+            FROM study_sessions
+            WHERE user_id = %s AND created_at >= %s
+            GROUP BY DATE(created_at)
+            UNION ALL
+            SELECT DATE(completed_at) as study_date, COUNT(*) as activities
+            FROM quiz_attempts
+            WHERE user_id = %s AND completed_at >= %s
+            GROUP BY DATE(completed_at)
+        ) activity
+        GROUP BY study_date
+    ''', (user_id, week_start, user_id, week_start))
+    study_days = {row['study_date']: int(row['activities']) for row in cursor.fetchall()}
 
     # Build the 7-day array
     days = []
@@ -207,7 +246,7 @@ def get_weekly_activity(user_id):
         day = today - timedelta(days=i)
         days.append({
             'date': day.isoformat(),
-            'day_name': day.strftime('%a'),
+            'day_name': _DAY_NAMES[day.weekday()],
             'has_activity': day in study_days,
             'activity_count': study_days.get(day, 0)
         })
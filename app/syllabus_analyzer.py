@@ -1,17 +1,57 @@
+import io
 import os
-import json
-from datetime import datetime
+import re
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 from groq import Groq
 from PyPDF2 import PdfReader
 from docx import Document
-
-
-def extract_text_from_file(filepath):
-    """Extract text content from PDF, DOCX, or TXT files."""
+import orjson
+from app.db_connect import transaction
+from app.services.llm_cache import cache_key
+
+# Page-range workers for uncapped PDF text extraction (zlib inflate of
+# content streams runs without the GIL)
+PDF_EXTRACT_WORKERS = 4
+pdf_executor = ThreadPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, thread_name_prefix='pdf')
+
+# Most syllabus text sent to Groq (context limit); PDFs stop parsing past it
+SYLLABUS_MAX_CHARS = 15000
+
+# Groq clients per API key, reused so their HTTP connection pools stay warm
+_groq_clients = {}
+_groq_clients_lock = threading.Lock()
+
+
+def _get_groq_client(api_key):
+    """Get (creating once) the Groq client for an API key."""
+    with _groq_clients_lock:
+        client = _groq_clients.get(api_key)
+        if client is None:
+            client = _groq_clients[api_key] = Groq(api_key=api_key)
+        return client
+
+
+@atexit.register
+def _close_groq_clients():
+    """Close pooled Groq clients on interpreter shutdown."""
+    with _groq_clients_lock:
+        for client in _groq_clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _groq_clients.clear()
+
+
+def extract_text_from_file(filepath, max_chars=None):
+    """Extract text content from PDF, DOCX, or TXT files (PDFs stop parsing at max_chars)."""
     ext = filepath.rsplit('.', 1)[1].lower() if '.' in filepath else ''
 
     if ext == 'pdf':
-        return extract_text_from_pdf(filepath)
+        return extract_text_from_pdf(filepath, max_chars)
     elif ext == 'docx':
         return extract_text_from_docx(filepath)
     elif ext in ('txt', 'doc'):
@@ -20,14 +60,55 @@ def extract_text_from_file(filepath):
         return None
 
 
-def extract_text_from_pdf(filepath):
-    """Extract text from PDF file."""
+def _extract_pdf_pages(data, start, stop):
+    """Extract the text of pages [start, stop) with a reader of its own."""
+    # PdfReader resolves objects lazily from a shared stream, so threads
+    # can't share one reader
+    reader = PdfReader(io.BytesIO(data))
+    return "".join(reader.pages[i].extract_text() or "" for i in range(start, stop))
+
+
+def extract_text_from_pdf(filepath, max_chars=None):
+    """
+    Extract text from PDF file.
+
+    Args:
+        filepath: Path to the PDF
+        max_chars: Stop parsing pages once this much text is extracted
+            (None parses every page, split across pdf_executor)
+
+    Returns:
+        str: Page text in page order, cut to max_chars; None on error
+    """
     try:
-        reader = PdfReader(filepath)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text
+        if max_chars is not None:
+            # Capped: one reader, page by page, stopping at the cap (a typical
+            # syllabus gets there within its first few pages)
+            parts = []
+            total = 0
+            for page in PdfReader(filepath).pages:
+                part = page.extract_text() or ""
+                parts.append(part)
+                total += len(part)
+                if total >= max_chars:
+                    break
+            return "".join(parts)[:max_chars]
+
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        page_count = len(PdfReader(io.BytesIO(data)).pages)
+
+        workers = min(PDF_EXTRACT_WORKERS, page_count)
+        if workers <= 1:
+            return _extract_pdf_pages(data, 0, page_count)
+
+        # Contiguous page ranges, one per worker, joined back in page order
+        step = -(-page_count // workers)
+        parts = pdf_executor.map(
+            lambda start: _extract_pdf_pages(data, start, min(start + step, page_count)),
+            range(0, page_count, step)
+        )
+        return "".join(parts)
     except Exception as e:
         print(f"Error extracting PDF text: {e}")
         return None
@@ -54,24 +135,76 @@ def extract_text_from_txt(filepath):
         return None
 
 
-def analyze_syllabus_with_groq(text, api_key):
-    """Use Groq API to analyze syllabus text and extract assignments/events."""
-    if not api_key:
-        return None, "No API key provided"
-
-    if not text or len(text.strip()) < 50:
-        return None, "Syllabus text is too short to analyze"
-
-    # Truncate if too long (Groq has context limits)
-    max_chars = 15000
-    if len(text) > max_chars:
-        text = text[:max_chars]
-
-    client = Groq(api_key=api_key)
-
-    current_year = datetime.now().year
-
-    prompt = f"""Analyze this course syllabus and extract all assignments, exams, quizzes, and important dates.
+# "Homework 3 - due 2024-10-14 (20 pts)" / "Midterm Exam: Oct 14, 2024" lines
+_DATED_LINE_RE = re.compile(
+    r'^\s*(?:[-*\u2022]\s*)?(?P<title>.+?)\s*[:\u2013\u2014-]\s*(?:due\s+(?:on\s+|by\s+)?)?'
+    r'(?P<date>\d{4}-\d{2}-\d{2}|[A-Za-z]{3,9}\.?\s+\d{1,2},?\s+\d{4})'
+    r'(?:\s*\(\s*(?P<points>\d+)\s*(?:pts?|points)\s*\))?\s*$',
+    re.IGNORECASE
+)
+# Only lines naming graded work are parsed locally; anything else (office
+# hours, holidays, ...) is left for the model to classify
+_ASSIGNMENT_WORD_RE = re.compile(
+    r'\b(?:homework|hw|assignment|project|paper|essay|quiz|exam|midterm|final|lab|problem set|report)\b',
+    re.IGNORECASE
+)
+
+
+def _parse_line_date(value):
+    """Parse an ISO or 'Month D, YYYY' date to YYYY-MM-DD, or None."""
+    if value[0].isdigit():
+        return _clean_date(value)
+    value = value.replace('.', '').replace(',', '')
+    for fmt in ('%B %d %Y', '%b %d %Y'):
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _extract_dated_assignments(text):
+    """
+    Pull unambiguous one-line dated assignments out of syllabus text.
+
+    Args:
+        text: Extracted syllabus text
+
+    Returns:
+        tuple: (assignments found locally, remaining text for the model)
+    """
+    assignments = []
+    residual = []
+    for line in text.splitlines():
+        match = _DATED_LINE_RE.match(line)
+        due_date = match and _ASSIGNMENT_WORD_RE.search(match['title']) and _parse_line_date(match['date'])
+        if not due_date:
+            residual.append(line)
+            continue
+        assignments.append({
+            'title': match['title'].strip(),
+            'description': None,
+            'due_date': due_date,
+            'points': int(match['points']) if match['points'] else None,
+        })
+    return assignments, "\n".join(residual)
+
+
+def _merge_assignments(local, extracted):
+    """Combine locally parsed and model-extracted assignments, dropping duplicates."""
+    merged = []
+    seen = set()
+    for assignment in [*local, *(extracted or [])]:
+        if not isinstance(assignment, dict):
+            continue
+        key = (str(assignment.get('title') or '').strip().casefold(), assignment.get('due_date'))
+        if key not in seen:
+            seen.add(key)
+            merged.append(assignment)
+    return merged
+
+
+SYLLABUS_PROMPT = """Analyze this course syllabus and extract all assignments, exams, quizzes, and important dates.
 
 Return a JSON object with two arrays:
 1. "assignments" - for homework, projects, papers, quizzes, exams
@@ -80,14 +213,14 @@ Return a JSON object with two arrays:
 For each assignment, include:
 - "title": name of the assignment
 - "description": brief description (optional)
-- "due_date": date in YYYY-MM-DD format (use {current_year} or {current_year + 1} for reasonable dates, null if not specified)
+- "due_date": date in YYYY-MM-DD format (use {year} or {next_year} for reasonable dates, null if not specified)
 - "points": point value if mentioned (null if not specified)
 - "type": one of "homework", "quiz", "exam", "project", "paper", "other"
 
 For each calendar event, include:
 - "title": name of the event
 - "description": brief description (optional)
-- "event_date": date in YYYY-MM-DD format (use {current_year} or {current_year + 1}, null if not specified)
+- "event_date": date in YYYY-MM-DD format (use {year} or {next_year}, null if not specified)
 - "event_type": one of "exam", "holiday", "deadline", "class", "other"
 
 Only include items you can clearly identify from the syllabus. If no dates are found, still include the items with null dates.
@@ -97,6 +230,31 @@ SYLLABUS TEXT:
 
 Respond with ONLY valid JSON, no other text or markdown."""
 
+
+def analyze_syllabus_with_groq(text, api_key):
+    """Use Groq API to analyze syllabus text and extract assignments/events."""
+    if not api_key:
+        return None, "No API key provided"
+
+    if not text or len(text.strip()) < 50:
+        return None, "Syllabus text is too short to analyze"
+
+    # Obvious dated assignment lines are parsed locally; only the rest of the
+    # syllabus is sent to the model, and not at all if little else remains
+    local_assignments, text = _extract_dated_assignments(text)
+    if len(text.strip()) < 50:
+        return {'assignments': local_assignments, 'calendar_events': []}, None
+
+    # Truncate if too long (Groq has context limits)
+    if len(text) > SYLLABUS_MAX_CHARS:
+        text = text[:SYLLABUS_MAX_CHARS]
+
+    client = _get_groq_client(api_key)
+
+    current_year = datetime.now().year
+
+    prompt = SYLLABUS_PROMPT.format(year=current_year, next_year=current_year + 1, text=text)
+
     try:
         chat_completion = client.chat.completions.create(
             messages=[
@@ -104,88 +262,142 @@ Respond with ONLY valid JSON, no other text or markdown."""
             ],
             model="llama-3.3-70b-versatile",
             temperature=0.1,
-            max_tokens=4096
+            max_tokens=4096,
+            # JSON mode: the reply is always a bare JSON object, never fenced
+            response_format={"type": "json_object"}
         )
 
-        response_text = chat_completion.choices[0].message.content.strip()
-
-        # Handle potential markdown code blocks
-        if response_text.startswith("```"):
-            lines = response_text.split("\n")
-            # Remove first and last lines (```json and ```)
-            response_text = "\n".join(lines[1:-1] if lines[-1] == "```" else lines[1:])
-
-        data = json.loads(response_text)
+        data = orjson.loads(chat_completion.choices[0].message.content)
+        data['assignments'] = _merge_assignments(local_assignments, data.get('assignments'))
         return data, None
 
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         return None, f"Failed to parse response as JSON: {e}"
     except Exception as e:
         return None, f"Groq API error: {e}"
 
 
-def save_analysis_to_db(db, class_id, analysis_data):
-    """Save extracted assignments and events to database."""
-    assignments_added = 0
-    events_added = 0
+def _clean_date(value):
+    """Return a YYYY-MM-DD string the DATE column accepts, or None."""
+    if not isinstance(value, str):
+        return None
+    try:
+        return date.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        return None
 
-    # Save assignments
-    for assignment in analysis_data.get('assignments', []):
-        try:
-            db.execute(
-                '''INSERT INTO assignments (class_id, title, description, due_date, points, status)
-                   VALUES (%s, %s, %s, %s, %s, 'pending')''',
-                (
-                    class_id,
-                    assignment.get('title', 'Untitled'),
-                    assignment.get('description'),
-                    assignment.get('due_date'),
-                    assignment.get('points')
-                )
-            )
-            assignments_added += 1
-        except Exception as e:
-            print(f"Error saving assignment: {e}")
 
-    # Save calendar events
-    for event in analysis_data.get('calendar_events', []):
-        try:
-            db.execute(
-                '''INSERT INTO calendar_events (class_id, title, description, event_date, event_type)
-                   VALUES (%s, %s, %s, %s, %s)''',
-                (
-                    class_id,
-                    event.get('title', 'Untitled'),
-                    event.get('description'),
-                    event.get('event_date'),
-                    event.get('event_type', 'other')
-                )
-            )
-            events_added += 1
-        except Exception as e:
-            print(f"Error saving event: {e}")
+def _clean_points(value):
+    """Return an integer point value, or None if the model gave something else."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
 
-    db.commit()
-    return assignments_added, events_added
+
+def _clean_description(value):
+    """Return a description string for the TEXT column, or None."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(str(item) for item in value)
+    return str(value)
+
+
+def save_analysis_to_db(db, class_id, analysis_data):
+    """Save extracted assignments and events to database (the caller commits)."""
+    # Validate everything up front so one malformed item can't fail a batch
+    assignment_rows = [
+        (
+            class_id,
+            str(assignment.get('title') or 'Untitled')[:255],
+            _clean_description(assignment.get('description')),
+            _clean_date(assignment.get('due_date')),
+            _clean_points(assignment.get('points'))
+        )
+        for assignment in analysis_data.get('assignments') or []
+        if isinstance(assignment, dict)
+    ]
+    event_rows = [
+        (
+            class_id,
+            str(event.get('title') or 'Untitled')[:255],
+            _clean_description(event.get('description')),
+            _clean_date(event.get('event_date')),
+            str(event.get('event_type') or 'other')[:50]
+        )
+        for event in analysis_data.get('calendar_events') or []
+        if isinstance(event, dict)
+    ]
+
+    if assignment_rows:
+        db.executemany(
+            '''INSERT INTO assignments (class_id, title, description, due_date, points, status)
+               VALUES (%s, %s, %s, %s, %s, 'pending')''',
+            assignment_rows
+        )
+    if event_rows:
+        db.executemany(
+            '''INSERT INTO calendar_events (class_id, title, description, event_date, event_type)
+               VALUES (%s, %s, %s, %s, %s)''',
+            event_rows
+        )
+
+    return len(assignment_rows), len(event_rows)
 
 
 def analyze_and_save(filepath, class_id, db, api_key):
     """Main function to extract, analyze, and save syllabus data."""
     # Extract text
-    text = extract_text_from_file(filepath)
+    text = extract_text_from_file(filepath, SYLLABUS_MAX_CHARS)
     if not text:
         return False, "Could not extract text from file"
 
-    # Analyze with Groq
-    analysis_data, error = analyze_syllabus_with_groq(text, api_key)
-    if error:
-        return False, error
+    # Reuse the analysis of identical text; the year is part of the key since
+    # the prompt uses it to complete dates
+    content_hash = cache_key(text, datetime.now().year)
+    cursor = db.execute(
+        'SELECT analysis_json FROM syllabus_analysis_cache WHERE content_hash = %s',
+        (content_hash,)
+    )
+    cached = cursor.fetchone()
+    analysis_data = None
+    if cached:
+        try:
+            analysis_data = orjson.loads(cached['analysis_json'])
+        except orjson.JSONDecodeError:
+            pass  # Unreadable cache row: analyze again and overwrite it
+        if not isinstance(analysis_data, dict):
+            analysis_data = None
+
+    from_cache = analysis_data is not None
+    if not from_cache:
+        # Analyze with Groq
+        analysis_data, error = analyze_syllabus_with_groq(text, api_key)
+        if error:
+            return False, error
+
+    # Cache write, clear and re-insert commit together, so the class never
+    # shows an empty or half-replaced schedule
+    try:
+        with transaction(db):
+            if not from_cache:
+                db.execute(
+                    '''INSERT INTO syllabus_analysis_cache (content_hash, analysis_json) VALUES (%s, %s)
+                       ON DUPLICATE KEY UPDATE analysis_json = VALUES(analysis_json)''',
+                    (content_hash, orjson.dumps(analysis_data).decode())
+                )
 
-    # Clear existing assignments/events for this class (re-analysis)
-    db.execute('DELETE FROM assignments WHERE class_id = %s', (class_id,))
-    db.execute('DELETE FROM calendar_events WHERE class_id = %s', (class_id,))
+            # Clear existing assignments/events for this class (re-analysis)
+            db.execute('DELETE FROM assignments WHERE class_id = %s', (class_id,))
+            db.execute('DELETE FROM calendar_events WHERE class_id = %s', (class_id,))
 
-    # Save to database
-    assignments_added, events_added = save_analysis_to_db(db, class_id, analysis_data)
+            # Save to database
+            assignments_added, events_added = save_analysis_to_db(db, class_id, analysis_data)
+    except Exception as e:
+        return False, f"Could not save syllabus analysis: {e}"
 
     return True, f"Found {assignments_added} assignments and {events_added} calendar events"